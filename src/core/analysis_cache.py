@@ -0,0 +1,114 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+
+import numpy as np
+
+
+HASH_BLOCK_SIZE = 64 * 1024 * 1024
+ARRAYS = ('moves', 'layer_starts', 'layer_z', 'commands', 'move_times', 'line_ends', 'command_lines')
+STATS_FILE = 'stats.json'
+
+
+class AnalysisCache:
+    """Кэш результатов анализа на диске: индекс строк, MoveArray и статистика задания.
+
+    Запись — каталог <хэш содержимого>-v<версия анализатора> с массивами
+    .npy (читаются через mmap, без копирования) и stats.json. Время
+    движений хранится вместе с ограничениями планировщика, при которых оно
+    посчитано. Время последнего использования — mtime stats.json; при
+    превышении max_bytes удаляются давно не использованные записи.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path, version):
+        """Ключ записи: BLAKE2b содержимого файла и версия анализатора; None для пустого файла"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            if not file.seek(0, 2):
+                return None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                view = memoryview(data)
+                for offset in range(0, len(data), HASH_BLOCK_SIZE):
+                    digest.update(view[offset:offset + HASH_BLOCK_SIZE])
+                view.release()
+        return f"{digest.hexdigest()}-v{version}"
+
+    def load(self, key):
+        """Запись по ключу: {'stats', 'moves', 'layer_starts', ...} с массивами в режиме mmap или None"""
+        entry = os.path.join(self.directory, key)
+        stats_path = os.path.join(entry, STATS_FILE)
+        try:
+            with open(stats_path, 'r', encoding='utf-8') as file:
+                result = {'stats': json.load(file)}
+            for name in ARRAYS:
+                result[name] = np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='r')
+            os.utime(stats_path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading analysis cache {key}: {e}")
+            return None
+        return result
+
+    def store(self, key, job, moves, stats, move_times):
+        entry = os.path.join(self.directory, key)
+        if os.path.exists(entry):
+            return
+        arrays = {'moves': moves.moves, 'layer_starts': moves.layer_starts, 'layer_z': moves.layer_z,
+                  'commands': moves.commands, 'move_times': move_times, 'line_ends': job.line_ends, 'command_lines': job.command_lines}
+        if sum(array.nbytes for array in arrays.values()) > self.max_bytes:
+            return
+        temporary = f"{entry}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(temporary)
+            for name in ARRAYS:
+                np.save(os.path.join(temporary, f"{name}.npy"), arrays[name])
+            # stats.json — последним: запись без него не читается
+            with open(os.path.join(temporary, STATS_FILE), 'w', encoding='utf-8') as file:
+                json.dump(stats, file)
+            os.rename(temporary, entry)
+        except Exception as e:
+            print(f"Error writing analysis cache {key}: {e}")
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Удаление давно не использованных записей, пока кэш больше max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                entry = os.path.join(self.directory, name)
+                try:
+                    used = os.path.getmtime(os.path.join(entry, STATS_FILE))
+                    size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+                except OSError:
+                    continue
+                entries.append((used, name, size))
+                total += size
+
+            for used, name, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                try:
+                    shutil.rmtree(os.path.join(self.directory, name))
+                    total -= size
+                except OSError as e:
+                    # Запись ещё открыта через mmap (Windows) — удалится в следующий раз
+                    print(f"Error evicting analysis cache {name}: {e}")
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,190 @@
+import struct
+import time
+
+
+PACKET_TOKEN = 0xB5AD
+HEADER_FORMAT = '<HBBH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT) + 2
+FOOTER_SIZE = 2
+
+# Протокол 0 — управление потоком, протокол 1 — передача файлов (Marlin BINARY_FILE_TRANSFER)
+PROTOCOL_CONTROL = 0
+PROTOCOL_FILE_TRANSFER = 1
+
+CONTROL_SYNC = 1
+CONTROL_CLOSE = 2
+
+FILE_QUERY = 0
+FILE_OPEN = 1
+FILE_CLOSE = 2
+FILE_WRITE = 3
+FILE_ABORT = 4
+
+DEFAULT_BLOCK_SIZE = 512
+
+
+class BinaryTransferError(Exception):
+    """Сбой двоичной передачи: прошивка не отвечает, отказала в операции или сообщила о фатальной ошибке"""
+
+
+def fletcher16(data, checksum=0):
+    """Контрольная сумма Флетчера-16 в варианте Marlin: (сумма сумм << 8) | сумма, обе по модулю 255"""
+    low = checksum & 0xFF
+    high = (checksum >> 8) & 0xFF
+    for byte in data:
+        low = (low + byte) % 255
+        high = (high + low) % 255
+    return (high << 8) | low
+
+
+def build_packet(sync, protocol, packet_type, payload=b''):
+    """Пакет: маркер, sync, протокол|тип, длина, сумма заголовка; данные и сумма всего пакета, если данные есть"""
+    header = struct.pack(HEADER_FORMAT, PACKET_TOKEN, sync & 0xFF, ((protocol & 0xF) << 4) | (packet_type & 0xF),
+                         len(payload))
+    packet = header + struct.pack('<H', fletcher16(header))
+    if payload:
+        packet += payload
+        packet += struct.pack('<H', fletcher16(packet))
+    return packet
+
+
+def parse_packet(buffer):
+    """Разбор пакета в начале буфера: (sync, протокол, тип, данные, длина пакета) или None, если данных мало.
+
+    ValueError — повреждённый заголовок или данные.
+    """
+    if len(buffer) < HEADER_SIZE:
+        return None
+    token, sync, meta, size = struct.unpack_from(HEADER_FORMAT, buffer)
+    if token != PACKET_TOKEN:
+        raise ValueError("Bad packet token")
+    header_checksum, = struct.unpack_from('<H', buffer, HEADER_SIZE - 2)
+    if header_checksum != fletcher16(buffer[:HEADER_SIZE - 2]):
+        raise ValueError("Header checksum mismatch")
+    if not size:
+        return sync, meta >> 4, meta & 0xF, b'', HEADER_SIZE
+    total = HEADER_SIZE + size + FOOTER_SIZE
+    if len(buffer) < total:
+        return None
+    checksum, = struct.unpack_from('<H', buffer, total - FOOTER_SIZE)
+    if checksum != fletcher16(buffer[:total - FOOTER_SIZE]):
+        raise ValueError("Packet checksum mismatch")
+    return sync, meta >> 4, meta & 0xF, bytes(buffer[HEADER_SIZE:total - FOOTER_SIZE]), total
+
+
+class BinaryFileTransfer:
+    """Сторона хоста протокола двоичной передачи файлов Marlin (M28 B1).
+
+    Пакеты отправляются по одному с ожиданием 'ok<sync>'; 'rs<sync>' и
+    истечение ack_timeout ведут к повтору того же пакета, 'fe' — к ошибке.
+    channel — объект с методами write(bytes) и read_line(timeout) -> str | None.
+    """
+
+    def __init__(self, channel, ack_timeout=1.0, max_retries=10):
+        self.channel = channel
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.sync = 0
+        self.block_size = DEFAULT_BLOCK_SIZE
+        self.version = None
+        self.retries = 0
+
+    def connect(self):
+        """Синхронизация потока: прошивка сообщает номер пакета и размер блока ('ss<sync>,<блок>,<версия>')"""
+        packet = build_packet(0, PROTOCOL_CONTROL, CONTROL_SYNC)
+        for attempt in range(self.max_retries):
+            self.channel.write(packet)
+            deadline = time.monotonic() + self.ack_timeout
+            while True:
+                line = self.channel.read_line(deadline - time.monotonic())
+                if line is None:
+                    break
+                if line.startswith('ss'):
+                    sync, block_size, version = (line[2:].split(',') + ['', ''])[:3]
+                    self.sync = int(sync)
+                    self.block_size = int(block_size) if block_size else DEFAULT_BLOCK_SIZE
+                    self.version = version or None
+                    return self.version
+        raise BinaryTransferError("No response to binary stream sync")
+
+    def _send(self, protocol, packet_type, payload=b'', reply_prefix=None):
+        """Отправка пакета до подтверждения; с reply_prefix — ожидание и возврат строки ответа протокола"""
+        packet = build_packet(self.sync, protocol, packet_type, payload)
+        acknowledged = False
+        reply = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            self.channel.write(packet)
+            deadline = time.monotonic() + self.ack_timeout
+            resend = False
+            while not resend:
+                remaining = deadline - time.monotonic()
+                line = self.channel.read_line(remaining) if remaining > 0 else None
+                if line is None:
+                    break
+                if line == f"ok{self.sync}":
+                    acknowledged = True
+                elif line.startswith('rs'):
+                    resend = True
+                elif line.startswith('fe'):
+                    raise BinaryTransferError(f"Firmware reported a fatal stream error: {line}")
+                elif reply_prefix and line.startswith(reply_prefix):
+                    reply = line
+                if acknowledged and (reply_prefix is None or reply is not None):
+                    self.sync = (self.sync + 1) & 0xFF
+                    return reply
+            if acknowledged:
+                # Пакет принят, но ответ протокола потерян: повтор приведёт к повторной операции
+                raise BinaryTransferError(f"No '{reply_prefix}' reply to packet {self.sync}")
+        raise BinaryTransferError(f"Packet {self.sync} was not acknowledged")
+
+    def query(self):
+        """Версия протокола и поддерживаемое сжатие: 'PFT:version:0.1.0:compression:none'"""
+        return self._send(PROTOCOL_FILE_TRANSFER, FILE_QUERY, reply_prefix='PFT:version:')
+
+    def open(self, name, dummy=False):
+        payload = bytes((1 if dummy else 0, 0)) + name.encode('ascii') + b'\0'
+        reply = self._send(PROTOCOL_FILE_TRANSFER, FILE_OPEN, payload, reply_prefix='PFT:')
+        if reply != 'PFT:success':
+            raise BinaryTransferError(f"Cannot open '{name}' on SD card: {reply}")
+
+    def write(self, data):
+        for offset in range(0, len(data), self.block_size):
+            self._send(PROTOCOL_FILE_TRANSFER, FILE_WRITE, data[offset:offset + self.block_size])
+
+    def close(self):
+        reply = self._send(PROTOCOL_FILE_TRANSFER, FILE_CLOSE, reply_prefix='PFT:')
+        if reply != 'PFT:success':
+            raise BinaryTransferError(f"Cannot close file on SD card: {reply}")
+
+    def abort(self):
+        self._send(PROTOCOL_FILE_TRANSFER, FILE_ABORT, reply_prefix='PFT:')
+
+    def disconnect(self):
+        """Возврат прошивки в текстовый режим"""
+        self.channel.write(build_packet(self.sync, PROTOCOL_CONTROL, CONTROL_CLOSE))
+
+    def upload(self, stream, name, size, progress=None, cancelled=None):
+        """Передача файлового потока блоками; progress(переданные байты) вызывается после каждого блока"""
+        self.open(name)
+        sent = 0
+        try:
+            while True:
+                if cancelled is not None and cancelled():
+                    raise BinaryTransferError("Upload cancelled")
+                block = stream.read(self.block_size)
+                if not block:
+                    break
+                self._send(PROTOCOL_FILE_TRANSFER, FILE_WRITE, block)
+                sent += len(block)
+                if progress is not None:
+                    progress(sent)
+        except Exception:
+            try:
+                self.abort()
+            except BinaryTransferError:
+                pass
+            raise
+        self.close()
+        return sent
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+from core.gcode_tokenizer import command_code
+
+
+IMMEDIATE = 'immediate'
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (IMMEDIATE, INTERACTIVE, BULK)
+
+# Команды аварийного парсера Marlin: обрабатываются прошивкой сразу при приёме, минуя очередь
+IMMEDIATE_COMMANDS = frozenset(('M112', 'M410', 'M108', 'M876'))
+# Аварийная строка пишется, не дожидаясь места в окне, но всё равно занимает место в RX-буфере и
+# очереди команд прошивки (кроме M112, на которую ответа нет). Поэтому окна держат для неё запас:
+# обычные строки занимают не больше max_in_flight - IMMEDIATE_RESERVE_LINES строк и, при подсчёте
+# символов, не больше rx_buffer_size - IMMEDIATE_RESERVE_BYTES байт (самая длинная — 'M876 S1\n').
+# Запас рассчитан на одну аварийную команду за раз; при окне в одну строку его нет
+IMMEDIATE_RESERVE_LINES = 1
+IMMEDIATE_RESERVE_BYTES = 8
+# После M112 прошивка останавливается и не отвечает 'ok'
+NO_ACK_COMMANDS = frozenset(('M112',))
+# Команды, которые прошивка подтверждает только по завершении: нагрев, пауза, ожидание движений, парковка, карта стола
+BLOCKING_COMMANDS = frozenset(('M109', 'M190', 'M191', 'M116', 'M303', 'G4', 'M400', 'G28', 'G29'))
+
+
+def lane_for_command(command, default=INTERACTIVE):
+    if command_code(command) in IMMEDIATE_COMMANDS:
+        return IMMEDIATE
+    return default
+
+
+class LaneLatency:
+    """Задержка от постановки в очередь до записи в порт: последняя, средняя и наихудшая"""
+
+    __slots__ = ('count', 'total', 'worst', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.last = 0.0
+
+    def record(self, latency):
+        self.count += 1
+        self.total += latency
+        self.last = latency
+        if latency > self.worst:
+            self.worst = latency
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'last': self.last,
+            'average': self.total / self.count if self.count else 0.0,
+            'worst': self.worst
+        }
+
+
+class CommandLanes:
+    """Очереди отправки по приоритетам: immediate (аварийные), interactive (ручное управление), bulk (задание)"""
+
+    def __init__(self):
+        self.queues = {lane: deque() for lane in LANES}
+        self.latency = {lane: LaneLatency() for lane in LANES}
+        self.lock = threading.Lock()
+
+    def put(self, lane, command, tag=None, future=None):
+        self.queues[lane].append((command, tag, future, lane, time.monotonic()))
+
+    def pop(self, lanes=LANES):
+        """Следующая команда из самой приоритетной непустой очереди"""
+        for lane in lanes:
+            queue = self.queues[lane]
+            if queue:
+                try:
+                    return queue.popleft()
+                except IndexError:
+                    continue
+        return None
+
+    def has_pending(self, lane):
+        return bool(self.queues[lane])
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def record_written(self, lane, queued_at):
+        latency = time.monotonic() - queued_at
+        with self.lock:
+            self.latency[lane].record(latency)
+        return latency
+
+    def drain(self):
+        """Извлечение всех ожидающих команд (при закрытии соединения)"""
+        items = []
+        for queue in self.queues.values():
+            while queue:
+                items.append(queue.popleft())
+        return items
+
+    def get_stats(self):
+        with self.lock:
+            stats = {lane: self.latency[lane].as_dict() for lane in LANES}
+        for lane in LANES:
+            stats[lane]['queued'] = len(self.queues[lane])
+        return stats
+
+    def reset_stats(self):
+        with self.lock:
+            self.latency = {lane: LaneLatency() for lane in LANES}
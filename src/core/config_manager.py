@@ -20,13 +20,41 @@ class ConfigManager(QObject):
                 "build_volume": {"x": 220, "y": 220, "z": 250},
                 "max_feedrate": {"x": 500, "y": 500, "z": 5, "e": 25},
                 "max_acceleration": {"x": 3000, "y": 3000, "z": 100, "e": 10000},
+                "acceleration": 1000,
+                "travel_acceleration": 1000,
+                "retract_acceleration": 1000,
+                "max_jerk": {"x": 10, "y": 10, "z": 0.3, "e": 5},
+                "junction_deviation": 0.0,
+                "planner_buffer_size": 16,
                 "default_temperatures": {"extruder": 200, "bed": 60}
             },
             "serial": {
                 "port": "AUTO",
                 "baudrate": 115200,
                 "timeout": 1.0,
-                "auto_connect": True
+                "auto_connect": True,
+                "probe_timeout": 1.0,
+                "probe_boot_timeout": 2.5,
+                "max_in_flight": 4,
+                "flow_control": "commands",
+                "rx_buffer_size": 128,
+                "min_in_flight": 1,
+                "adaptive_max_in_flight": 32,
+                "line_numbers": False,
+                "resend_history": 1024,
+                "autoreport": True,
+                "status_interval": 2,
+                "firmware_dialect": "auto",
+                "capture_file": "",
+                "ack_timeout": 10.0,
+                "blocking_timeout": 600.0,
+                "heartbeat_interval": 10.0,
+                "auto_reconnect": True,
+                "reconnect_attempts": 10,
+                "reconnect_max_delay": 30.0,
+                "resume_home_xy": True,
+                "sd_binary_transfer": True,
+                "sd_ack_timeout": 1.0
             },
             "ui": {
                 "theme": "dark",
@@ -39,13 +67,19 @@ class ConfigManager(QObject):
                 "smooth_movement": True,
                 "auto_scroll_console": True,
                 "console_max_lines": 1000,
+                "refresh_rate": 30,
                 "visualization_quality": "high"
             },
             "gcode": {
                 "auto_load_preview": True,
                 "show_toolpath": True,
                 "animation_speed": 1.0,
-                "highlight_current_line": True
+                "highlight_current_line": True,
+                "analysis_processes": 0,
+                "arc_tolerance": 0.01,
+                "cache_enabled": True,
+                "cache_dir": "gcode_cache",
+                "cache_max_mb": 1024
             },
             "calibration": {
                 "bed_leveling_points": 9,
@@ -108,6 +142,11 @@ class ConfigManager(QObject):
         config[keys[-1]] = value
         self.config_changed.emit(path, value)
 
+    def data_path(self, name: str) -> str:
+        """Путь к файлу или каталогу данных приложения рядом с config.json (не зависит от последующей смены
+        рабочего каталога); абсолютный name возвращается как есть"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.config_file)), name)
+
     def get_section(self, section: str) -> Dict[str, Any]:
         return self.config_data.get(section, {})
 
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+
+class EventLoopThread:
+    """Общий цикл событий asyncio в фоновом потоке: один поток обслуживает все соединения с принтерами"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='printer-io', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self.thread
+
+    def run(self, coroutine):
+        """Запуск корутины в цикле; возвращает concurrent.futures.Future для ожидания из любого потока"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
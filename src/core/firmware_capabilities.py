@@ -0,0 +1,47 @@
+import re
+
+
+FIELD_PATTERN = re.compile(r'([A-Z_]+):(.*?)(?=\s+[A-Z_]+:|$)')
+CAP_PATTERN = re.compile(r'^Cap:([A-Z0-9_]+):\s*([01])', re.IGNORECASE)
+
+AUTOREPORT_TEMP = 'AUTOREPORT_TEMP'
+AUTOREPORT_POS = 'AUTOREPORT_POS'
+AUTOREPORT_SD_STATUS = 'AUTOREPORT_SD_STATUS'
+EMERGENCY_PARSER = 'EMERGENCY_PARSER'
+
+
+class FirmwareInfo:
+    """Ответ на M115: поля строки FIRMWARE_NAME и флаги возможностей из строк 'Cap:'"""
+
+    def __init__(self, fields=None, capabilities=None):
+        self.fields = fields or {}
+        self.capabilities = capabilities or {}
+
+    @property
+    def name(self):
+        return self.fields.get('FIRMWARE_NAME', '')
+
+    def supports(self, capability):
+        return self.capabilities.get(capability.upper(), False)
+
+    def __repr__(self):
+        enabled = sorted(name for name, value in self.capabilities.items() if value)
+        return f"FirmwareInfo({self.name!r}, {enabled})"
+
+
+def parse_firmware_info(lines):
+    """Разбор строк ответа M115; прошивки без строк 'Cap:' дают пустой набор возможностей"""
+    info = FirmwareInfo()
+    for line in lines:
+        line = line.strip()
+        if line.lower().startswith('ok'):
+            line = line[2:].strip()
+
+        match = CAP_PATTERN.match(line)
+        if match:
+            info.capabilities[match.group(1).upper()] = match.group(2) == '1'
+        elif 'FIRMWARE_NAME:' in line:
+            line = line[line.index('FIRMWARE_NAME:'):]
+            for key, value in FIELD_PATTERN.findall(line):
+                info.fields[key] = value.strip()
+    return info
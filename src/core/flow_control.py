@@ -0,0 +1,386 @@
+import math
+import threading
+import time
+from collections import deque
+
+from core.command_lanes import IMMEDIATE_RESERVE_BYTES, IMMEDIATE_RESERVE_LINES
+
+
+class InFlightCommand:
+    """Команда, отправленная в прошивку и ожидающая подтверждения 'ok'"""
+
+    __slots__ = ('command', 'size', 'tag', 'line_number', 'future', 'reply', 'sent_at')
+
+    MAX_REPLY_LINES = 256
+
+    def __init__(self, command, size, tag=None, line_number=None, future=None):
+        self.command = command
+        self.size = size
+        self.tag = tag
+        self.line_number = line_number
+        self.future = future
+        self.reply = []
+        self.sent_at = time.monotonic()
+
+    def add_reply_line(self, line):
+        if self.future is not None and len(self.reply) < self.MAX_REPLY_LINES:
+            self.reply.append(line)
+
+    def complete(self, ok_line):
+        """Завершение future полным многострочным ответом, включая строку 'ok'"""
+        if self.future is not None and not self.future.done():
+            self.reply.append(ok_line)
+            self.future.set_result(self.reply)
+
+    def fail(self, exception):
+        if self.future is not None and not self.future.done():
+            self.future.set_exception(exception)
+
+
+class CommandWindow:
+    """Скользящее окно команд: не более max_in_flight неподтверждённых строк (BUFSIZE прошивки),
+    из них последняя — запас под аварийную команду (IMMEDIATE_RESERVE_LINES)"""
+
+    RATE_WINDOW = 2.0
+
+    def __init__(self, max_in_flight=4):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.ack_times = deque()
+        self.ack_listeners = []
+        self.total_acknowledged = 0
+        self.bytes_in_flight = 0
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    def line_limit(self, immediate=False):
+        """Предел строк в пути: для обычных строк — без запаса под аварийную команду (IMMEDIATE_RESERVE_LINES)"""
+        if immediate:
+            return self.max_in_flight
+        return max(1, self.max_in_flight - IMMEDIATE_RESERVE_LINES)
+
+    def has_room(self, size=0, immediate=False):
+        return len(self.pending) < self.line_limit(immediate)
+
+    def is_full(self):
+        return not self.has_room()
+
+    def set_max_in_flight(self, max_in_flight):
+        with self.condition:
+            self.max_in_flight = max(1, int(max_in_flight))
+            self.condition.notify_all()
+
+    def wait_for_room(self, size=0, timeout=None):
+        """Ожидание свободного места в окне для строки размером size байт"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.has_room(size), timeout)
+
+    def wait_until(self, predicate, timeout=None):
+        """Ожидание произвольного условия, пересчитываемого при каждом изменении окна"""
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+    def on_sent(self, command, size, tag=None, line_number=None, future=None):
+        with self.condition:
+            entry = InFlightCommand(command, size, tag, line_number, future)
+            self.pending.append(entry)
+            self.bytes_in_flight += size
+            self.condition.notify_all()
+            return entry
+
+    def add_reply_line(self, line):
+        """Строка ответа без 'ok' относится к самой старой неподтверждённой команде"""
+        with self.condition:
+            if self.pending:
+                self.pending[0].add_reply_line(line)
+
+    def on_ack(self, ok_line='ok'):
+        """Обработка 'ok': освобождение самой старой команды окна"""
+        with self.condition:
+            if not self.pending:
+                return None
+            entry = self.pending.popleft()
+            self.bytes_in_flight -= entry.size
+            now = time.monotonic()
+            self.ack_times.append(now)
+            self._trim_ack_times(now)
+            self.total_acknowledged += 1
+            self.condition.notify_all()
+
+        entry.complete(ok_line)
+        for listener in list(self.ack_listeners):
+            try:
+                listener(entry)
+            except Exception as e:
+                print(f"Ack listener error: {e}")
+        return entry
+
+    def on_firmware_signal(self, kind):
+        """Сигнал прошивки о состоянии буферов: 'busy', 'wait', 'resend' или 'timeout'"""
+
+    def has_line(self, line_number):
+        with self.condition:
+            return any(entry.line_number == line_number for entry in self.pending)
+
+    def oldest_command(self):
+        """Текст самой старой неподтверждённой команды или None"""
+        with self.condition:
+            return self.pending[0].command if self.pending else None
+
+    def first_line_number(self):
+        """Наименьший номер строки среди неподтверждённых или None"""
+        with self.condition:
+            numbers = [entry.line_number for entry in self.pending if entry.line_number is not None]
+            return min(numbers) if numbers else None
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def discard_from(self, line_number):
+        """Удаление из окна строк с номером >= line_number, отброшенных прошивкой перед Resend"""
+        with self.condition:
+            kept = deque(entry for entry in self.pending
+                         if entry.line_number is None or entry.line_number < line_number)
+            discarded = len(self.pending) - len(kept)
+            self.pending = kept
+            self.bytes_in_flight = sum(entry.size for entry in kept)
+            self.condition.notify_all()
+            return discarded
+
+    def reset(self):
+        with self.condition:
+            for entry in self.pending:
+                entry.fail(ConnectionError("Connection closed before acknowledgement"))
+            self.pending.clear()
+            self.bytes_in_flight = 0
+            self.ack_times.clear()
+            self.condition.notify_all()
+
+    def add_ack_listener(self, listener):
+        if listener not in self.ack_listeners:
+            self.ack_listeners.append(listener)
+
+    def remove_ack_listener(self, listener):
+        if listener in self.ack_listeners:
+            self.ack_listeners.remove(listener)
+
+    def commands_per_second(self):
+        with self.condition:
+            now = time.monotonic()
+            self._trim_ack_times(now)
+            if len(self.ack_times) < 2:
+                return 0.0
+            elapsed = now - self.ack_times[0]
+            return len(self.ack_times) / elapsed if elapsed > 0 else 0.0
+
+    def get_stats(self):
+        return {
+            'commands_per_second': self.commands_per_second(),
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'bytes_in_flight': self.bytes_in_flight,
+            'total_acknowledged': self.total_acknowledged
+        }
+
+    def _trim_ack_times(self, now):
+        limit = now - self.RATE_WINDOW
+        while self.ack_times and self.ack_times[0] < limit:
+            self.ack_times.popleft()
+
+
+class CharacterWindow(CommandWindow):
+    """Подсчёт символов в стиле grbl: строка отправляется, как только помещается в RX-буфер контроллера
+    и число неподтверждённых строк не превышает max_in_flight (очередь команд прошивки)"""
+
+    def __init__(self, rx_buffer_size=128, max_in_flight=64):
+        super().__init__(max_in_flight)
+        self.rx_buffer_size = max(1, int(rx_buffer_size))
+
+    def has_room(self, size=0, immediate=False):
+        if not self.pending:
+            return True
+        if len(self.pending) >= self.line_limit(immediate):
+            return False
+        budget = self.rx_buffer_size if immediate else max(1, self.rx_buffer_size - IMMEDIATE_RESERVE_BYTES)
+        if size <= 0:
+            return self.bytes_in_flight < budget
+        return self.bytes_in_flight + size <= budget
+
+    def set_rx_buffer_size(self, rx_buffer_size):
+        with self.condition:
+            self.rx_buffer_size = max(1, int(rx_buffer_size))
+            self.condition.notify_all()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['rx_buffer_size'] = self.rx_buffer_size
+        return stats
+
+
+class AdaptiveWindow(CommandWindow):
+    """Окно команд, размер которого подбирается по измеренной задержке подтверждений.
+
+    Раунд — столько подтверждений, каков размер окна. По раундам измеряются
+    наибольшая за последние RATE_ROUNDS раундов скорость подтверждений и
+    наименьшая задержка 'ok' (отправка и разбор одной строки, без ожидания места
+    в планировщике). Их произведение — сколько строк должно быть в пути, чтобы
+    прошивка не простаивала; окно держится около GAIN таких значений и растёт
+    не быстрее чем на единицу за раунд, пока оно действительно заполняется.
+    Когда планировщик полон, задержка растёт, а скорость — нет, и окно
+    сжимается. Раз в BASE_PERIOD секунд окно на раунд уменьшается до минимума,
+    чтобы заново измерить наименьшую задержку.
+
+    'busy' уменьшает окно на единицу, Resend (переполнение RX-буфера или
+    помеха) — вдвое, молчание прошивки сбрасывает его до минимума. 'wait'
+    означает, что буфер прошивки опустел, и только учитывается.
+    """
+
+    GAIN = 2.0
+    RATE_ROUNDS = 10
+    BASE_PERIOD = 10.0
+    HISTORY_SIZE = 256
+
+    def __init__(self, max_in_flight=4, min_in_flight=1, limit=32):
+        self.min_in_flight = max(1, int(min_in_flight))
+        self.limit = max(self.min_in_flight, int(limit))
+        super().__init__(max(self.min_in_flight, min(self.limit, int(max_in_flight))))
+        self.history = deque(maxlen=self.HISTORY_SIZE)
+        self.signals = {'busy': 0, 'wait': 0, 'resend': 0, 'timeout': 0}
+        self.rates = deque(maxlen=self.RATE_ROUNDS)
+        self.latency = 0.0
+        self.base_latency = None
+        self.base_measured = time.monotonic()
+        self.probing = None
+        self.target = self.max_in_flight
+        self._reset_round()
+        self._record('initial')
+
+    def _reset_round(self):
+        self.round_started = time.monotonic()
+        self.round_acks = 0
+        self.round_full = False
+        self.round_busy = False
+
+    def on_sent(self, command, size, tag=None, line_number=None, future=None):
+        with self.condition:
+            entry = super().on_sent(command, size, tag, line_number, future)
+            if len(self.pending) >= self.line_limit():
+                self.round_full = True
+            return entry
+
+    def on_ack(self, ok_line='ok'):
+        entry = super().on_ack(ok_line)
+        if entry is not None:
+            with self.condition:
+                self._on_latency(entry, time.monotonic())
+        return entry
+
+    def _on_latency(self, entry, now):
+        latency = now - entry.sent_at
+        self.latency = latency if not self.latency else self.latency * 0.9 + latency * 0.1
+        # Во время замера учитываются только строки, отправленные уже в уменьшенное окно
+        if self.probing is None or entry.sent_at >= self.probing:
+            if self.base_latency is None or latency < self.base_latency:
+                self.base_latency = latency
+
+        self.round_acks += 1
+        if self.round_acks < self.max_in_flight:
+            return
+
+        elapsed = now - self.round_started
+        acks, full, busy = self.round_acks, self.round_full, self.round_busy
+        self._reset_round()
+        if elapsed > 0 and self.probing is None:
+            self.rates.append(acks / elapsed)
+
+        if self.probing is not None:
+            if self.base_latency is None:
+                return
+            self.probing = None
+            self.base_measured = now
+            self._resize(self.target, 'probe')
+            return
+        if now - self.base_measured >= self.BASE_PERIOD:
+            self.probing = now
+            self.target = self.max_in_flight
+            self.base_latency = None
+            self._resize(self.min_in_flight, 'probe')
+            return
+        if busy or not self.rates or self.base_latency is None:
+            return
+
+        target = max(self.min_in_flight, math.ceil(max(self.rates) * self.base_latency * self.GAIN))
+        if target > self.max_in_flight:
+            # Расти есть смысл, только если окно действительно было заполнено
+            if full:
+                self._resize(self.max_in_flight + 1, 'latency')
+        elif target < self.max_in_flight:
+            self._resize(self.max_in_flight - 1, 'latency')
+
+    def on_firmware_signal(self, kind):
+        with self.condition:
+            if kind not in self.signals:
+                return
+            self.signals[kind] += 1
+            if kind == 'busy':
+                if not self.round_busy:
+                    self.round_busy = True
+                    self._resize(self.max_in_flight - 1, kind)
+            elif kind in ('resend', 'timeout'):
+                self._reset_round()
+                self.probing = None
+                self._resize(self.max_in_flight // 2 if kind == 'resend' else self.min_in_flight, kind)
+
+    def _resize(self, size, reason):
+        size = max(self.min_in_flight, min(self.limit, size))
+        if size == self.max_in_flight:
+            return
+        self.max_in_flight = size
+        self._record(reason)
+        self.condition.notify_all()
+
+    def _record(self, reason):
+        self.history.append((time.monotonic(), self.max_in_flight, reason))
+
+    def set_max_in_flight(self, max_in_flight):
+        with self.condition:
+            self._reset_round()
+            self._resize(int(max_in_flight), 'config')
+
+    def set_limits(self, min_in_flight, limit):
+        with self.condition:
+            self.min_in_flight = max(1, int(min_in_flight))
+            self.limit = max(self.min_in_flight, int(limit))
+            self._resize(self.max_in_flight, 'config')
+
+    def get_history(self):
+        """Изменения окна: (время time.monotonic(), размер, причина)"""
+        with self.condition:
+            return list(self.history)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        with self.condition:
+            stats.update({
+                'min_in_flight': self.min_in_flight,
+                'max_in_flight_limit': self.limit,
+                'ack_latency': self.latency,
+                'base_latency': self.base_latency or 0.0,
+                'ack_rate': max(self.rates) if self.rates else 0.0,
+                'window_changes': len(self.history) - 1,
+                'signals': dict(self.signals)
+            })
+        return stats
+
+
+def create_flow_control(mode, max_in_flight=4, rx_buffer_size=128, min_in_flight=1, adaptive_limit=32):
+    """Создание окна по режиму из serial.flow_control: 'commands', 'characters' или 'adaptive'"""
+    if mode == 'characters':
+        return CharacterWindow(rx_buffer_size, max_in_flight)
+    if mode == 'adaptive':
+        return AdaptiveWindow(max_in_flight, min_in_flight, adaptive_limit)
+    return CommandWindow(max_in_flight)
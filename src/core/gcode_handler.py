@@ -1,7 +1,19 @@
-import re
 import time
 import threading
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from core.analysis_cache import AnalysisCache
+from core.command_lanes import BULK
+from core.gcode_job import GCodeJob
+from core.gcode_tokenizer import parse_gcode_line
+from core.move_array import ARC_TOLERANCE, MoveArray, MoveArrayBuilder
+from core.parallel_analysis import PARALLEL_MIN_BYTES, analyze_parallel, default_processes
+from core.print_recovery import build_resume_commands, modal_state_at
+from core.print_time import PlannerLimits, PrintProgress, PrintTimeEstimate, estimate_print_time
+from core.response_dialects import dialect_for_firmware
+from core.response_parser import ResponseParser, ResponseRecord
+from core.sd_card import SDCardManager
+from core.status_reporter import StatusReporter
 
 
 class GCodeHandler(QObject):
@@ -9,7 +21,19 @@ class GCodeHandler(QObject):
     print_status_changed = pyqtSignal(str)
     position_changed = pyqtSignal(float, float, float)
     temperature_changed = pyqtSignal(str, float, float)
-    gcode_loaded = pyqtSignal(list, list)  # path_data, layers_data
+    gcode_loaded = pyqtSignal(object)  # MoveArray; прежние списки — moves.to_path_data(), moves.to_layers_data()
+    load_started = pyqtSignal(object)  # GCodeJob: индекс построен, задание можно печатать до конца анализа
+    load_progress = pyqtSignal(int, int, int, int)  # байт разобрано, размер файла, строк разобрано, всего строк
+    load_finished = pyqtSignal(bool, str)  # анализ завершён полностью; путь к файлу или текст ошибки
+    stream_stats_changed = pyqtSignal(float, int)  # команд/с, команд в буфере прошивки
+    print_time_changed = pyqtSignal(float, float)  # прошло с, осталось с (по оценке времени печати)
+    resume_available = pyqtSignal(int)  # строка задания, с которой можно продолжить после переподключения
+    _position_pending = pyqtSignal()
+    _job_released = pyqtSignal(object)
+
+    STREAM_STATS_INTERVAL = 0.5
+    LOAD_PROGRESS_INTERVAL = 0.25
+    PRINT_TIME_INTERVAL = 1.0
 
     def __init__(self, serial_comm):
         super().__init__()
@@ -20,9 +44,16 @@ class GCodeHandler(QObject):
         self.is_printing = False
         self.is_paused = False
         self.print_thread = None
-        self.gcode_commands = []
+        self.gcode_commands = GCodeJob()
         self.current_line = 0
+        self.acknowledged_line = 0
         self.total_lines = 0
+        self.last_progress = -1
+        self.resume_line = None
+        self.print_tracker = None
+        self.last_time_report = 0.0
+        self.position_scheduled = False
+        self._position_pending.connect(self._schedule_position_report)
 
         self.temperatures = {
             'extruder': {'current': 0.0, 'target': 0.0},
@@ -30,70 +61,200 @@ class GCodeHandler(QObject):
         }
 
         self.gcode_analyzer = GCodeAnalyzer()
-
-        self.status_timer = QTimer()
-        self.status_timer.timeout.connect(self.request_status)
-        self.status_timer.start(2000)
+        self.analyzed_job = None
+        self.loaded_job = None
+        self.loading_jobs = set()
+        self.load_thread = None
+        self.load_cancel = threading.Event()
+        self.load_generation = 0
+        self.load_started.connect(self._on_load_started)
+        self._job_released.connect(self._release_job)
+
+        self.status_reporter = None
+        self.sd_card = None
+        self.response_parser = ResponseParser()
+        self.response_record = ResponseRecord()
 
         if self.serial_comm:
-            self.serial_comm.data_received.connect(self.parse_response)
+            self.response_parser = self.serial_comm.response_router.parser
+            self.status_reporter = StatusReporter(self.serial_comm, lambda: self.is_printing)
+            self.status_reporter.firmware_detected.connect(self._on_firmware_detected)
+            self.sd_card = SDCardManager(self.serial_comm, self.status_reporter)
+            for kind in ('temperature', 'position', 'error'):
+                self.serial_comm.add_response_listener(kind, self.parse_response)
+            self.serial_comm.reconnected.connect(self._on_reconnected)
 
     def load_gcode_file(self, filename):
+        """Задание из файла: mmap и индекс строк, строки разбираются при отправке или показе"""
         try:
-            with open(filename, 'r') as file:
-                lines = file.readlines()
-
-            commands = []
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line and not line.startswith(';'):
-                    commands.append({
-                        'line_number': i + 1,
-                        'original': line,
-                        'command': self.parse_gcode_line(line)
-                    })
+            job = GCodeJob.open(filename)
 
-            analysis_result = self.gcode_analyzer.analyze_gcode(lines)
+            analysis_result = self.gcode_analyzer.analyze_gcode(job.iter_lines())
 
-            self.gcode_loaded.emit(analysis_result['path_data'], analysis_result['layers_data'])
+            self.gcode_loaded.emit(analysis_result['moves'])
 
-            return commands
+            return job
+        except Exception as e:
+            print(f"Error loading G-code file: {e}")
+            return GCodeJob()
+
+    @property
+    def is_loading(self):
+        return self.load_thread is not None and self.load_thread.is_alive()
+
+    def load_gcode_file_async(self, filename):
+        """Загрузка в фоне: load_started с заданием сразу после индексации, затем load_progress
+        и промежуточные gcode_loaded по мере анализа слоёв, в конце load_finished.
+        Предыдущая незавершённая загрузка отменяется без ожидания: её поток завершается сам,
+        а результаты устаревшего поколения отбрасываются.
+        """
+        self.cancel_loading()
+        self.load_cancel = threading.Event()
+        self.load_generation += 1
+        self.load_thread = threading.Thread(target=self._load_worker,
+                                            args=(filename, self.load_generation, self.load_cancel), daemon=True)
+        self.load_thread.start()
+
+    def cancel_loading(self):
+        self.load_cancel.set()
+
+    def _analysis_cache(self):
+        get_config = self.serial_comm.get_config if self.serial_comm else lambda path, default: default
+        if not get_config('gcode.cache_enabled', True):
+            return None
+        cache_dir = get_config('gcode.cache_dir', 'gcode_cache')
+        config_manager = self.serial_comm.config_manager if self.serial_comm else None
+        if config_manager:
+            # Относительный путь — рядом с config.json, а не в текущем каталоге (абсолютный не меняется)
+            cache_dir = config_manager.data_path(cache_dir)
+        return AnalysisCache(cache_dir, get_config('gcode.cache_max_mb', 1024) * 1024 * 1024)
+
+    def _load_worker(self, filename, generation, cancel):
+        job = None
+        try:
+            job = self._load_job(filename, generation, cancel)
+        finally:
+            if job is not None:
+                self.loading_jobs.discard(job)
+                self._job_released.emit(job)
+
+    def _load_job(self, filename, generation, cancel):
+        """Тело фоновой загрузки; возвращает открытое задание, чтобы поток освободил его по завершении"""
+        get_config = self.serial_comm.get_config if self.serial_comm else lambda path, default: default
+        limits = PlannerLimits.from_config(get_config)
+        analyzer = GCodeAnalyzer(limits, get_config('gcode.arc_tolerance', ARC_TOLERANCE))
+        cache = self._analysis_cache()
+        try:
+            key = cache.key(filename, analyzer.cache_version()) if cache else None
+            cached = cache.load(key) if key else None
+            job = GCodeJob.open(filename, (cached['line_ends'], cached['command_lines']) if cached else None)
         except Exception as e:
             print(f"Error loading G-code file: {e}")
-            return []
+            if generation == self.load_generation:
+                self.load_finished.emit(False, str(e))
+            return None
+        self.loading_jobs.add(job)
+        if generation != self.load_generation:
+            return job
+        self.load_started.emit(job)
+
+        if cached:
+            # Файл уже анализировался: индекс, движения и статистика читаются из кэша через mmap
+            result = analyzer.restore(cached['stats'], MoveArray(cached['moves'], cached['layer_starts'],
+                                                                 cached['layer_z'], True, generation,
+                                                                 cached['commands']), cached['move_times'])
+            if generation != self.load_generation:
+                return job
+            self._set_analysis(job, analyzer)
+            self.load_progress.emit(job.size, job.size, job.total_lines, job.total_lines)
+            self.gcode_loaded.emit(result['moves'])
+            self.load_finished.emit(True, filename)
+            return job
+
+        last_report = [0.0, 0]
+
+        def progress(lines, builder):
+            if cancel.is_set() or generation != self.load_generation:
+                return False
+            now = time.monotonic()
+            if now - last_report[0] >= self.LOAD_PROGRESS_INTERVAL:
+                last_report[0] = now
+                position = int(job.line_ends[lines - 1]) + 1 if lines else 0
+                self.load_progress.emit(position, job.size, lines, job.total_lines)
+                # Промежуточный результат — только когда завершились новые слои
+                if builder.complete_layers > last_report[1]:
+                    last_report[1] = builder.complete_layers
+                    self.gcode_loaded.emit(builder.snapshot(generation))
+            return True
+
+        processes = get_config('gcode.analysis_processes', 0)
+        try:
+            result = analyzer.analyze_job(job, progress, generation, processes)
+        except Exception as e:
+            print(f"Error analyzing G-code file: {e}")
+            if generation == self.load_generation:
+                self.load_finished.emit(False, str(e))
+            return job
+        if generation != self.load_generation:
+            return job
+        if not result['complete']:
+            self.load_finished.emit(False, "cancelled")
+            return job
+
+        self._set_analysis(job, analyzer)
+        self.load_progress.emit(job.size, job.size, job.total_lines, job.total_lines)
+        self.gcode_loaded.emit(result['moves'])
+        if key:
+            cache.store(key, job, result['moves'], analyzer.stats(), analyzer.print_time.move_times)
+        self.load_finished.emit(True, filename)
+        return job
+
+    def _on_load_started(self, job):
+        previous, self.loaded_job = self.loaded_job, job
+        self._release_job(previous)
+
+    def _release_job(self, job):
+        """Закрывает mmap и файл задания, которое больше никто не читает:
+        не загруженное в просмотр, не печатаемое и не анализируемое фоновым потоком"""
+        if job is None or job is self.loaded_job or job is self.gcode_commands or job in self.loading_jobs:
+            return
+        job.close()
+
+    def _set_analysis(self, job, analyzer):
+        self.gcode_analyzer = analyzer
+        self.analyzed_job = job
+        # Печать могла начаться до конца анализа: оставшееся время появится с этого момента
+        if self.is_printing and self.gcode_commands is job and self.print_tracker is None:
+            self.print_tracker = self._create_print_tracker(self.acknowledged_line)
+
+    def _create_print_tracker(self, start_line):
+        """Прогресс по времени, если для печатаемого задания есть оценка времени; иначе None (прогресс по строкам)"""
+        estimate = self.gcode_analyzer.print_time
+        if self.gcode_commands is not self.analyzed_job or not estimate.total:
+            return None
+        command_times = estimate.times_at_lines(self.gcode_commands.command_lines + 1)
+        buffered = self.serial_comm.get_config('printer.planner_buffer_size', 16) if self.serial_comm else 16
+        return PrintProgress(command_times, estimate.total, start_line, buffered)
 
     def parse_gcode_line(self, line):
         """Парсинг строки G-code"""
-        line = line.split(';')[0].strip()
-
-        parts = line.split()
-        if not parts:
-            return None
-
-        command = {
-            'type': parts[0],
-            'parameters': {}
-        }
-
-        for part in parts[1:]:
-            if len(part) >= 2:
-                param = part[0]
-                try:
-                    value = float(part[1:])
-                    command['parameters'][param] = value
-                except ValueError:
-                    command['parameters'][param] = part[1:]
+        return parse_gcode_line(line)
 
-        return command
-
-    def start_print(self, gcode_commands):
-        """Начало печати"""
+    def start_print(self, gcode_commands, start_line=0):
+        """Начало печати (с start_line — продолжение прерванного задания)"""
         if self.is_printing:
             return False
 
-        self.gcode_commands = gcode_commands
+        previous, self.gcode_commands = self.gcode_commands, gcode_commands
+        if previous is not gcode_commands:
+            self._release_job(previous)
         self.total_lines = len(gcode_commands)
-        self.current_line = 0
+        self.current_line = start_line
+        self.acknowledged_line = start_line
+        self.last_progress = -1
+        self.resume_line = None
+        self.print_tracker = self._create_print_tracker(start_line)
+        self.last_time_report = 0.0
         self.is_printing = True
         self.is_paused = False
 
@@ -104,44 +265,104 @@ class GCodeHandler(QObject):
         return True
 
     def print_loop(self):
-        """Цикл печати"""
-        while self.is_printing and self.current_line < self.total_lines:
-            if self.is_paused:
-                time.sleep(0.1)
-                continue
-
-            command_data = self.gcode_commands[self.current_line]
-            command = command_data['original']
+        """Цикл печати: потоковая отправка с учётом окна неподтверждённых команд"""
+        self.serial_comm.flow_control.add_ack_listener(self._on_command_acknowledged)
+        last_stats_time = 0.0
+        interrupted = False
 
-            if self.serial_comm.send_command(command):
-                response = self.serial_comm.send_command_with_response(command, timeout=10.0)
-                if response and 'error' in response.lower():
-                    print(f"Error executing command: {command}")
+        try:
+            while self.is_printing and self.acknowledged_line < self.total_lines:
+                now = time.monotonic()
+                if now - last_stats_time >= self.STREAM_STATS_INTERVAL:
+                    last_stats_time = now
+                    stats = self.serial_comm.get_stream_stats()
+                    self.stream_stats_changed.emit(stats['commands_per_second'], stats['in_flight'])
+
+                if self.is_paused or self.current_line >= self.total_lines:
+                    time.sleep(0.05)
+                    continue
+
+                if not self.serial_comm.wait_for_stream_room(timeout=0.1):
+                    continue
+
+                if not self.serial_comm.is_connected:
+                    print("Connection lost during print")
+                    interrupted = True
                     break
 
-            self.current_line += 1
-            progress = int((self.current_line / self.total_lines) * 100)
-            self.print_progress.emit(progress)
-
-            parsed_command = command_data['command']
-            if parsed_command:
-                self.update_position_from_command(parsed_command)
-
-            time.sleep(0.01)
+                command = self.gcode_commands.text(self.current_line)
+                self.serial_comm.send_command(command, tag=self.current_line, lane=BULK)
+                self.current_line += 1
+        finally:
+            self.serial_comm.flow_control.remove_ack_listener(self._on_command_acknowledged)
 
         self.is_printing = False
-        self.print_status_changed.emit("finished" if self.current_line >= self.total_lines else "stopped")
+        self.stream_stats_changed.emit(0.0, 0)
+        if interrupted:
+            # Неподтверждённые строки потеряны вместе с соединением: продолжать с первой из них
+            self.resume_line = self.acknowledged_line
+            self.print_status_changed.emit("interrupted")
+        else:
+            self.print_status_changed.emit("finished" if self.acknowledged_line >= self.total_lines else "stopped")
+
+    def _on_reconnected(self):
+        if self.resume_line is not None and not self.is_printing:
+            self.resume_available.emit(self.resume_line)
+
+    def resume_from_line(self, line_index=None, home_xy=None):
+        """Продолжение прерванного задания: восстановление нагрева, режимов и положения, затем строки с line_index"""
+        if line_index is None:
+            line_index = self.resume_line
+        if line_index is None or not self.gcode_commands or not self.serial_comm.is_connected:
+            return False
+        if home_xy is None:
+            home_xy = self.serial_comm.get_config('serial.resume_home_xy', True)
+
+        state = modal_state_at(self.gcode_commands, line_index)
+        for command in build_resume_commands(state, home_xy):
+            self.send_command(command)
+        return self.start_print(self.gcode_commands, line_index)
+
+    def _on_command_acknowledged(self, entry):
+        """Подтверждение строки задания прошивкой (вызывается из потока чтения)"""
+        if entry.tag is None or not self.is_printing:
+            return
+
+        self.acknowledged_line = entry.tag + 1
+        tracker = self.print_tracker
+        if tracker is not None:
+            # Прогресс — доля предсказанного времени: строки заполнения длинные, периметров — короткие
+            now = time.monotonic()
+            percent, elapsed, remaining = tracker.update(self.acknowledged_line, now)
+            progress = int(percent)
+            if now - self.last_time_report >= self.PRINT_TIME_INTERVAL:
+                self.last_time_report = now
+                self.print_time_changed.emit(elapsed, remaining)
+        else:
+            progress = int((self.acknowledged_line / self.total_lines) * 100)
+        # Сигнал уходит в поток GUI событием: только при смене процента, а не на каждую строку
+        if progress != self.last_progress:
+            self.last_progress = progress
+            self.print_progress.emit(progress)
+
+        parsed_command = self.gcode_commands.command(entry.tag)
+        if parsed_command:
+            self.update_position_from_command(parsed_command)
 
     def pause_print(self):
         """Пауза печати"""
         if self.is_printing:
             self.is_paused = True
+            if self.print_tracker is not None:
+                self.print_tracker.pause(time.monotonic())
             self.print_status_changed.emit("paused")
 
     def resume_print(self):
         """Возобновление печати"""
         if self.is_printing and self.is_paused:
             self.is_paused = False
+            if self.print_tracker is not None:
+                self.print_tracker.resume(time.monotonic())
             self.print_status_changed.emit("printing")
 
     def stop_print(self):
@@ -217,10 +438,9 @@ class GCodeHandler(QObject):
         self.send_command("M105")
 
     def request_status(self):
-        """Запрос статуса"""
+        """Разовый запрос статуса; периодические отчёты ведёт StatusReporter"""
         if self.serial_comm.is_connected:
-            self.send_command("M105")
-            self.send_command("M114")
+            self.status_reporter.request_now()
 
     def send_command(self, command):
         """Отправка команды"""
@@ -234,34 +454,34 @@ class GCodeHandler(QObject):
 
     def parse_response(self, response):
         """Парсинг ответа принтера"""
-        response = response.strip()
-
-        temp_match = re.search(r'T:\s*([\d.]+)\s*/\s*([\d.]+)', response)
-        if temp_match:
-            current_temp = float(temp_match.group(1))
-            target_temp = float(temp_match.group(2))
-            self.temperatures['extruder']['current'] = current_temp
-            self.temperatures['extruder']['target'] = target_temp
-            self.temperature_changed.emit('extruder', current_temp, target_temp)
-
-        bed_match = re.search(r'B:\s*([\d.]+)\s*/\s*([\d.]+)', response)
-        if bed_match:
-            current_temp = float(bed_match.group(1))
-            target_temp = float(bed_match.group(2))
-            self.temperatures['bed']['current'] = current_temp
-            self.temperatures['bed']['target'] = target_temp
-            self.temperature_changed.emit('bed', current_temp, target_temp)
-
-        pos_match = re.search(r'X:\s*([\d.-]+)\s+Y:\s*([\d.-]+)\s+Z:\s*([\d.-]+)', response)
-        if pos_match:
-            x = float(pos_match.group(1))
-            y = float(pos_match.group(2))
-            z = float(pos_match.group(3))
+        record = self.response_parser.parse(response, self.response_record)
+
+        # Ошибки нумерации и контрольной суммы ("Last Line: N") исправляются повтором строки
+        if self.is_printing and record.kind == 'error' and 'last line' not in record.line.lower():
+            print(f"Error reported by printer: {record.line}")
+            self.is_printing = False
+
+        for heater, (current_temp, target_temp) in record.temperatures.items():
+            state = self.temperatures.setdefault(heater, {'current': 0.0, 'target': 0.0})
+            state['current'] = current_temp
+            if target_temp is not None:
+                state['target'] = target_temp
+            self.temperature_changed.emit(heater, current_temp, state['target'])
+
+        if record.has_position:
+            x, y, z = record.position[:3]
             self.current_position[0] = x
             self.current_position[1] = y
             self.current_position[2] = z
             self.position_changed.emit(x, y, z)
 
+    def _on_firmware_detected(self, info):
+        """Выбор диалекта ответов по FIRMWARE_NAME, если он не задан в настройках явно"""
+        self.serial_comm.remember_firmware(info)
+        dialect = self.serial_comm.get_config('serial.firmware_dialect', 'auto')
+        if dialect == 'auto':
+            self.serial_comm.set_response_dialect(dialect_for_firmware(info.name))
+
     def update_position_from_command(self, command):
         """Обновление позиции из команды G-code"""
         if command['type'] in ['G0', 'G1']:
@@ -275,11 +495,7 @@ class GCodeHandler(QObject):
             if 'E' in params:
                 self.current_position[3] = params['E']
 
-            self.position_changed.emit(
-                self.current_position[0],
-                self.current_position[1],
-                self.current_position[2]
-            )
+            self._report_position()
         elif command['type'] == 'G28':
             params = command['parameters']
             if not params:
@@ -292,11 +508,23 @@ class GCodeHandler(QObject):
                 if 'Z' in params:
                     self.current_position[2] = 0.0
 
-            self.position_changed.emit(
-                self.current_position[0],
-                self.current_position[1],
-                self.current_position[2]
-            )
+            self._report_position()
+
+    def _report_position(self):
+        """position_changed для подтверждённых строк (из потока чтения): одно событие Qt за кадр, а не на строку"""
+        if self.position_scheduled:
+            return
+        self.position_scheduled = True
+        self._position_pending.emit()
+
+    def _schedule_position_report(self):
+        rate = self.serial_comm.get_config('ui.refresh_rate', 30) if self.serial_comm else 30
+        QTimer.singleShot(max(1, int(1000 / max(1, rate))), self._flush_position)
+
+    def _flush_position(self):
+        self.position_scheduled = False
+        x, y, z = self.current_position[:3]
+        self.position_changed.emit(x, y, z)
 
     def get_current_position(self):
         """Получение текущей позиции"""
@@ -304,8 +532,10 @@ class GCodeHandler(QObject):
 
     def get_print_progress(self):
         """Получение прогресса печати"""
+        if self.print_tracker is not None and self.last_progress >= 0:
+            return self.last_progress
         if self.total_lines > 0:
-            return int((self.current_line / self.total_lines) * 100)
+            return int((self.acknowledged_line / self.total_lines) * 100)
         return 0
 
     def is_print_active(self):
@@ -320,13 +550,24 @@ class GCodeHandler(QObject):
 class GCodeAnalyzer:
     """Улучшенный анализатор G-code с поддержкой слоев и типов движений"""
 
-    def __init__(self):
+    PROGRESS_LINES = 8192
+    # Версия результата анализа: увеличивать при изменении MoveArray или статистики (ключ кэша)
+    VERSION = 4
+
+    def __init__(self, limits=None, arc_tolerance=ARC_TOLERANCE):
+        self.limits = limits or PlannerLimits()
+        self.arc_tolerance = arc_tolerance
         self.reset()
 
+    def cache_version(self):
+        """Версия для ключа кэша: разбиение дуг зависит от допуска"""
+        return f"{self.VERSION}-arc{self.arc_tolerance:g}"
+
     def reset(self):
         """Сброс анализатора"""
         self.total_lines = 0
         self.print_time_estimate = 0
+        self.print_time = PrintTimeEstimate.empty()
         self.filament_length = 0.0
         self.layer_count = 0
         self.max_temp_extruder = 0
@@ -336,69 +577,69 @@ class GCodeAnalyzer:
             'min_y': float('inf'), 'max_y': float('-inf'),
             'min_z': float('inf'), 'max_z': float('-inf')
         }
-        self.layers_data = []
-        self.path_data = []
+        self.moves = MoveArray()
 
-    def analyze_gcode(self, gcode_lines):
-        self.reset()
-        self.total_lines = len(gcode_lines)
+    def analyze_gcode(self, gcode_lines, progress=None, generation=0):
+        """Анализ строк файла; gcode_lines — любой итерируемый объект (например, GCodeJob.iter_lines()).
 
-        current_layer = -1
-        current_z = -1
-        current_pos = [0.0, 0.0, 0.0, 0.0]  # [X, Y, Z, E]
-        current_layer_data = {'z': 0, 'paths': []}
-        current_path = {'type': 'travel', 'points': []}
+        Движения собираются в MoveArray, статистика по ним считается векторно.
+        progress(строк обработано, MoveArrayBuilder) вызывается каждые
+        PROGRESS_LINES строк; если он вернёт False, анализ прерывается
+        и в результате будет 'complete': False.
+        """
+        self.reset()
+        builder = MoveArrayBuilder(self.arc_tolerance)
+        complete = True
 
         for line_num, line in enumerate(gcode_lines):
+            self.total_lines = line_num + 1
+            if progress is not None and line_num % self.PROGRESS_LINES == 0 and not progress(line_num, builder):
+                complete = False
+                break
             line = line.strip()
             if not line or line.startswith(';'):
                 if line.startswith(';LAYER:') or line.startswith('; layer '):
-                    if current_path['points']:
-                        current_layer_data['paths'].append(current_path.copy())
-                        current_path = {'type': 'travel', 'points': []}
-
-                    if current_layer_data['paths']:
-                        self.layers_data.append(current_layer_data.copy())
-
-                    current_layer += 1
-                    current_layer_data = {'z': current_z, 'paths': []}
+                    builder.new_layer()
                 continue
 
-            self._analyze_line(line, current_pos)
-
-            if line.startswith('G1') or line.startswith('G0'):
-                new_pos, path_type = self._process_movement(line, current_pos)
+            command = parse_gcode_line(line)
+            if command:
+                self._analyze_command(command)
+                builder.add(line_num + 1, command)
 
-                # Проверка смены слоя по Z
-                if new_pos[2] > current_z + 0.01:  # Новый слой
-                    if current_path['points']:
-                        current_layer_data['paths'].append(current_path.copy())
-                        current_path = {'type': path_type, 'points': []}
+        return self._result(builder.build(generation) if complete else builder.snapshot(generation), complete)
 
-                    if current_layer_data['paths']:
-                        self.layers_data.append(current_layer_data.copy())
+    def analyze_job(self, job, progress=None, generation=0, processes=0):
+        """Анализ GCodeJob: большие файлы — частями в пуле процессов (processes=0 — по числу ядер, 1 — без пула).
 
-                    current_layer += 1
-                    current_z = new_pos[2]
-                    current_layer_data = {'z': current_z, 'paths': []}
-
-                # Добавление точки к текущему пути
-                if current_path['type'] != path_type:
-                    if current_path['points']:
-                        current_layer_data['paths'].append(current_path.copy())
-                    current_path = {'type': path_type, 'points': []}
-
-                current_path['points'].append(new_pos[:3])  # Только X, Y, Z
-                self.path_data.append(new_pos[:3])
-                current_pos[:] = new_pos
-
-        if current_path['points']:
-            current_layer_data['paths'].append(current_path)
-        if current_layer_data['paths']:
-            self.layers_data.append(current_layer_data)
-
-        self.layer_count = len(self.layers_data)
+        Результат совпадает с analyze_gcode(job.iter_lines()); progress
+        вызывается после каждой части.
+        """
+        processes = processes or default_processes()
+        if processes == 1 or not job.path or job.size < PARALLEL_MIN_BYTES:
+            return self.analyze_gcode(job.iter_lines(), progress, generation)
 
+        self.reset()
+        stitcher, self.total_lines, self.max_temp_extruder, self.max_temp_bed, complete = \
+            analyze_parallel(job, processes, progress, arc_tolerance=self.arc_tolerance)
+        return self._result(stitcher.build(generation) if complete else stitcher.snapshot(generation), complete)
+
+    def _result(self, moves, complete):
+        self.moves = moves
+        self.layer_count = self.moves.layer_count
+        self.filament_length = self.moves.filament_length()
+        self.print_bounds = self.moves.bounds()
+        if complete:
+            self._estimate_time()
+        return dict(self.stats(), moves=self.moves, complete=complete)
+
+    def _estimate_time(self):
+        """Время печати по модели планировщика; время движений, слоёв и по строкам — в self.print_time"""
+        self.print_time = estimate_print_time(self.moves, self.limits)
+        self.print_time_estimate = self.print_time.total
+
+    def stats(self):
+        """Статистика последнего анализа без массивов (сохраняется в кэш в JSON)"""
         return {
             'total_lines': self.total_lines,
             'layer_count': self.layer_count,
@@ -407,60 +648,34 @@ class GCodeAnalyzer:
             'max_temp_extruder': self.max_temp_extruder,
             'max_temp_bed': self.max_temp_bed,
             'bounds': self.print_bounds,
-            'path_data': self.path_data,
-            'layers_data': self.layers_data
+            'planner_limits': self.limits.to_dict()
         }
 
-    def _analyze_line(self, line, current_pos):
-        """Анализ строки G-code"""
-        if line.startswith('M104') or line.startswith('M109'):
-            temp_match = re.search(r'S(\d+)', line)
-            if temp_match:
-                temp = int(temp_match.group(1))
-                self.max_temp_extruder = max(self.max_temp_extruder, temp)
-
-        elif line.startswith('M140') or line.startswith('M190'):
-            temp_match = re.search(r'S(\d+)', line)
-            if temp_match:
-                temp = int(temp_match.group(1))
-                self.max_temp_bed = max(self.max_temp_bed, temp)
-
-    def _process_movement(self, line, current_pos):
-        """Обработка движения с определением типа"""
-        x_match = re.search(r'X(-?\d+\.?\d*)', line)
-        y_match = re.search(r'Y(-?\d+\.?\d*)', line)
-        z_match = re.search(r'Z(-?\d+\.?\d*)', line)
-        e_match = re.search(r'E(-?\d+\.?\d*)', line)
-
-        new_pos = current_pos.copy()
-
-        if x_match:
-            new_pos[0] = float(x_match.group(1))
-            self.print_bounds['min_x'] = min(self.print_bounds['min_x'], new_pos[0])
-            self.print_bounds['max_x'] = max(self.print_bounds['max_x'], new_pos[0])
-
-        if y_match:
-            new_pos[1] = float(y_match.group(1))
-            self.print_bounds['min_y'] = min(self.print_bounds['min_y'], new_pos[1])
-            self.print_bounds['max_y'] = max(self.print_bounds['max_y'], new_pos[1])
-
-        if z_match:
-            new_pos[2] = float(z_match.group(1))
-            self.print_bounds['min_z'] = min(self.print_bounds['min_z'], new_pos[2])
-            self.print_bounds['max_z'] = max(self.print_bounds['max_z'], new_pos[2])
-
-        # Определение типа движения
-        path_type = 'travel'
-        if e_match:
-            new_e = float(e_match.group(1))
-            if new_e > current_pos[3]:
-                # Экструзия - печать
-                path_type = 'print'
-                self.filament_length += new_e - current_pos[3]
-            elif new_e < current_pos[3]:
-                # Ретракт
-                path_type = 'retraction'
-            new_pos[3] = new_e
-
-        return new_pos, path_type
-
+    def restore(self, stats, moves, move_times=None):
+        """Результат анализа из сохранённой статистики и движений, без прохода по файлу"""
+        self.reset()
+        self.total_lines = stats['total_lines']
+        self.layer_count = stats['layer_count']
+        self.filament_length = stats['filament_length']
+        self.max_temp_extruder = stats['max_temp_extruder']
+        self.max_temp_bed = stats['max_temp_bed']
+        self.print_bounds = stats['bounds']
+        self.moves = moves
+        # Время зависит от ограничений принтера: сохранённое годится, только если они не менялись
+        if move_times is not None and stats.get('planner_limits') == self.limits.to_dict():
+            self.print_time = PrintTimeEstimate.from_move_times(moves, move_times, stats['print_time'])
+            self.print_time_estimate = self.print_time.total
+        else:
+            self._estimate_time()
+        return dict(self.stats(), moves=self.moves, complete=True)
+
+    def _analyze_command(self, command):
+        """Учёт температур из разобранной команды"""
+        code = command['type']
+        temperature = command['parameters'].get('S')
+        if not isinstance(temperature, float):
+            return
+        if code in ('M104', 'M109'):
+            self.max_temp_extruder = max(self.max_temp_extruder, int(temperature))
+        elif code in ('M140', 'M190'):
+            self.max_temp_bed = max(self.max_temp_bed, int(temperature))
@@ -0,0 +1,145 @@
+import mmap
+
+import numpy as np
+
+from core.gcode_tokenizer import parse_gcode_line
+
+
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+NEWLINE = ord('\n')
+COMMENT = ord(';')
+LEADING_SPACE = (ord(' '), ord('\t'), ord('\r'), ord('\f'), ord('\v'))
+
+
+class GCodeJob:
+    """Задание G-code поверх mmap файла: в памяти только индекс строк, текст декодируется по запросу.
+
+    Индекс строится за один проход: концы всех строк файла (4 байта на строку
+    для файлов до 4 ГиБ) и номера строк с командами (ещё 4 байта на команду).
+    Пустые строки и строки-комментарии в задание не входят. Элемент job[i]
+    совместим с прежним словарём {'line_number', 'original', 'command'}, но для
+    потоковой отправки дешевле text(i) и command(i).
+    """
+
+    def __init__(self, data=b'', path=None, file=None, index=None):
+        self.path = path
+        self.data = data
+        self._file = file
+        self.size = len(data)
+        self.line_ends, self.command_lines = index if index is not None else self._build_index()
+
+    @classmethod
+    def open(cls, path, index=None):
+        """Задание из файла; index — готовые (line_ends, command_lines), например из кэша анализа"""
+        file = open(path, 'rb')
+        try:
+            # mmap пустого файла невозможен
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if file.seek(0, 2) else b''
+        except Exception:
+            file.close()
+            raise
+        return cls(data, path, file, index)
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Задание из строк в памяти (тесты, бенчмарки, сгенерированный G-code)"""
+        return cls('\n'.join(line.rstrip('\r\n') for line in lines).encode('utf-8'))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.data = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def _build_index(self):
+        dtype = np.uint32 if self.size < 2 ** 32 else np.uint64
+        if not self.size:
+            return np.zeros(0, dtype), np.zeros(0, np.uint32)
+
+        # Поиск переводов строк частями: сравнение всего файла разом создало бы массив размером с файл
+        ends = []
+        for offset in range(0, self.size, INDEX_CHUNK_SIZE):
+            chunk = np.frombuffer(self.data, np.uint8, min(INDEX_CHUNK_SIZE, self.size - offset), offset)
+            ends.append((np.flatnonzero(chunk == NEWLINE) + offset).astype(dtype))
+            del chunk
+        if self.data[self.size - 1] != NEWLINE:
+            ends.append(np.array([self.size], dtype))
+        line_ends = np.concatenate(ends)
+
+        starts = np.empty(len(line_ends), np.int64)
+        starts[0] = 0
+        starts[1:] = line_ends[:-1].astype(np.int64) + 1
+        non_empty = starts < line_ends
+        first = np.zeros(len(line_ends), np.uint8)
+        view = np.frombuffer(self.data, np.uint8)
+        first[non_empty] = view[starts[non_empty]]
+        del view
+
+        is_command = non_empty & (first != COMMENT)
+        # Строки с отступом или только из пробелов — редкость, их проверяет Python
+        for index in np.flatnonzero(is_command & np.isin(first, LEADING_SPACE)):
+            text = self.data[starts[index]:int(line_ends[index])].strip()
+            is_command[index] = bool(text) and not text.startswith(b';')
+
+        return line_ends, np.flatnonzero(is_command).astype(np.uint32)
+
+    @property
+    def total_lines(self):
+        """Число строк файла, включая комментарии и пустые"""
+        return len(self.line_ends)
+
+    @property
+    def index_bytes(self):
+        return self.line_ends.nbytes + self.command_lines.nbytes
+
+    def _line_bytes(self, line_index):
+        start = int(self.line_ends[line_index - 1]) + 1 if line_index else 0
+        return self.data[start:int(self.line_ends[line_index])]
+
+    def __len__(self):
+        return len(self.command_lines)
+
+    def line_number(self, index):
+        """Номер строки файла (с 1) для команды index"""
+        return int(self.command_lines[index]) + 1
+
+    def text(self, index):
+        return self._line_bytes(int(self.command_lines[index])).decode('utf-8', errors='replace').strip()
+
+    def command(self, index):
+        return parse_gcode_line(self.text(index))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("G-code job index out of range")
+        original = self.text(index)
+        return {
+            'line_number': self.line_number(index),
+            'original': original,
+            'command': parse_gcode_line(original)
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def iter_text(self, start=0, stop=None):
+        for index in range(start, len(self) if stop is None else stop):
+            yield self.text(index)
+
+    def iter_lines(self):
+        """Все строки файла, включая комментарии (для анализа слоёв по ;LAYER:)"""
+        for line_index in range(len(self.line_ends)):
+            yield self._line_bytes(line_index).decode('utf-8', errors='replace')
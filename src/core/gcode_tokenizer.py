@@ -0,0 +1,163 @@
+import re
+
+
+# Слова G-code: буква и необязательное число; пробелы между словами не обязательны (G1X10Y5)
+WORD_PATTERN = re.compile(r'([A-Za-z])\s*([-+]?(?:\d+\.?\d*|\.\d+))?')
+CODE_PATTERN = re.compile(r'([A-Za-z])\s*(\d+(?:\.\d+)?)?')
+LINE_NUMBER_PATTERN = re.compile(r'[Nn]\s*\d+\s*')
+PAREN_COMMENT_PATTERN = re.compile(r'\([^)]*\)')
+
+# Аргумент этих команд — текст (имя файла, сообщение), а не слова с числами
+TEXT_COMMANDS = frozenset(('M23', 'M28', 'M30', 'M32', 'M33', 'M117', 'M118', 'M928'))
+
+PARAMETER_LETTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+CODE_LETTERS = frozenset('GMTgmt')
+
+# Первое слово строки -> код команды ('G1' -> 'G1', 'g01' -> 'G1'); заполняется при разборе
+_codes = {}
+
+
+def clean_line(line):
+    """Строка без комментариев (';' и '(...)'), номера строки N и контрольной суммы '*'"""
+    if ';' in line:
+        line = line.split(';', 1)[0]
+    if '(' in line:
+        line = PAREN_COMMENT_PATTERN.sub('', line)
+    if '*' in line:
+        line = line.split('*', 1)[0]
+    line = line.strip()
+    if line[:1] in ('N', 'n'):
+        match = LINE_NUMBER_PATTERN.match(line)
+        if match:
+            line = line[match.end():]
+    return line
+
+
+def split_command(body):
+    """Код команды ('G1', 'M104', 'T0'; 'G01' -> 'G1') и остаток очищенной строки"""
+    match = CODE_PATTERN.match(body)
+    if match is None:
+        # Не буквенная команда ('@pause' и т.п.): код — первое слово целиком
+        parts = body.split(None, 1)
+        if not parts:
+            return '', ''
+        return parts[0].upper(), parts[1] if len(parts) > 1 else ''
+    number = match.group(2)
+    if number is None:
+        code = match.group(1).upper()
+    elif '.' in number:
+        code = match.group(1).upper() + number
+    else:
+        code = match.group(1).upper() + str(int(number))
+    return code, body[match.end():]
+
+
+def _remember_code(word, code):
+    if word[:1] in CODE_LETTERS and CODE_PATTERN.fullmatch(word):
+        _codes[word] = code
+
+
+def command_code(line):
+    """Код команды без номера строки и параметров: 'N12 m112 ...' -> 'M112', 'G1X10' -> 'G1'"""
+    parts = line.split(None, 1)
+    code = _codes.get(parts[0]) if parts else None
+    if code is not None:
+        return code
+    body = clean_line(line)
+    code, rest = split_command(body)
+    _remember_code(body[:len(body) - len(rest)].strip(), code)
+    return code
+
+
+def parse_gcode_line(line):
+    """Разбор строки за один проход: {'type': 'G1', 'parameters': {'X': 10.0, ...}} или None для пустой строки.
+
+    Буквы параметров приводятся к верхнему регистру, слово без числа (G28 X)
+    даёт значение None. У команд с текстовым аргументом (M117, M23...)
+    параметров нет, текст лежит в 'text'. Обычные строки слайсеров
+    ('G1 X10 Y5 E0.1') разбираются через str.split, остальные
+    (G1X10Y5, строчные буквы, N и '*', комментарии в скобках) — регулярным
+    выражением.
+    """
+    if ';' in line:
+        line = line.split(';', 1)[0]
+    if '*' in line or '(' in line:
+        line = clean_line(line)
+    parts = line.split()
+    if not parts:
+        return None
+
+    code = _codes.get(parts[0])
+    if code is None or code in TEXT_COMMANDS:
+        return _parse_words(line)
+
+    parameters = {}
+    try:
+        for part in parts[1:]:
+            letter = part[0]
+            if letter not in PARAMETER_LETTERS:
+                return _parse_words(line)
+            parameters[letter] = float(part[1:]) if len(part) > 1 else None
+    except ValueError:
+        return _parse_words(line)
+    return {'type': code, 'parameters': parameters}
+
+
+def _parse_words(line):
+    body = clean_line(line)
+    if not body:
+        return None
+
+    code, rest = split_command(body)
+    _remember_code(body[:len(body) - len(rest)].strip(), code)
+    if code in TEXT_COMMANDS:
+        return {'type': code, 'parameters': {}, 'text': rest.strip()}
+    return {'type': code, 'parameters': parse_parameters(rest)}
+
+
+def parse_parameters(rest):
+    """Слова параметров после кода команды: {'X': 10.0, 'Y': None, ...}"""
+    parameters = {}
+    for letter, value in WORD_PATTERN.findall(rest):
+        parameters[letter.upper()] = float(value) if value else None
+    return parameters
+
+
+def benchmark(path, repeat=1):
+    """Скорость загрузки файла: индекс задания, разбор каждой строки и полный анализ (с)"""
+    import time
+    from core.gcode_handler import GCodeAnalyzer
+    from core.gcode_job import GCodeJob
+
+    results = {}
+    started = time.perf_counter()
+    with GCodeJob.open(path) as job:
+        results['index'] = time.perf_counter() - started
+        lines = list(job.iter_lines())
+        results['lines'] = len(lines)
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for line in lines:
+                parse_gcode_line(line)
+        results['tokenize'] = (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            GCodeAnalyzer().analyze_gcode(lines)
+        results['analyze'] = (time.perf_counter() - started) / repeat
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Замер разбора G-code: индекс, токенизация и анализ файла")
+    parser.add_argument('path', help="файл G-code")
+    parser.add_argument('--repeat', type=int, default=1, help="число повторов для усреднения")
+    args = parser.parse_args()
+
+    result = benchmark(args.path, args.repeat)
+    print(f"{result['lines']} lines: index {result['index']:.3f} s, "
+          f"tokenize {result['tokenize']:.3f} s ({result['lines'] / max(result['tokenize'], 1e-9):.0f} lines/s), "
+          f"analyze {result['analyze']:.3f} s")
@@ -0,0 +1,56 @@
+import threading
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class LineBatcher(QObject):
+    """Сбор строк из потока ввода-вывода и доставка в поток GUI одним списком не чаще раза за interval.
+
+    На каждую пачку приходится одно межпоточное событие Qt вместо события на каждую строку.
+    Объект должен принадлежать потоку GUI: в нём выполняются таймер и lines_ready.
+    """
+
+    lines_ready = pyqtSignal(list)
+    _batch_started = pyqtSignal()
+
+    def __init__(self, rate=30):
+        super().__init__()
+        self.interval_ms = 33
+        self.set_rate(rate)
+        self.lock = threading.Lock()
+        self.lines = []
+        self.scheduled = False
+        self.batches = 0
+        self.batched_lines = 0
+        self._batch_started.connect(self._schedule_flush)
+
+    def set_rate(self, rate):
+        """Частота доставки, пачек в секунду"""
+        self.interval_ms = max(1, int(1000 / max(1, rate)))
+
+    def append(self, line):
+        """Добавление строки (из любого потока)"""
+        with self.lock:
+            self.lines.append(line)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self._batch_started.emit()
+
+    def _schedule_flush(self):
+        QTimer.singleShot(self.interval_ms, self.flush)
+
+    def flush(self):
+        with self.lock:
+            lines, self.lines = self.lines, []
+            self.scheduled = False
+        if lines:
+            self.batches += 1
+            self.batched_lines += len(lines)
+            self.lines_ready.emit(lines)
+
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'lines': self.batched_lines,
+            'lines_per_batch': self.batched_lines / self.batches if self.batches else 0.0
+        }
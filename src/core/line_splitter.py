@@ -0,0 +1,29 @@
+class LineSplitter:
+    """Накопление принятых байт в переиспользуемом буфере и нарезка полных строк пачкой"""
+
+    def __init__(self, max_line_length=4096):
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length
+
+    def feed(self, data):
+        """Добавление принятых байт; возвращает список завершённых непустых строк"""
+        buffer = self.buffer
+        buffer += data
+
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            if len(buffer) > self.max_line_length:
+                return self._take(len(buffer))
+            return []
+        return self._take(end + 1)
+
+    def reset(self):
+        self.buffer.clear()
+
+    def _take(self, length):
+        # Одно копирование и одно декодирование на весь блок полных строк вместо построчной обработки
+        with memoryview(self.buffer) as view:
+            block = view[:length].tobytes()
+        del self.buffer[:length]
+        text = block.decode('utf-8', errors='ignore')
+        return [line for line in (part.strip() for part in text.split('\n')) if line]
@@ -0,0 +1,121 @@
+import re
+import threading
+from collections import deque
+
+from core.gcode_tokenizer import clean_line
+
+
+RESEND_PATTERN = re.compile(r'^(?:resend|rs)[:\s]*n?\s*(\d+)', re.IGNORECASE)
+
+
+def gcode_checksum(text):
+    """Контрольная сумма строки G-code: XOR всех байт до символа '*'"""
+    checksum = 0
+    for byte in text.encode('utf-8'):
+        checksum ^= byte
+    return checksum
+
+
+def is_stale_line_error(error):
+    """Ошибка вызвана строкой, отправленной до отката (номер не по порядку или обрывок строки)"""
+    if not error:
+        return False
+    error = error.lower()
+    return 'last line number+1' in error or 'no line number' in error
+
+
+def parse_resend_request(line):
+    """Номер строки из ответа 'Resend: N' / 'rs N' или None"""
+    match = RESEND_PATTERN.match(line)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+class LineNumberTransport:
+    """Нумерация строк (N) и контрольные суммы (*) с кольцевой историей для повтора по Resend"""
+
+    def __init__(self, history_size=1024):
+        self.history = deque(maxlen=max(16, int(history_size)))
+        self.next_line_number = 1
+        self.lock = threading.Lock()
+        self.rewind_line_number = None
+        self.rewind_written = False
+        self.stale_budget = 0
+        self.last_written = 0
+        self.resend_count = 0
+
+    def frame(self, command, tag=None, future=None):
+        """Оформление команды как 'N<n> <команда>*<сумма>' с запоминанием в истории"""
+        # Номер и сумма, если они уже есть в строке, заменяются своими
+        command = clean_line(command)
+        with self.lock:
+            line_number = self.next_line_number
+            self.next_line_number += 1
+            text = self._frame(line_number, command)
+            self.history.append((line_number, text, tag, future))
+            return line_number, text
+
+    def reset(self, tag=None, future=None):
+        """Сброс нумерации: возвращает строку M110, которую нужно отправить первой.
+
+        Строка M110 хранится в истории под номером 0: если прошивка её отвергнет,
+        повтор начнётся с неё самой.
+        """
+        with self.lock:
+            self.history.clear()
+            self.next_line_number = 1
+            self.rewind_line_number = None
+            self.stale_budget = 0
+            self.last_written = 0
+            text = self._frame(0, 'M110 N0')
+            self.history.append((0, text, tag, future))
+            return text
+
+    def lines_from(self, line_number):
+        """Уже отправленные строки начиная с line_number или None, если они вытеснены из истории"""
+        with self.lock:
+            if not self.history or self.history[0][0] > line_number:
+                return None
+            return [entry for entry in self.history if entry[0] >= line_number]
+
+    def accept_resend(self, line_number, after_error=None):
+        """Решение, выполнять ли откат по запросу Resend.
+
+        Строки, уже находившиеся в пути к прошивке в момент сброса её буфера,
+        отвергаются с ошибкой нумерации и вызывают повторный запрос того же
+        номера; такие дубликаты игнорируются. Повторный запрос, пришедший до
+        фактической повторной отправки строки, тоже вызван устаревшими строками.
+        Устаревших строк не больше, чем было записано после запрошенной, поэтому
+        сверх этого числа повтор выполняется: искажённым мог прийти номер
+        самой повторно отправленной строки.
+        """
+        with self.lock:
+            if line_number == self.rewind_line_number and self.stale_budget > 0:
+                if not self.rewind_written or is_stale_line_error(after_error):
+                    self.stale_budget -= 1
+                    return False
+            self._start_rewind(line_number)
+            return True
+
+    def force_rewind(self, line_number):
+        """Откат без запроса прошивки (истёк таймаут подтверждения): повтор начиная с line_number"""
+        with self.lock:
+            self._start_rewind(line_number)
+
+    def _start_rewind(self, line_number):
+        self.rewind_line_number = line_number
+        self.rewind_written = False
+        self.stale_budget = max(0, self.last_written - line_number)
+        self.resend_count += 1
+
+    def on_written(self, line_number):
+        """Отметка о фактической записи строки в порт"""
+        self.last_written = max(self.last_written, line_number)
+        if line_number == self.rewind_line_number:
+            self.rewind_written = True
+
+    @staticmethod
+    def _frame(line_number, command):
+        text = f"N{line_number} {command}"
+        return f"{text}*{gcode_checksum(text)}"
@@ -0,0 +1,389 @@
+import functools
+import math
+
+import numpy as np
+
+
+# Коды команд движения
+OP_G0 = 0
+OP_G1 = 1
+OP_G2 = 2
+OP_G3 = 3
+OPCODES = {'G0': OP_G0, 'G00': OP_G0, 'G1': OP_G1, 'G01': OP_G1, 'G2': OP_G2, 'G02': OP_G2,
+           'G3': OP_G3, 'G03': OP_G3}
+
+# Тип участка пути
+FEATURE_TRAVEL = 0
+FEATURE_PRINT = 1
+FEATURE_RETRACTION = 2
+FEATURE_NAMES = ('travel', 'print', 'retraction')
+
+# Биты маски: оси, заданные в самой команде (остальные значения унаследованы)
+HAS_X = 1
+HAS_Y = 2
+HAS_Z = 4
+HAS_E = 8
+HAS_F = 16
+AXIS_BITS = (('X', HAS_X), ('Y', HAS_Y), ('Z', HAS_Z), ('E', HAS_E), ('F', HAS_F))
+
+# Биты режимов, действовавших при выполнении команды
+ABSOLUTE_POSITIONING = 1
+ABSOLUTE_EXTRUSION = 2
+
+MOVE_DTYPE = np.dtype([
+    ('opcode', np.uint8),
+    ('feature', np.uint8),
+    ('mask', np.uint8),
+    ('flags', np.uint8),
+    ('line', np.uint32),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('z', np.float32),
+    ('f', np.float32),
+    ('e', np.float64),
+    ('de', np.float32)
+])
+
+LAYER_Z_THRESHOLD = 0.01
+
+# Единицы файла G20/G21: миллиметров в единице
+MM_PER_INCH = 25.4
+# Параметры в единицах длины: оси, подача и центр дуги; у ограничений планировщика (M203-M205) — все
+LENGTH_LETTERS = frozenset('XYZEFIJR')
+PLANNER_CODES = frozenset(('M203', 'M204', 'M205'))
+
+# Дуги G2/G3: наибольшее отклонение хорды от дуги по умолчанию (мм) и предел числа отрезков одной дуги
+ARC_TOLERANCE = 0.01
+MAX_ARC_SEGMENTS = 4096
+
+# Команды без движения, от которых зависит время печати: паузы, установка положения и ограничения планировщика
+TIMING_CODES = frozenset(('G4', 'G28', 'G92', 'M203', 'M204', 'M205', 'M220'))
+COMMAND_LETTERS = 'XYZESPTRJ'
+COMMAND_DTYPE = np.dtype([('code', 'U4'), ('line', np.uint32)] +
+                         [(letter.lower(), np.float64) for letter in COMMAND_LETTERS])
+
+
+def command_row(code, line_number, params):
+    """Строка COMMAND_DTYPE для команды из TIMING_CODES; отсутствующие параметры — NaN.
+
+    У G28 оси парковки записываются как X/Y/Z = 0 (все три, если оси не указаны).
+    """
+    if code == 'G28':
+        axes = [axis for axis in 'XYZ' if axis in params] or list('XYZ')
+        values = [0.0 if letter in axes else np.nan for letter in COMMAND_LETTERS]
+    else:
+        values = [params[letter] if isinstance(params.get(letter), float) else np.nan for letter in COMMAND_LETTERS]
+    return (code, line_number, *values)
+
+
+def to_millimeters(code, params, units):
+    """Параметры команды в миллиметрах; units — миллиметров в единице файла (MM_PER_INCH после G20)"""
+    letters = COMMAND_LETTERS if code in PLANNER_CODES else LENGTH_LETTERS
+    return {letter: value * units if letter in letters and isinstance(value, float) else value
+            for letter, value in params.items()}
+
+
+@functools.lru_cache(maxsize=1024)
+def _arc_fractions(segments):
+    """Доли дуги в промежуточных точках: общие для всех дуг с тем же числом отрезков"""
+    fractions = np.arange(1, segments) / segments
+    fractions.flags.writeable = False
+    return fractions
+
+
+def arc_points(start, end, i, j, radius, clockwise, turns, tolerance):
+    """Промежуточные точки дуги G2/G3 в плоскости XY: массив (N, 4) x, y, z, e без конечной точки.
+
+    start и end — положения [x, y, z, e] до и после команды. Центр задан
+    смещением (i, j) от start или, если radius не None, радиусом R (как
+    в Marlin: R < 0 — большая из двух дуг); turns — число дополнительных
+    полных оборотов (P). Отрезков столько, чтобы хорда отходила от дуги
+    не больше чем на tolerance; Z и E меняются равномерно по дуге. Для
+    вырожденной дуги точек нет, и она остаётся прямым отрезком.
+    """
+    x, y = start[0], start[1]
+    if radius is not None:
+        dx, dy = end[0] - x, end[1] - y
+        distance = math.hypot(dx, dy)
+        if not radius or not distance:
+            return np.zeros((0, 4))
+        height_squared = (radius - 0.5 * distance) * (radius + 0.5 * distance)
+        height = math.sqrt(height_squared) if height_squared > 0 else 0.0
+        side = -1.0 if clockwise != (radius < 0) else 1.0
+        i = 0.5 * dx - side * height * dy / distance
+        j = 0.5 * dy + side * height * dx / distance
+
+    arc_radius = math.hypot(i, j)
+    if not arc_radius:
+        return np.zeros((0, 4))
+    center_x, center_y = x + i, y + j
+    start_angle = math.atan2(-j, -i)
+    sweep = math.atan2(end[1] - center_y, end[0] - center_x) - start_angle
+    # Совпадающие начало и конец — полный круг
+    if clockwise and sweep >= 0:
+        sweep -= 2 * math.pi
+    elif not clockwise and sweep <= 0:
+        sweep += 2 * math.pi
+    if turns:
+        sweep += math.copysign(2 * math.pi * turns, sweep)
+
+    step = 2 * math.acos(max(1.0 - tolerance / arc_radius, -1.0))
+    segments = min(max(math.ceil(abs(sweep) / step), 1), MAX_ARC_SEGMENTS) if step > 0 else MAX_ARC_SEGMENTS
+    if segments == 1:
+        return np.zeros((0, 4))
+
+    fractions = _arc_fractions(segments)
+    angles = start_angle + sweep * fractions
+    points = np.empty((segments - 1, 4))
+    points[:, 0] = center_x + arc_radius * np.cos(angles)
+    points[:, 1] = center_y + arc_radius * np.sin(angles)
+    points[:, 2] = start[2] + (end[2] - start[2]) * fractions
+    points[:, 3] = start[3] + (end[3] - start[3]) * fractions
+    return points
+
+
+def arc_mask(mask):
+    """Маска промежуточных отрезков дуги: точки на дуге входят в границы по X и Y, подача задана только в команде"""
+    return (mask & ~HAS_F) | HAS_X | HAS_Y
+
+
+class MoveArray:
+    """Разобранные движения задания в виде структурированного массива NumPy (MOVE_DTYPE).
+
+    x, y, z, e, f — абсолютное положение (мм) и подача после команды с
+    учётом G90/G91, M82/M83, G92 и G20/G21; mask показывает, какие из них
+    заданы в самой команде. de — приращение E за движение: разность
+    абсолютных e через G92 E0 ничего не говорит о выдавленной длине. Дуги G2/G3 разбиты на отрезки с номером строки
+    команды, последний из них кончается в её конечной точке. Слои заданы индексами первых движений (layer_starts) и высотами
+    (layer_z). commands (COMMAND_DTYPE) — команды из TIMING_CODES с номерами
+    строк, для оценки времени печати. to_path_data() и to_layers_data()
+    дают прежние списки для кода, ещё не перешедшего на массивы.
+
+    Во время загрузки приходят промежуточные массивы (complete=False) только
+    из завершённых слоёв; массивы одной загрузки имеют общий generation,
+    и каждый следующий продолжает предыдущий.
+    """
+
+    def __init__(self, moves=None, layer_starts=None, layer_z=None, complete=True, generation=0, commands=None):
+        self.moves = moves if moves is not None else np.zeros(0, MOVE_DTYPE)
+        self.layer_starts = layer_starts if layer_starts is not None else np.zeros(0, np.int64)
+        self.layer_z = layer_z if layer_z is not None else np.zeros(0, np.float32)
+        self.commands = commands if commands is not None else np.zeros(0, COMMAND_DTYPE)
+        self.complete = complete
+        self.generation = generation
+
+    def __len__(self):
+        return len(self.moves)
+
+    @property
+    def layer_count(self):
+        return len(self.layer_starts)
+
+    def layer_range(self, layer):
+        start = int(self.layer_starts[layer])
+        stop = int(self.layer_starts[layer + 1]) if layer + 1 < len(self.layer_starts) else len(self.moves)
+        return start, stop
+
+    def positions(self, start=0, stop=None):
+        """Точки движений [start, stop) — массив (N, 3) float32"""
+        moves = self.moves[start:stop]
+        return np.column_stack((moves['x'], moves['y'], moves['z']))
+
+    def segments(self, start=0, stop=None):
+        """Отрезки движений [start, stop) как пары точек (M, 2, 3): от положения до команды к положению после"""
+        points = self.positions(max(start - 1, 0), stop)
+        ends = points[1:] if start > 0 else points
+        begins = np.empty_like(ends)
+        if len(ends):
+            begins[1:] = ends[:-1]
+            begins[0] = points[0]
+        return np.stack((begins, ends), axis=1)
+
+    def feature_counts(self):
+        counts = np.bincount(self.moves['feature'], minlength=len(FEATURE_NAMES))
+        return {name: int(counts[index]) for index, name in enumerate(FEATURE_NAMES)}
+
+    def path_counts(self):
+        """Число путей (серий движений одного типа) в каждом слое"""
+        if not self.layer_count:
+            return np.zeros(0, np.int64)
+        features = self.moves['feature']
+        starts = np.ones(len(features), np.int64)
+        starts[1:] = features[1:] != features[:-1]
+        starts[self.layer_starts] = 1
+        return np.add.reduceat(starts, self.layer_starts)
+
+    def bounds(self):
+        """Границы по осям, заданным в командах; inf/-inf, если ось не встречалась"""
+        result = {}
+        for axis, bit in AXIS_BITS[:3]:
+            values = self.moves[axis.lower()][(self.moves['mask'] & bit) != 0]
+            result[f'min_{axis.lower()}'] = float(values.min()) if len(values) else float('inf')
+            result[f'max_{axis.lower()}'] = float(values.max()) if len(values) else float('-inf')
+        return result
+
+    def filament_length(self):
+        """Сумма положительных приращений E движений печати (ретракты не уменьшают длину)"""
+        delta = self.moves['de']
+        printing = (self.moves['feature'] == FEATURE_PRINT) & (delta > 0)
+        return float(delta[printing].sum(dtype=np.float64))
+
+    def to_path_data(self):
+        """Совместимость: список точек [x, y, z] всех движений"""
+        return self.positions().tolist()
+
+    def to_layers_data(self):
+        """Совместимость: [{'z', 'paths': [{'type', 'points'}]}] — подряд идущие движения одного типа в одном пути"""
+        layers = []
+        points = self.positions().tolist()
+        features = self.moves['feature']
+        for layer in range(self.layer_count):
+            start, stop = self.layer_range(layer)
+            paths = []
+            if stop > start:
+                changes = np.flatnonzero(np.diff(features[start:stop])) + start + 1
+                bounds = [start, *changes.tolist(), stop]
+                for begin, end in zip(bounds, bounds[1:]):
+                    paths.append({'type': FEATURE_NAMES[features[begin]], 'points': points[begin:end]})
+            layers.append({'z': float(self.layer_z[layer]), 'paths': paths})
+        return layers
+
+
+class MoveArrayBuilder:
+    """Накопление движений при проходе по заданию: модальные режимы, смена слоёв, тип участка"""
+
+    INITIAL_CAPACITY = 4096
+
+    def __init__(self, arc_tolerance=ARC_TOLERANCE):
+        self.arc_tolerance = arc_tolerance
+        self.moves = np.zeros(self.INITIAL_CAPACITY, MOVE_DTYPE)
+        self.count = 0
+        self.layer_starts = []
+        self.layer_z = []
+        self.commands = []
+        self.position = [0.0, 0.0, 0.0, 0.0]
+        self.feedrate = 0.0
+        self.absolute_positioning = True
+        self.absolute_extrusion = True
+        self.units = 1.0
+        self.current_z = -1.0
+        self.layer_pending = False
+
+    def new_layer(self):
+        """Метка слоя в комментарии (;LAYER:): слой начинается со следующего движения"""
+        self.layer_pending = True
+
+    def add(self, line_number, command):
+        """Учёт разобранной команды ({'type', 'parameters'}); остальные команды меняют только режимы и положение"""
+        if not command:
+            return
+        code = command['type'].upper()
+        params = command['parameters']
+        if self.units != 1.0:
+            params = to_millimeters(code, params, self.units)
+
+        opcode = OPCODES.get(code)
+        if opcode is None:
+            if code in TIMING_CODES:
+                self.commands.append(command_row(code, line_number, params))
+            self._apply_mode(code, params)
+            return
+
+        new_position = list(self.position)
+        mask = 0
+        for index, (axis, bit) in enumerate(AXIS_BITS[:4]):
+            value = params.get(axis)
+            if not isinstance(value, float):
+                continue
+            mask |= bit
+            absolute = self.absolute_extrusion if axis == 'E' else self.absolute_positioning
+            new_position[index] = value if absolute else self.position[index] + value
+        if isinstance(params.get('F'), float):
+            mask |= HAS_F
+            self.feedrate = params['F']
+
+        feature = FEATURE_TRAVEL
+        if new_position[3] > self.position[3]:
+            feature = FEATURE_PRINT
+        elif new_position[3] < self.position[3]:
+            feature = FEATURE_RETRACTION
+
+        if self.layer_pending or new_position[2] > self.current_z + LAYER_Z_THRESHOLD or not self.layer_starts:
+            if new_position[2] > self.current_z + LAYER_Z_THRESHOLD:
+                self.current_z = new_position[2]
+            self.layer_starts.append(self.count)
+            self.layer_z.append(self.current_z)
+            self.layer_pending = False
+
+        flags = (ABSOLUTE_POSITIONING if self.absolute_positioning else 0) | \
+                (ABSOLUTE_EXTRUSION if self.absolute_extrusion else 0)
+        segment_start = self.position[3]
+        if opcode >= OP_G2:
+            segment_start = self._add_arc(opcode, feature, mask, flags, line_number, params, new_position)
+
+        if self.count == len(self.moves):
+            self.moves = np.resize(self.moves, len(self.moves) * 2)
+        self.moves[self.count] = (opcode, feature, mask, flags, line_number, new_position[0], new_position[1],
+                                  new_position[2], self.feedrate, new_position[3], new_position[3] - segment_start)
+        self.count += 1
+        self.position = new_position
+
+    def _add_arc(self, opcode, feature, mask, flags, line_number, params, end):
+        """Промежуточные отрезки дуги; слой определяется по команде целиком, до них.
+        Возвращает E в начале последнего отрезка (конечной точки команды)"""
+        i, j, radius, turns = [params[letter] if isinstance(params.get(letter), float) else None for letter in 'IJRP']
+        points = arc_points(self.position, end, i or 0.0, j or 0.0, radius, opcode == OP_G2, int(turns or 0),
+                            self.arc_tolerance)
+        if not len(points):
+            return self.position[3]
+        while self.count + len(points) >= len(self.moves):
+            self.moves = np.resize(self.moves, len(self.moves) * 2)
+        rows = self.moves[self.count:self.count + len(points)]
+        rows['opcode'] = opcode
+        rows['feature'] = feature
+        rows['mask'] = arc_mask(mask)
+        rows['flags'] = flags
+        rows['line'] = line_number
+        for index, axis in enumerate('xyze'):
+            rows[axis] = points[:, index]
+        rows['f'] = self.feedrate
+        rows['de'] = np.diff(points[:, 3], prepend=self.position[3])
+        self.count += len(points)
+        return float(points[-1, 3])
+
+    def _apply_mode(self, code, params):
+        if code == 'G90':
+            self.absolute_positioning = self.absolute_extrusion = True
+        elif code == 'G91':
+            self.absolute_positioning = self.absolute_extrusion = False
+        elif code == 'M82':
+            self.absolute_extrusion = True
+        elif code == 'M83':
+            self.absolute_extrusion = False
+        elif code in ('G20', 'G21'):
+            self.units = MM_PER_INCH if code == 'G20' else 1.0
+        elif code == 'G92':
+            for index, axis in enumerate('XYZE'):
+                if isinstance(params.get(axis), float):
+                    self.position[index] = params[axis]
+        elif code == 'G28':
+            # Парковка меняет положение, но в путь не входит: иначе до первого слоя появился бы слой Z=0
+            for axis in [axis for axis in 'XYZ' if axis in params] or list('XYZ'):
+                self.position['XYZ'.index(axis)] = 0.0
+
+    @property
+    def complete_layers(self):
+        """Число слоёв, в которые движения больше не добавятся (все, кроме текущего)"""
+        return max(len(self.layer_starts) - 1, 0)
+
+    def snapshot(self, generation=0):
+        """Промежуточный массив из завершённых слоёв"""
+        layers = self.complete_layers
+        count = self.layer_starts[layers] if layers else 0
+        return MoveArray(self.moves[:count].copy(), np.array(self.layer_starts[:layers], np.int64),
+                         np.array(self.layer_z[:layers], np.float32), False, generation)
+
+    def build(self, generation=0):
+        return MoveArray(self.moves[:self.count].copy(), np.array(self.layer_starts, np.int64),
+                         np.array(self.layer_z, np.float32), True, generation,
+                         np.array(self.commands, COMMAND_DTYPE))
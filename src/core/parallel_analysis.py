@@ -0,0 +1,442 @@
+import math
+import mmap
+import multiprocessing
+import os
+
+import numpy as np
+
+from core.gcode_tokenizer import parse_gcode_line
+from core.move_array import (MOVE_DTYPE, OPCODES, OP_G2, OP_G3, AXIS_BITS, HAS_X, HAS_Y, HAS_Z, HAS_F,
+                             FEATURE_TRAVEL, FEATURE_PRINT, FEATURE_RETRACTION, ABSOLUTE_POSITIONING,
+                             ABSOLUTE_EXTRUSION, LAYER_Z_THRESHOLD, TIMING_CODES, COMMAND_DTYPE, COMMAND_LETTERS,
+                             MM_PER_INCH, LENGTH_LETTERS, PLANNER_CODES, ARC_TOLERANCE, MoveArray, command_row,
+                             arc_points, arc_mask)
+
+
+# Параллельный анализ окупает запуск процессов только на больших файлах
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# Частей больше, чем процессов: ровнее загрузка и чаще промежуточные результаты
+CHUNKS_PER_PROCESS = 4
+MIN_CHUNK_BYTES = 1024 * 1024
+
+# События части файла: коды движений совпадают с OP_G0..OP_G3, остальные меняют режимы и положение
+EVENT_ABSOLUTE = 4
+EVENT_RELATIVE = 5
+EVENT_ABSOLUTE_EXTRUSION = 6
+EVENT_RELATIVE_EXTRUSION = 7
+EVENT_SET_POSITION = 8
+EVENT_LAYER = 9
+EVENT_INCHES = 10
+EVENT_MILLIMETERS = 11
+MODE_EVENTS = {'G90': EVENT_ABSOLUTE, 'G91': EVENT_RELATIVE, 'M82': EVENT_ABSOLUTE_EXTRUSION,
+               'M83': EVENT_RELATIVE_EXTRUSION, 'G20': EVENT_INCHES, 'G21': EVENT_MILLIMETERS}
+
+EVENT_DTYPE = np.dtype([
+    ('kind', np.uint8),
+    ('mask', np.uint8),
+    ('line', np.uint32),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('z', np.float64),
+    ('e', np.float64),
+    ('f', np.float64)
+])
+
+# Параметры дуг G2/G3 части — по строке на каждое событие дуги, по порядку; NaN — параметр не задан
+ARC_DTYPE = np.dtype([('i', np.float64), ('j', np.float64), ('r', np.float64), ('p', np.float64)])
+
+
+def chunk_ranges(job, count):
+    """Границы частей по концам строк: [(первый байт, конец, индекс первой строки)]"""
+    if not job.total_lines:
+        return []
+    count = max(1, min(count, job.size // MIN_CHUNK_BYTES or 1))
+    targets = np.arange(1, count) * (job.size // count)
+    last_lines = np.unique(np.searchsorted(job.line_ends, targets))
+    last_lines = last_lines[last_lines < job.total_lines - 1]
+
+    ranges = []
+    start, first_line = 0, 0
+    for line in [*last_lines.tolist(), job.total_lines - 1]:
+        stop = int(job.line_ends[line]) + 1
+        ranges.append((start, min(stop, job.size), first_line))
+        start, first_line = stop, line + 1
+    return ranges
+
+
+def analyze_chunk(path, start, stop, first_line):
+    """Разбор части файла без знания модального состояния (выполняется в процессе пула).
+
+    Положение, режимы G90/G91, M82/M83, G20/G21 и смещения G92 на начало
+    части неизвестны, поэтому движения не вычисляются: команды сохраняются
+    как события с заданными в них значениями (в единицах файла), а
+    положение восстанавливает ChunkStitcher. Возвращает (события
+    EVENT_DTYPE, команды COMMAND_DTYPE, дуги ARC_DTYPE, число строк, макс.
+    температура экструдера, макс. температура стола).
+    """
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        lines = data[start:stop].decode('utf-8', errors='replace').split('\n')
+    if lines and not lines[-1]:
+        lines.pop()
+
+    kinds, masks, numbers, values, commands, arcs = [], [], [], [], [], []
+    max_temp_extruder = max_temp_bed = 0
+    for line_num, line in enumerate(lines, first_line + 1):
+        line = line.strip()
+        if not line or line.startswith(';'):
+            if line.startswith(';LAYER:') or line.startswith('; layer '):
+                kinds.append(EVENT_LAYER)
+                masks.append(0)
+                numbers.append(line_num)
+                values.append((0.0, 0.0, 0.0, 0.0, 0.0))
+            continue
+
+        command = parse_gcode_line(line)
+        if not command:
+            continue
+        code = command['type'].upper()
+        params = command['parameters']
+
+        temperature = params.get('S')
+        if isinstance(temperature, float):
+            if code in ('M104', 'M109'):
+                max_temp_extruder = max(max_temp_extruder, int(temperature))
+            elif code in ('M140', 'M190'):
+                max_temp_bed = max(max_temp_bed, int(temperature))
+
+        if code in TIMING_CODES:
+            commands.append(command_row(code, line_num, params))
+
+        kind = OPCODES.get(code)
+        if kind is None:
+            kind = MODE_EVENTS.get(code)
+        if kind is None and code in ('G92', 'G28'):
+            kind = EVENT_SET_POSITION
+        if kind is None:
+            continue
+
+        mask = 0
+        row = [0.0, 0.0, 0.0, 0.0, 0.0]
+        if kind == OP_G2 or kind == OP_G3:
+            arcs.append([params[letter] if isinstance(params.get(letter), float) else np.nan for letter in 'IJRP'])
+        if code == 'G28':
+            # Парковка — установка положения в 0 по указанным осям (по всем, если оси не указаны)
+            for axis, bit in AXIS_BITS[:3]:
+                if axis in params:
+                    mask |= bit
+            mask = mask or HAS_X | HAS_Y | HAS_Z
+        else:
+            for index, (axis, bit) in enumerate(AXIS_BITS if kind <= 3 else AXIS_BITS[:4]):
+                value = params.get(axis)
+                if isinstance(value, float):
+                    mask |= bit
+                    row[index] = value
+        kinds.append(kind)
+        masks.append(mask)
+        numbers.append(line_num)
+        values.append(row)
+
+    events = np.zeros(len(kinds), EVENT_DTYPE)
+    if kinds:
+        events['kind'] = kinds
+        events['mask'] = masks
+        events['line'] = numbers
+        columns = np.array(values, np.float64)
+        for index, axis in enumerate('xyzef'):
+            events[axis] = columns[:, index]
+    arc_rows = np.zeros(len(arcs), ARC_DTYPE)
+    if arcs:
+        columns = np.array(arcs, np.float64)
+        for index, name in enumerate('ijrp'):
+            arc_rows[name] = columns[:, index]
+    return events, np.array(commands, COMMAND_DTYPE), arc_rows, len(lines), max_temp_extruder, max_temp_bed
+
+
+def _forward_fill(values, valid, initial):
+    """Для каждого элемента — последнее значение values[valid] не правее него (initial, если такого нет)"""
+    index = np.where(valid, np.arange(1, len(values) + 1), 0)
+    np.maximum.accumulate(index, out=index)
+    return np.concatenate(([initial], values))[index]
+
+
+def _commands_to_millimeters(commands, unit_lines, unit_values, initial):
+    """Параметры команд в мм, как to_millimeters, по единицам на строке каждой команды"""
+    commands = commands.copy()
+    factor = np.concatenate(([initial], unit_values))[np.searchsorted(unit_lines, commands['line'])]
+    planner = np.isin(commands['code'], list(PLANNER_CODES))
+    for letter in COMMAND_LETTERS:
+        column = commands[letter.lower()]
+        if letter in LENGTH_LETTERS:
+            column *= factor
+        else:
+            column[planner] *= factor[planner]
+    return commands
+
+
+class ChunkStitcher:
+    """Сшивка частей по порядку: модальное состояние конца одной части — начало следующей.
+
+    Результат совпадает с последовательным MoveArrayBuilder побитно:
+    относительные приращения складываются по порядку (np.cumsum), как в
+    последовательном проходе, а смена слоёв проверяется только на
+    движениях, где менялась Z или стояла метка слоя. Дуги разбиваются на
+    отрезки той же arc_points после восстановления положения. Интерфейс
+    complete_layers / snapshot() / build() — как у MoveArrayBuilder.
+    """
+
+    def __init__(self, arc_tolerance=ARC_TOLERANCE):
+        self.arc_tolerance = arc_tolerance
+        self.parts = []
+        self.commands = []
+        self.count = 0
+        self.layer_starts = []
+        self.layer_z = []
+        self.position = [0.0, 0.0, 0.0, 0.0]
+        self.feedrate = 0.0
+        self.absolute_positioning = True
+        self.absolute_extrusion = True
+        self.units = 1.0
+        self.current_z = -1.0
+        self.layer_pending = False
+        self.last_move_z = None
+
+    def add_chunk(self, events, commands=None, arcs=None):
+        kinds = events['kind']
+        is_move = kinds <= 3
+        # Множитель единиц файла для каждого события; None — всё в миллиметрах
+        scale = None
+        unit_events = (kinds == EVENT_INCHES) | (kinds == EVENT_MILLIMETERS)
+        if self.units != 1.0 or unit_events.any():
+            inches = np.where(kinds == EVENT_INCHES, MM_PER_INCH, 1.0)
+            scale = _forward_fill(inches, unit_events, self.units)
+            if commands is not None and len(commands):
+                commands = _commands_to_millimeters(commands, events['line'][unit_events], inches[unit_events],
+                                                    self.units)
+        if commands is not None:
+            self.commands.append(commands)
+        absolute_positioning = _forward_fill(
+            kinds == EVENT_ABSOLUTE, (kinds == EVENT_ABSOLUTE) | (kinds == EVENT_RELATIVE),
+            self.absolute_positioning)
+        extrusion_mode = (kinds == EVENT_ABSOLUTE) | (kinds == EVENT_RELATIVE) | \
+                         (kinds == EVENT_ABSOLUTE_EXTRUSION) | (kinds == EVENT_RELATIVE_EXTRUSION)
+        absolute_extrusion = _forward_fill(
+            (kinds == EVENT_ABSOLUTE) | (kinds == EVENT_ABSOLUTE_EXTRUSION), extrusion_mode,
+            self.absolute_extrusion)
+
+        positions = []
+        for index, (axis, bit) in enumerate(AXIS_BITS[:4]):
+            positions.append(self._resolve_axis(events, index, axis.lower(), bit, is_move,
+                                                absolute_extrusion if axis == 'E' else absolute_positioning, scale))
+
+        moves_index = np.flatnonzero(is_move)
+        moves = np.zeros(len(moves_index), MOVE_DTYPE)
+        moves['opcode'] = kinds[moves_index]
+        moves['mask'] = events['mask'][moves_index]
+        moves['line'] = events['line'][moves_index]
+        moves['flags'] = np.where(absolute_positioning[moves_index], ABSOLUTE_POSITIONING, 0) | \
+                         np.where(absolute_extrusion[moves_index], ABSOLUTE_EXTRUSION, 0)
+        for axis, after in zip('xyze', positions):
+            moves[axis] = after[1:][moves_index]
+        e_after, e_before = positions[3][1:][moves_index], positions[3][:-1][moves_index]
+        moves['de'] = e_after - e_before
+        moves['feature'] = np.where(e_after > e_before, FEATURE_PRINT,
+                                    np.where(e_after < e_before, FEATURE_RETRACTION, FEATURE_TRAVEL))
+        has_feedrate = (moves['mask'] & HAS_F) != 0
+        feedrates = (events['f'] if scale is None else events['f'] * scale)[moves_index]
+        moves['f'] = _forward_fill(feedrates, has_feedrate, self.feedrate)
+        if has_feedrate.any():
+            self.feedrate = float(feedrates[has_feedrate][-1])
+
+        starts = None
+        if arcs is not None and len(arcs):
+            moves, starts = self._tessellate(moves, arcs, moves_index, positions, scale)
+        self._find_layers(kinds, moves_index, positions[2][1:][moves_index], starts)
+
+        if len(kinds):
+            self.position = [float(after[-1]) for after in positions]
+            self.absolute_positioning = bool(absolute_positioning[-1])
+            self.absolute_extrusion = bool(absolute_extrusion[-1])
+            if scale is not None:
+                self.units = float(scale[-1])
+        self.parts.append(moves)
+        self.count += len(moves)
+
+    def _resolve_axis(self, events, index, name, bit, is_move, absolute, scale=None):
+        """Положение по оси до первого события и после каждого (len + 1 значений)"""
+        present = (events['mask'] & bit) != 0
+        values = events[name] if scale is None else events[name] * scale
+        anchor = present & ((is_move & absolute) | (events['kind'] == EVENT_SET_POSITION))
+        relative = present & is_move & ~absolute
+
+        resolved = values.copy()
+        relative_index = np.flatnonzero(relative)
+        if len(relative_index):
+            anchor_index = np.flatnonzero(anchor)
+            segments = np.searchsorted(anchor_index, relative_index)
+            bounds = np.flatnonzero(np.diff(segments)) + 1
+            for group in np.split(relative_index, bounds):
+                segment = segments[np.searchsorted(relative_index, group[0])]
+                base = values[anchor_index[segment - 1]] if segment else self.position[index]
+                resolved[group] = np.cumsum(np.concatenate(([base], values[group])))[1:]
+        return np.concatenate(([self.position[index]], _forward_fill(resolved, anchor | relative, self.position[index])))
+
+    def _tessellate(self, moves, arcs, moves_index, positions, scale):
+        """Дуги как отрезки, как в MoveArrayBuilder: (движения, индекс первого отрезка каждой команды)"""
+        arc_moves = np.flatnonzero(moves['opcode'] >= OP_G2)
+        arc_events = moves_index[arc_moves]
+        factors = scale[arc_events].tolist() if scale is not None else [1.0] * len(arc_events)
+        counts = np.ones(len(moves), np.int64)
+        tessellated = []
+        for move, event, arc, factor in zip(arc_moves.tolist(), arc_events.tolist(), arcs.tolist(), factors):
+            i, j, radius = [None if math.isnan(value) else value * factor for value in arc[:3]]
+            start = [float(axis[event]) for axis in positions]
+            end = [float(axis[event + 1]) for axis in positions]
+            points = arc_points(start, end, i or 0.0, j or 0.0, radius, moves['opcode'][move] == OP_G2,
+                                0 if math.isnan(arc[3]) else int(arc[3]), self.arc_tolerance)
+            counts[move] += len(points)
+            tessellated.append(points)
+
+        expanded = np.repeat(moves, counts)
+        starts = np.cumsum(counts) - counts
+        for move, points in zip(arc_moves.tolist(), tessellated):
+            if not len(points):
+                continue
+            rows = expanded[starts[move]:starts[move] + len(points)]
+            rows['mask'] = arc_mask(int(rows['mask'][0]))
+            for index, axis in enumerate('xyze'):
+                rows[axis] = points[:, index]
+            e_start = float(positions[3][moves_index[move]])
+            rows['de'] = np.diff(points[:, 3], prepend=e_start)
+            expanded['de'][starts[move] + len(points)] = float(positions[3][moves_index[move] + 1]) - points[-1, 3]
+        return expanded, starts
+
+    def _find_layers(self, kinds, moves_index, z, starts=None):
+        markers = np.cumsum(kinds == EVENT_LAYER)
+        pending = np.zeros(len(moves_index), bool)
+        if len(moves_index):
+            before = markers[moves_index]
+            pending[1:] = before[1:] > before[:-1]
+            pending[0] = self.layer_pending or before[0] > 0
+        changed = np.ones(len(moves_index), bool)
+        changed[1:] = z[1:] != z[:-1]
+        if len(moves_index) and self.last_move_z is not None:
+            changed[0] = z[0] != self.last_move_z
+
+        z_values = z.tolist()
+        for move in np.flatnonzero(pending | changed).tolist():
+            new_z = z_values[move]
+            if pending[move] or new_z > self.current_z + LAYER_Z_THRESHOLD or not self.layer_starts:
+                if new_z > self.current_z + LAYER_Z_THRESHOLD:
+                    self.current_z = new_z
+                self.layer_starts.append(self.count + (int(starts[move]) if starts is not None else move))
+                self.layer_z.append(self.current_z)
+
+        if len(moves_index):
+            self.last_move_z = z_values[-1]
+            self.layer_pending = bool(markers[-1] > markers[moves_index[-1]])
+        elif len(kinds):
+            self.layer_pending = self.layer_pending or bool(markers[-1])
+
+    @property
+    def complete_layers(self):
+        return max(len(self.layer_starts) - 1, 0)
+
+    def _moves(self):
+        if len(self.parts) > 1:
+            self.parts = [np.concatenate(self.parts)]
+        return self.parts[0] if self.parts else np.zeros(0, MOVE_DTYPE)
+
+    def snapshot(self, generation=0):
+        layers = self.complete_layers
+        count = self.layer_starts[layers] if layers else 0
+        return MoveArray(self._moves()[:count].copy(), np.array(self.layer_starts[:layers], np.int64),
+                         np.array(self.layer_z[:layers], np.float32), False, generation)
+
+    def build(self, generation=0):
+        commands = np.concatenate(self.commands) if self.commands else np.zeros(0, COMMAND_DTYPE)
+        return MoveArray(self._moves(), np.array(self.layer_starts, np.int64),
+                         np.array(self.layer_z, np.float32), True, generation, commands)
+
+
+def default_processes():
+    return os.cpu_count() or 1
+
+
+def analyze_parallel(job, processes=None, progress=None, chunks=None, arc_tolerance=ARC_TOLERANCE):
+    """Анализ файла задания в пуле процессов.
+
+    progress(строк обработано, ChunkStitcher) вызывается после сшивки
+    каждой части; False прерывает анализ. Возвращает (ChunkStitcher,
+    строк обработано, макс. температура экструдера, стола, завершён ли).
+    """
+    processes = processes or default_processes()
+    ranges = chunk_ranges(job, chunks or processes * CHUNKS_PER_PROCESS)
+    stitcher = ChunkStitcher(arc_tolerance)
+    lines = max_temp_extruder = max_temp_bed = 0
+    complete = True
+
+    # spawn, а не fork: в приложении работают потоки Qt и asyncio
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        results = pool.imap(_analyze_range, [(job.path, *chunk) for chunk in ranges])
+        for events, commands, arcs, chunk_lines, temp_extruder, temp_bed in results:
+            stitcher.add_chunk(events, commands, arcs)
+            lines += chunk_lines
+            max_temp_extruder = max(max_temp_extruder, temp_extruder)
+            max_temp_bed = max(max_temp_bed, temp_bed)
+            if progress is not None and not progress(lines, stitcher):
+                complete = False
+                break
+    return stitcher, lines, max_temp_extruder, max_temp_bed, complete
+
+
+def _analyze_range(arguments):
+    return analyze_chunk(*arguments)
+
+
+def benchmark(path, process_counts=None):
+    """Время анализа последовательно и в пуле из 1, 2, 4... процессов; результат сверяется с последовательным"""
+    import time
+    from core.gcode_handler import GCodeAnalyzer
+    from core.gcode_job import GCodeJob
+
+    results = {}
+    with GCodeJob.open(path) as job:
+        started = time.perf_counter()
+        serial = GCodeAnalyzer().analyze_gcode(job.iter_lines())
+        results['serial'] = (time.perf_counter() - started, True)
+
+        for processes in process_counts or _doubling(default_processes()):
+            started = time.perf_counter()
+            result = GCodeAnalyzer().analyze_job(job, processes=processes)
+            elapsed = time.perf_counter() - started
+            same = all(result[key] == serial[key] for key in ('total_lines', 'max_temp_extruder', 'max_temp_bed'))
+            same = same and result['moves'].moves.tobytes() == serial['moves'].moves.tobytes()
+            same = same and np.array_equal(result['moves'].layer_starts, serial['moves'].layer_starts)
+            same = same and result['moves'].commands.tobytes() == serial['moves'].commands.tobytes()
+            results[processes] = (elapsed, same)
+    return results
+
+
+def _doubling(limit):
+    counts = [1]
+    while counts[-1] * 2 <= limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Масштабирование параллельного анализа G-code по числу процессов")
+    parser.add_argument('path', help="файл G-code")
+    parser.add_argument('--processes', type=int, nargs='*', help="числа процессов (по умолчанию 1, 2, 4... до числа ядер)")
+    args = parser.parse_args()
+
+    result = benchmark(args.path, args.processes)
+    serial_time = result.pop('serial')[0]
+    print(f"serial: {serial_time:.2f} s")
+    for processes, (elapsed, same) in result.items():
+        print(f"{processes} processes: {elapsed:.2f} s, speedup {serial_time / elapsed:.2f}x, "
+              f"{'identical' if same else 'MISMATCH'}")
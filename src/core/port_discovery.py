@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import time
+
+import serial.tools.list_ports
+
+from core.firmware_capabilities import FirmwareInfo, parse_firmware_info
+from core.line_splitter import LineSplitter
+from core.transport import SerialTransport
+
+
+BAUDRATES = (115200, 250000, 500000, 1000000, 57600)
+
+
+class PortCandidate:
+    """Порт для опроса: имя устройства и ключ кэша (серийный номер USB, VID:PID@расположение или имя)"""
+
+    def __init__(self, device, key=None, description=''):
+        self.device = device
+        self.key = key or device
+        self.description = description
+
+    @classmethod
+    def from_port_info(cls, info):
+        if info.serial_number:
+            key = f"usb:{info.serial_number}"
+        elif info.vid is not None:
+            key = f"usb:{info.vid:04x}:{info.pid:04x}@{info.location}"
+        else:
+            key = info.device
+        return cls(info.device, key, info.description or '')
+
+    def __repr__(self):
+        return f"PortCandidate({self.device!r}, {self.key!r})"
+
+
+class ProbeResult:
+    """Порт, на котором прошивка ответила на M115"""
+
+    def __init__(self, candidate, baudrate, firmware, elapsed=0.0, cached=False):
+        self.candidate = candidate
+        self.baudrate = baudrate
+        self.firmware = firmware
+        self.elapsed = elapsed
+        self.cached = cached
+
+    @property
+    def port(self):
+        return self.candidate.device
+
+    def __repr__(self):
+        source = 'cache' if self.cached else f"{self.elapsed:.2f} s"
+        return f"ProbeResult({self.port!r}, {self.baudrate}, {self.firmware.name!r}, {source})"
+
+
+def list_candidates():
+    """Последовательные порты, на которых может быть принтер: без несуществующих встроенных ttyS (hwid 'n/a')"""
+    return [PortCandidate.from_port_info(info) for info in serial.tools.list_ports.comports()
+            if info.hwid and info.hwid != 'n/a']
+
+
+class PortCache:
+    """Результаты опроса по ключу порта: прошивка, возможности, рабочая скорость. Хранится в JSON рядом с config.json"""
+
+    def __init__(self, path="port_cache.json"):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            print(f"Error loading port cache: {e}")
+            self.entries = {}
+
+    def save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"Error saving port cache: {e}")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def remember(self, candidate, baudrate, firmware):
+        self.entries[candidate.key] = {
+            'port': candidate.device,
+            'baudrate': baudrate,
+            'firmware': firmware.name,
+            'fields': firmware.fields,
+            'capabilities': firmware.capabilities,
+            'last_seen': time.time()
+        }
+        self.save()
+
+    def forget(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.save()
+
+    def lookup(self, candidates):
+        """Первый присутствующий порт, известный по кэшу, — без опроса"""
+        for candidate in candidates:
+            entry = self.entries.get(candidate.key)
+            if entry:
+                firmware = FirmwareInfo(dict(entry.get('fields', {})), dict(entry.get('capabilities', {})))
+                return ProbeResult(candidate, entry['baudrate'], firmware, cached=True)
+        return None
+
+
+async def probe_port(candidate, baudrate, timeout=1.0, query_interval=0.3):
+    """Открытие порта и M115 с повтором каждые query_interval секунд до ответа с FIRMWARE_NAME или истечения timeout.
+
+    Баннер загрузки Marlin ('start') после сброса по DTR продлевает ожидание
+    на timeout: прошивка только что запустилась и прежние запросы потеряны.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    transport = SerialTransport(candidate.device, baudrate, timeout, timeout)
+    splitter = LineSplitter()
+    lines = []
+    try:
+        await asyncio.wait_for(transport.open(), timeout)
+        next_query = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return None
+            if now >= next_query:
+                # Перевод строки впереди сбрасывает мусор, оставшийся в буфере прошивки
+                await transport.write(b"\nM115\n")
+                next_query = now + query_interval
+            try:
+                data = await asyncio.wait_for(transport.read(), min(deadline, next_query) - now)
+            except asyncio.TimeoutError:
+                continue
+            for line in splitter.feed(data):
+                if line.strip() == 'start':
+                    deadline = max(deadline, time.monotonic() + timeout)
+                    next_query = 0.0
+                    lines.clear()
+                    continue
+                lines.append(line)
+                if line.lower().startswith('ok') and any('FIRMWARE_NAME:' in item for item in lines):
+                    firmware = parse_firmware_info(lines)
+                    return ProbeResult(candidate, baudrate, firmware, time.monotonic() - started)
+    except (OSError, serial.SerialException, ConnectionError, asyncio.TimeoutError):
+        return None
+    finally:
+        try:
+            await transport.close()
+        except Exception:
+            pass
+
+
+async def _probe_baudrates(candidate, baudrates, timeout, boot_timeout):
+    # Скорости одного порта перебираются по очереди: порт нельзя открыть дважды.
+    # Открытие порта перезагружает плату с сбросом по DTR: первая скорость ждёт окончания загрузки
+    for index, baudrate in enumerate(baudrates):
+        result = await probe_port(candidate, baudrate, max(timeout, boot_timeout) if index == 0 else timeout)
+        if result is not None:
+            return result
+    return None
+
+
+async def discover_printer(candidates=None, baudrates=BAUDRATES, timeout=1.0, cache=None, boot_timeout=2.5):
+    """Поиск принтера: сначала по кэшу, иначе одновременный опрос всех портов; побеждает первый ответивший.
+
+    Возвращает ProbeResult или None. Найденный опросом порт запоминается в cache.
+    """
+    if candidates is None:
+        candidates = list_candidates()
+    if not candidates:
+        return None
+
+    if cache is not None:
+        result = cache.lookup(candidates)
+        if result is not None:
+            return result
+
+    tasks = [asyncio.ensure_future(_probe_baudrates(candidate, baudrates, timeout, boot_timeout))
+             for candidate in candidates]
+    result = None
+    try:
+        pending = set(tasks)
+        while pending and result is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result() is not None:
+                    result = task.result()
+                    break
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Отменённые опросы должны успеть закрыть порты до подключения к найденному
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if result is not None and cache is not None:
+        cache.remember(result.candidate, result.baudrate, result.firmware)
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Поиск принтера на последовательных портах по ответу M115")
+    parser.add_argument('ports', nargs='*', help="порты для опроса (по умолчанию все USB-порты)")
+    parser.add_argument('--timeout', type=float, default=1.0, help="ожидание ответа на одной скорости, с")
+    parser.add_argument('--boot-timeout', type=float, default=2.5,
+                        help="ожидание на первой скорости, пока плата перезагружается после открытия порта, с")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать и не обновлять port_cache.json")
+    args = parser.parse_args()
+
+    port_candidates = [PortCandidate(port) for port in args.ports] or None
+    started = time.monotonic()
+    found = asyncio.run(discover_printer(port_candidates, BAUDRATES, args.timeout,
+                                         None if args.no_cache else PortCache(), args.boot_timeout))
+    print(f"{found} in {time.monotonic() - started:.2f} s" if found else "Printer not found")
@@ -0,0 +1,112 @@
+from itertools import islice
+
+
+class ModalState:
+    """Модальное состояние принтера, накопленное командами задания до заданной строки"""
+
+    def __init__(self):
+        self.absolute_positioning = True
+        self.absolute_extrusion = True
+        self.metric = True
+        self.feedrate = None
+        self.position = [0.0, 0.0, 0.0, 0.0]
+        self.hotend_temperature = None
+        self.bed_temperature = None
+        self.fan_speed = None
+        self.tool = None
+
+    def apply(self, command):
+        """Учёт одной разобранной команды ({'type': 'G1', 'parameters': {...}})"""
+        if not command:
+            return
+        code = command['type'].upper()
+        params = command['parameters']
+
+        if code in ('G0', 'G1', 'G2', 'G3'):
+            if isinstance(params.get('F'), float):
+                self.feedrate = params['F']
+            for index, axis in enumerate('XYZE'):
+                value = params.get(axis)
+                if not isinstance(value, float):
+                    continue
+                absolute = self.absolute_extrusion if axis == 'E' else self.absolute_positioning
+                self.position[index] = value if absolute else self.position[index] + value
+        elif code == 'G90':
+            self.absolute_positioning = self.absolute_extrusion = True
+        elif code == 'G91':
+            self.absolute_positioning = self.absolute_extrusion = False
+        elif code == 'M82':
+            self.absolute_extrusion = True
+        elif code == 'M83':
+            self.absolute_extrusion = False
+        elif code in ('G20', 'G21'):
+            self.metric = code == 'G21'
+        elif code == 'G92':
+            for index, axis in enumerate('XYZE'):
+                if isinstance(params.get(axis), float):
+                    self.position[index] = params[axis]
+        elif code == 'G28':
+            axes = [axis for axis in 'XYZ' if axis in params] or list('XYZ')
+            for axis in axes:
+                self.position['XYZ'.index(axis)] = 0.0
+        elif code in ('M104', 'M109'):
+            if isinstance(params.get('S'), float):
+                self.hotend_temperature = params['S']
+        elif code in ('M140', 'M190'):
+            if isinstance(params.get('S'), float):
+                self.bed_temperature = params['S']
+        elif code == 'M106':
+            speed = params.get('S', 255.0)
+            self.fan_speed = speed if isinstance(speed, float) else 255.0
+        elif code == 'M107':
+            self.fan_speed = 0.0
+        elif code[0] == 'T' and code[1:].isdigit():
+            self.tool = int(code[1:])
+
+
+def modal_state_at(gcode_commands, line_index):
+    """Состояние после выполнения строк задания [0, line_index)"""
+    state = ModalState()
+    for command_data in islice(gcode_commands, line_index):
+        state.apply(command_data.get('command'))
+    return state
+
+
+def build_resume_commands(state, home_xy=True, z_lift=2.0, travel_feedrate=3000):
+    """Команды восстановления перед продолжением задания с прерванной строки.
+
+    Нагрев до прежних температур, единицы и режимы координат, положение
+    экструдера. После переподключения по USB Marlin обычно перезапускается и
+    теряет координаты, поэтому при home_xy сопло поднимается, X и Y паркуются,
+    а Z принимается равной прежней высоте (ось Z не двигалась). Затем сопло
+    возвращается в точку остановки.
+    """
+    commands = []
+    if state.bed_temperature:
+        commands.append(f"M140 S{state.bed_temperature:g}")
+    if state.hotend_temperature:
+        commands.append(f"M104 S{state.hotend_temperature:g}")
+    if state.bed_temperature:
+        commands.append(f"M190 S{state.bed_temperature:g}")
+    if state.hotend_temperature:
+        commands.append(f"M109 S{state.hotend_temperature:g}")
+
+    commands.append("G21" if state.metric else "G20")
+    if state.tool is not None:
+        commands.append(f"T{state.tool}")
+
+    x, y, z, e = state.position
+    if home_xy:
+        commands.extend(["G91", f"G0 Z{z_lift:g}", "G90", "G28 X Y", f"G92 Z{z + z_lift:g}"])
+    commands.append("G90")
+    commands.append(f"G0 X{x:.3f} Y{y:.3f} F{travel_feedrate:g}")
+    commands.append(f"G0 Z{z:.3f}")
+    commands.append(f"G92 E{e:.5f}" if state.absolute_extrusion else "G92 E0")
+    commands.append("M82" if state.absolute_extrusion else "M83")
+    if state.fan_speed is not None:
+        commands.append(f"M106 S{state.fan_speed:g}" if state.fan_speed > 0 else "M107")
+    if state.feedrate:
+        commands.append(f"G1 F{state.feedrate:g}")
+    if not state.absolute_positioning:
+        commands.append("G91")
+    return commands
@@ -0,0 +1,312 @@
+import numpy as np
+
+
+AXES = 'xyze'
+# Ниже этой длины движение планировщиком отбрасывается (как в Marlin)
+MIN_MOVE_LENGTH = 1e-6
+# Скорость в начале и в конце задания, а также на развороте (MINIMUM_PLANNER_SPEED в Marlin), мм/с
+MINIMUM_PLANNER_SPEED = 0.05
+
+
+class PlannerLimits:
+    """Ограничения планировщика на начало задания; M203/M204/M205/M220 из файла меняют их по ходу.
+
+    Скорости в мм/с, ускорения в мм/с². junction_deviation > 0 включает
+    расчёт скорости на стыках по отклонению (Marlin JD), иначе — classic jerk.
+    """
+
+    def __init__(self, max_feedrate=None, max_acceleration=None, acceleration=1000.0, travel_acceleration=1000.0,
+                 retract_acceleration=1000.0, max_jerk=None, junction_deviation=0.0, min_feedrate=0.0,
+                 min_travel_feedrate=0.0):
+        self.max_feedrate = dict({'x': 500.0, 'y': 500.0, 'z': 5.0, 'e': 25.0}, **(max_feedrate or {}))
+        self.max_acceleration = dict({'x': 3000.0, 'y': 3000.0, 'z': 100.0, 'e': 10000.0}, **(max_acceleration or {}))
+        self.acceleration = acceleration
+        self.travel_acceleration = travel_acceleration
+        self.retract_acceleration = retract_acceleration
+        self.max_jerk = dict({'x': 10.0, 'y': 10.0, 'z': 0.3, 'e': 5.0}, **(max_jerk or {}))
+        self.junction_deviation = junction_deviation
+        self.min_feedrate = min_feedrate
+        self.min_travel_feedrate = min_travel_feedrate
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_config(cls, get_config):
+        """Ограничения из настроек printer.* (get_config(путь, по умолчанию))"""
+        return cls(get_config('printer.max_feedrate', None), get_config('printer.max_acceleration', None),
+                   get_config('printer.acceleration', 1000.0), get_config('printer.travel_acceleration', 1000.0),
+                   get_config('printer.retract_acceleration', 1000.0), get_config('printer.max_jerk', None),
+                   get_config('printer.junction_deviation', 0.0))
+
+
+class PrintTimeEstimate:
+    """Оценка времени печати: время каждого движения, нарастающий итог и время слоёв (с)"""
+
+    def __init__(self, move_times, elapsed, layer_times, lines, total):
+        self.move_times = move_times
+        self.elapsed = elapsed
+        self.layer_times = layer_times
+        self.lines = lines
+        self.total = total
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0, np.uint32), 0.0)
+
+    @classmethod
+    def from_move_times(cls, moves, move_times, total):
+        """Оценка из сохранённого времени движений (кэш анализа)"""
+        layer_times = np.add.reduceat(move_times, moves.layer_starts) if moves.layer_count else np.zeros(0)
+        return cls(move_times, np.cumsum(move_times), layer_times, np.asarray(moves.moves['line']), total)
+
+    def time_at_line(self, line_number):
+        """Время от начала задания до конца строки файла line_number (с 1)"""
+        index = int(np.searchsorted(self.lines, line_number, side='right'))
+        return float(self.elapsed[index - 1]) if index else 0.0
+
+    def time_after_line(self, line_number):
+        return self.total - self.time_at_line(line_number)
+
+    def times_at_lines(self, line_numbers):
+        """time_at_line для массива номеров строк"""
+        index = np.searchsorted(self.lines, line_numbers, side='right')
+        return np.where(index > 0, self.elapsed[np.maximum(index - 1, 0)], 0.0) if len(self.elapsed) else \
+            np.zeros(len(line_numbers))
+
+
+class PrintProgress:
+    """Прогресс и оставшееся время печати по предсказанному времени подтверждённых строк.
+
+    command_times[i] — предсказанное время от начала задания до конца
+    команды i. Подтверждение значит лишь, что движение встало в очередь
+    планировщика, поэтому выполненными считаются подтверждённые команды
+    без последних buffered. Оставшееся время поправляется отношением
+    фактически прошедшего времени к предсказанному; часы запускаются на
+    первой команде с движением, чтобы нагрев в начале не искажал отношение.
+    """
+
+    # Пока предсказано меньше, поправка неустойчива и не применяется (с)
+    MIN_CORRECTION_TIME = 60.0
+    MIN_RATIO = 0.25
+    MAX_RATIO = 4.0
+
+    def __init__(self, command_times, total, start_index=0, buffered=0):
+        self.command_times = command_times
+        self.total = total
+        self.start_index = start_index
+        self.buffered = buffered
+        self.clock_start = None
+        self.predicted_start = 0.0
+        self.paused_at = None
+        self.paused_time = 0.0
+
+    def predicted(self, done):
+        """Предсказанное время выполнения первых done команд задания"""
+        return float(self.command_times[done - 1]) if done > 0 else 0.0
+
+    def pause(self, now):
+        if self.paused_at is None:
+            self.paused_at = now
+
+    def resume(self, now):
+        if self.paused_at is not None:
+            self.paused_time += now - self.paused_at
+            self.paused_at = None
+
+    def update(self, acknowledged, now):
+        """(процент, прошло с, осталось с) после подтверждения acknowledged команд"""
+        predicted = self.predicted(max(acknowledged - self.buffered, self.start_index))
+        if self.clock_start is None and predicted > self.predicted(self.start_index):
+            self.clock_start = now
+            self.predicted_start = predicted
+        observed = 0.0
+        if self.clock_start is not None:
+            observed = (self.paused_at if self.paused_at is not None else now) - self.clock_start - self.paused_time
+
+        ratio = 1.0
+        predicted_done = predicted - self.predicted_start
+        if predicted_done >= self.MIN_CORRECTION_TIME:
+            ratio = min(max(observed / predicted_done, self.MIN_RATIO), self.MAX_RATIO)
+        percent = 100.0 * predicted / self.total if self.total > 0 else 0.0
+        return percent, observed, max(self.total - predicted, 0.0) * ratio
+
+
+def format_duration(seconds):
+    """'Ч:ММ:СС' для времени в секундах"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def _series(count, initial, indices, values):
+    """Значение параметра для каждого движения: initial, затем values с движений indices (NaN — без изменения)"""
+    valid = ~np.isnan(values)
+    indices, values = indices[valid], values[valid]
+    keep = indices < count
+    position = np.zeros(count, np.int64)
+    position[indices[keep]] = np.flatnonzero(keep) + 1
+    np.maximum.accumulate(position, out=position)
+    return np.concatenate(([initial], values[keep]))[position]
+
+
+def _settings(moves, limits):
+    """Ограничения, действующие для каждого движения, с учётом команд из файла"""
+    commands = moves.commands
+    count = len(moves)
+    # Команда действует с первого движения после её строки
+    applies = np.searchsorted(moves.moves['line'], commands['line'], side='right')
+
+    def changes(code, letter, initial):
+        selected = commands['code'] == code
+        return _series(count, initial, applies[selected], commands[letter][selected])
+
+    settings = {}
+    for axis in AXES:
+        settings[f'feedrate_{axis}'] = changes('M203', axis, limits.max_feedrate[axis])
+        settings[f'jerk_{axis}'] = changes('M205', axis, limits.max_jerk[axis])
+        settings[f'acceleration_{axis}'] = limits.max_acceleration[axis]
+    # M204 S задаёт ускорение печати и перемещений, P/T — по отдельности
+    legacy = commands['code'] == 'M204'
+    both = np.where(np.isnan(commands['p']), commands['s'], commands['p'])
+    settings['acceleration'] = _series(count, limits.acceleration, applies[legacy], both[legacy])
+    both = np.where(np.isnan(commands['t']), commands['s'], commands['t'])
+    settings['travel_acceleration'] = _series(count, limits.travel_acceleration, applies[legacy], both[legacy])
+    settings['retract_acceleration'] = changes('M204', 'r', limits.retract_acceleration)
+    settings['junction_deviation'] = changes('M205', 'j', limits.junction_deviation)
+    settings['min_feedrate'] = changes('M205', 's', limits.min_feedrate)
+    settings['min_travel_feedrate'] = changes('M205', 't', limits.min_travel_feedrate)
+    settings['feedrate_percent'] = changes('M220', 's', 100.0)
+    return settings, applies
+
+
+def _start_positions(moves, applies):
+    """Положение перед каждым движением: конец предыдущего, с поправкой на G92/G28 между ними"""
+    count = len(moves)
+    start = np.zeros((count, 4))
+    for index, axis in enumerate(AXES):
+        values = moves.moves[axis].astype(np.float64)
+        start[1:, index] = values[:-1]
+    commands = moves.commands
+    setting = (commands['code'] == 'G92') | (commands['code'] == 'G28')
+    for index, axis in enumerate(AXES):
+        selected = setting & ~np.isnan(commands[axis]) & (applies < count)
+        # Несколько команд между движениями: по порядку строк, последняя побеждает
+        start[applies[selected], index] = commands[axis][selected]
+    return start
+
+
+def _dwell_times(moves, applies):
+    commands = moves.commands
+    dwell = commands['code'] == 'G4'
+    seconds = np.where(np.isnan(commands['p']), np.nan_to_num(commands['s']), commands['p'] / 1000.0)
+    times = np.zeros(len(moves) + 1)
+    np.add.at(times, applies[dwell], seconds[dwell])
+    return times
+
+
+def _trapezoid_times(length, entry, exit, cruise, acceleration):
+    """Время движений с разгоном от entry, участком cruise и торможением до exit (векторно)"""
+    entry = np.minimum(entry, cruise)
+    exit = np.minimum(exit, cruise)
+    accelerate = (cruise ** 2 - entry ** 2) / (2 * acceleration)
+    decelerate = (cruise ** 2 - exit ** 2) / (2 * acceleration)
+    # Разгон и торможение не помещаются — треугольный профиль с меньшей пиковой скоростью
+    triangle = accelerate + decelerate > length
+    peak = np.where(triangle, np.sqrt((2 * acceleration * length + entry ** 2 + exit ** 2) / 2), cruise)
+    accelerate = np.where(triangle, (peak ** 2 - entry ** 2) / (2 * acceleration), accelerate)
+    decelerate = np.where(triangle, (peak ** 2 - exit ** 2) / (2 * acceleration), decelerate)
+    cruise_length = np.maximum(length - accelerate - decelerate, 0.0)
+    return (peak - entry) / acceleration + (peak - exit) / acceleration + cruise_length / peak
+
+
+def estimate_print_time(moves, limits=None):
+    """Оценка времени печати MoveArray по модели планировщика прошивки, векторно по всем движениям.
+
+    Для каждого движения считаются номинальная скорость (F с учётом M220,
+    M203 и минимальных скоростей M205) и ускорение (M204 P/T/R, ограниченное
+    по осям), скорости на стыках (junction deviation или classic jerk), затем
+    проходы планировщика назад и вперёд и время трапеций. Проходы сводятся
+    к накопленному минимуму в квадратах скоростей: v²(i) <= v²(j) + 2·a·путь
+    между ними. Дуги G2/G3 считаются хордой. Паузы G4 входят в итог.
+    """
+    limits = limits or PlannerLimits()
+    count = len(moves)
+    if not count:
+        return PrintTimeEstimate.empty()
+
+    settings, applies = _settings(moves, limits)
+    start = _start_positions(moves, applies)
+    end = np.column_stack([moves.moves[axis].astype(np.float64) for axis in AXES])
+    delta = end - start
+    xyz_length = np.sqrt((delta[:, :3] ** 2).sum(axis=1))
+    extruder_only = xyz_length < MIN_MOVE_LENGTH
+    length = np.where(extruder_only, np.abs(delta[:, 3]), xyz_length)
+    planned = np.flatnonzero(length >= MIN_MOVE_LENGTH)
+
+    length = length[planned]
+    delta = delta[planned]
+    extruder_only = extruder_only[planned]
+    extruding = delta[:, 3] != 0
+
+    # Номинальная скорость: F (мм/мин) с множителем M220 и минимумом M205, затем пределы по осям
+    feedrate = moves.moves['f'][planned].astype(np.float64) / 60.0 * settings['feedrate_percent'][planned] / 100.0
+    feedrate = np.where(feedrate > 0, feedrate, np.inf)
+    feedrate = np.maximum(feedrate, np.where(extruding, settings['min_feedrate'][planned],
+                                             settings['min_travel_feedrate'][planned]))
+    acceleration = np.where(extruder_only, settings['retract_acceleration'][planned],
+                            np.where(extruding, settings['acceleration'][planned],
+                                     settings['travel_acceleration'][planned]))
+    with np.errstate(divide='ignore'):
+        for index, axis in enumerate(AXES):
+            ratio = length / np.abs(delta[:, index])
+            feedrate = np.minimum(feedrate, settings[f'feedrate_{axis}'][planned] * ratio)
+            acceleration = np.minimum(acceleration, settings[f'acceleration_{axis}'] * ratio)
+
+    unit = delta / length[:, None]
+    # Скорость на стыке i — между движениями i-1 и i; в начале и в конце задания — минимальная
+    junction = _junction_speeds(unit, feedrate, acceleration, settings, planned)
+
+    # Проходы планировщика: e(i) <= e(j) + 2·a·L между стыками j и i в обе стороны
+    reach = np.concatenate(([0.0], np.cumsum(2 * acceleration * length)))
+    squared = junction ** 2
+    backward = np.minimum.accumulate((squared + reach)[::-1])[::-1] - reach
+    forward = reach + np.minimum.accumulate(backward - reach)
+    speed = np.sqrt(np.maximum(forward, 0.0))
+
+    times = np.zeros(count)
+    times[planned] = _trapezoid_times(length, speed[:-1], speed[1:], feedrate, acceleration)
+
+    dwell = _dwell_times(moves, applies)
+    times += dwell[:-1]
+    return PrintTimeEstimate.from_move_times(moves, times, float(times.sum() + dwell[-1]))
+
+
+def _junction_speeds(unit, feedrate, acceleration, settings, planned):
+    count = len(unit)
+    speeds = np.full(count + 1, MINIMUM_PLANNER_SPEED)
+    if count < 2:
+        return speeds
+    previous, current = unit[:-1], unit[1:]
+    limit = np.minimum(feedrate[:-1], feedrate[1:])
+
+    deviation = settings['junction_deviation'][planned][1:]
+    # Junction deviation: скорость, при которой центростремительное ускорение на дуге отклонения равно a
+    cosine = np.clip(-(previous[:, :3] * current[:, :3]).sum(axis=1), -1.0, 1.0)
+    sine = np.sqrt(np.maximum(0.5 * (1.0 - cosine), 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        by_deviation = np.sqrt(acceleration[1:] * deviation * sine / (1.0 - sine))
+    by_deviation = np.where(cosine < -0.999999, limit, np.where(cosine > 0.999999, MINIMUM_PLANNER_SPEED,
+                                                                  by_deviation))
+
+    # Classic jerk: скачок скорости по каждой оси при общей скорости v не больше jerk оси
+    by_jerk = limit.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for index, axis in enumerate(AXES):
+            jump = np.abs(current[:, index] - previous[:, index]) * limit
+            jerk = settings[f'jerk_{axis}'][planned][1:]
+            by_jerk = np.where(jump > jerk, np.minimum(by_jerk, limit * jerk / jump), by_jerk)
+
+    speeds[1:-1] = np.minimum(np.where(deviation > 0, by_deviation, by_jerk), limit)
+    speeds[1:-1] = np.maximum(speeds[1:-1], MINIMUM_PLANNER_SPEED)
+    return speeds
@@ -0,0 +1,448 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from core.command_lanes import (BULK, IMMEDIATE, INTERACTIVE, BLOCKING_COMMANDS, NO_ACK_COMMANDS, CommandLanes,
+                                lane_for_command)
+from core.gcode_tokenizer import command_code
+from core.line_splitter import LineSplitter
+from core.line_transport import parse_resend_request
+from core.response_router import ResponseRouter
+
+
+class PrinterLink:
+    """Ядро обмена с прошивкой поверх асинхронного транспорта.
+
+    Чтение, разбор ответов, окно неподтверждённых команд, нумерация строк и Resend
+    выполняются двумя задачами одного цикла событий, без отдельных потоков на порт.
+    Методы send и wake можно вызывать из любого потока. Команды отправляются
+    по приоритету очередей CommandLanes; аварийные пишутся в порт раньше всех.
+
+    Третья задача следит за связью: при молчании прошивки дольше heartbeat_interval
+    отправляется M105, а если неподтверждённые команды ждут дольше ack_timeout,
+    строки повторяются (или M105 вне окна без нумерации); после max_stall_recoveries
+    безуспешных попыток соединение закрывается как потерянное. Пока первой в окне
+    стоит команда из BLOCKING_COMMANDS (нагрев, G4, M400, G28, G29), 'ok' придёт
+    только по её завершении: признаком жизни служат и отчёты температуры, строки
+    не повторяются, а соединение закрывается лишь после blocking_timeout молчания.
+
+    В сеансе без кадрирования (begin_raw_session) очереди команд приостанавливаются:
+    байты пишутся как есть, а принятые строки получает только слушатель сеанса.
+    Так работает двоичная передача файлов на SD-карту.
+    """
+
+    SUPERVISION_PERIOD = 0.5
+
+    def __init__(self, transport, flow_control, line_transport=None, response_router=None):
+        self.transport = transport
+        self.flow_control = flow_control
+        self.line_transport = line_transport
+        self.response_router = response_router or ResponseRouter()
+        self.line_splitter = LineSplitter()
+        self.lanes = CommandLanes()
+        self.emergency_listeners = []
+        self.resend_requests = deque()
+        self.resend_queue = deque()
+        self.raw_writes = deque()
+        self.raw_mode = False
+        self.raw_listener = None
+        self.skip_acks = 0
+        self.last_error = None
+        self.reset_pending = False
+        self.ack_timeout = 10.0
+        self.blocking_timeout = 600.0
+        self.heartbeat_interval = 10.0
+        self.max_stall_recoveries = 3
+        self.last_receive_time = time.monotonic()
+        self.last_ack_time = self.last_receive_time
+        self.stall_recoveries = 0
+        self.stalls = 0
+        self.line_listeners = []
+        self.close_listeners = []
+        self.is_open = False
+        self.closing = False
+        self.loop = None
+        self._wakeup = None
+        self._progress = None
+        self._wake_scheduled = False
+        self._tasks = []
+
+    @property
+    def queued(self):
+        return len(self.lanes)
+
+    @property
+    def stream_queued(self):
+        """Есть ли в очереди команды, которые должны уйти раньше следующей строки задания"""
+        return self.lanes.has_pending(BULK) or self.lanes.has_pending(INTERACTIVE)
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Event()
+        await self.transport.open()
+        self.is_open = True
+        self.closing = False
+        self.last_receive_time = self.last_ack_time = time.monotonic()
+        self._tasks = [
+            self.loop.create_task(self._read_loop()),
+            self.loop.create_task(self._write_loop()),
+            self.loop.create_task(self._supervise_loop())
+        ]
+
+    async def close(self, error=None):
+        if self.closing:
+            return
+        self.closing = True
+        self.is_open = False
+
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        for task in self._tasks:
+            if task is not current:
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._tasks = []
+
+        try:
+            await self.transport.close()
+        except Exception as e:
+            print(f"Transport close error: {e}")
+
+        for item in self.lanes.drain():
+            future = item[2]
+            if future is not None:
+                future.cancel()
+        self.resend_requests.clear()
+        self.resend_queue.clear()
+        self.raw_writes.clear()
+        self.flow_control.reset()
+        if self._progress is not None:
+            self._progress.set()
+
+        for listener in list(self.close_listeners):
+            try:
+                listener(error)
+            except Exception as e:
+                print(f"Close listener error: {e}")
+
+    def send(self, command, tag=None, future=None, lane=INTERACTIVE):
+        """Постановка команды в очередь записи; future (если есть) получит ответ прошивки.
+
+        M112, M410, M108 и M876 всегда попадают в очередь immediate.
+        """
+        if not self.is_open:
+            if future is not None:
+                future.cancel()
+            return False
+        self.lanes.put(lane_for_command(command, lane), command, tag, future)
+        self.wake()
+        return True
+
+    async def request(self, command, tag=None, lane=INTERACTIVE):
+        """Отправка команды из кода asyncio с ожиданием всех строк ответа вплоть до 'ok'"""
+        future = Future()
+        if not self.send(command, tag, future, lane):
+            raise ConnectionError("Printer link is closed")
+        return await asyncio.wrap_future(future)
+
+    async def wait_for_room(self):
+        """Ожидание момента, когда очередь записи пуста и в окне прошивки есть место"""
+        while self.is_open and (self.stream_queued or not self.flow_control.has_room()):
+            self._progress.clear()
+            await self._progress.wait()
+        return self.is_open
+
+    def wake(self):
+        """Пробуждение задачи записи из любого потока (новая команда, изменение окна)"""
+        if self.loop is None or self._wake_scheduled:
+            return
+        self._wake_scheduled = True
+        self.loop.call_soon_threadsafe(self._on_wake)
+
+    def _on_wake(self):
+        self._wake_scheduled = False
+        self._wakeup.set()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                data = await self.transport.read()
+                lines = self.line_splitter.feed(data)
+                for line in lines:
+                    self._handle_line(line)
+                if lines:
+                    self._wakeup.set()
+                    self._progress.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not self.closing:
+                print(f"Read error: {e}")
+                self.loop.create_task(self.close(e))
+
+    def _handle_line(self, data):
+        self.last_receive_time = time.monotonic()
+        if self.raw_listener is not None:
+            self.raw_listener(data)
+            return
+        kind = self.response_router.classify(data)
+        if kind in ('ok', 'resend', 'busy') or (kind == 'temperature' and self._blocking_pending()):
+            # Автоотчёты температуры приходят и при потерянной строке: признак жизни окна — ответы на команды,
+            # а во время нагрева и других долгих команд — и отчёты температуры (Marlin шлёт их вместо busy)
+            self.last_ack_time = self.last_receive_time
+            self.stall_recoveries = 0
+        if kind == 'ok':
+            if self.skip_acks > 0:
+                self.skip_acks -= 1
+            else:
+                self.flow_control.on_ack(data)
+        elif kind == 'resend':
+            resend_line = parse_resend_request(data)
+            if resend_line is not None:
+                self._on_resend_request(resend_line, self.last_error)
+                self.last_error = None
+        elif kind in ('busy', 'wait'):
+            self.flow_control.on_firmware_signal(kind)
+        else:
+            if kind == 'error':
+                self.last_error = data
+            self.flow_control.add_reply_line(data)
+
+        self.response_router.dispatch(data, kind)
+        for listener in self.line_listeners:
+            try:
+                listener(data)
+            except Exception as e:
+                print(f"Line listener error: {e}")
+
+    def _on_resend_request(self, line_number, error):
+        # 'ok' после Resend относится к отвергнутой строке, а не к следующей в окне
+        self.skip_acks += 1
+        if not self.line_transport:
+            print(f"Resend requested for line {line_number}, but line numbering is disabled")
+            return
+
+        if self.reset_pending and self.flow_control.has_line(0):
+            # Пока M110 не подтверждена, других нумерованных строк в пути нет: отвергнута сама M110
+            line_number = 0
+
+        if not self.line_transport.accept_resend(line_number, error):
+            return
+
+        self.flow_control.on_firmware_signal('resend')
+        self.resend_requests.append(line_number)
+
+    def _rewind_for_resend(self):
+        """Откат к запрошенной строке: повторная отправка из истории без участия интерфейса"""
+        rewound = False
+        while self.resend_requests:
+            line_number = self.resend_requests.popleft()
+            lines = self.line_transport.lines_from(line_number) if self.line_transport else None
+            if lines is None:
+                print(f"Cannot resend line {line_number}: not in history")
+                continue
+
+            self.flow_control.discard_from(line_number)
+            self.resend_queue.clear()
+            self.resend_queue.extend(lines)
+            rewound = True
+        return rewound
+
+    def _frame_command(self, command, tag, future):
+        if not self.line_transport:
+            return None, command
+        if command.upper().startswith('M110'):
+            return 0, self.line_transport.reset(tag, future)
+        return self.line_transport.frame(command, tag, future)
+
+    def _next_line(self):
+        """Следующая строка: повтор из истории после Resend, затем interactive, затем bulk"""
+        if self.resend_queue:
+            return self.resend_queue.popleft(), None, None
+        if self.raw_mode:
+            return None, None, None
+        while True:
+            item = self.lanes.pop((INTERACTIVE, BULK))
+            if item is None:
+                return None, None, None
+            command, tag, future, lane, queued_at = item
+            if command:
+                line_number, text = self._frame_command(command, tag, future)
+                return (line_number, text, tag, future), lane, queued_at
+
+    async def _write_immediate(self):
+        """Запись аварийных команд без ожидания места в окне и без номера строки, вперёд любых ожидающих строк.
+        Место для них окно держит в запасе (IMMEDIATE_RESERVE_LINES/BYTES в command_lanes)"""
+        while True:
+            item = self.lanes.pop((IMMEDIATE,))
+            if item is None:
+                return
+            command, tag, future, lane, queued_at = item
+            data = (command.strip() + '\n').encode('utf-8')
+            code = command_code(command)
+            if code not in NO_ACK_COMMANDS:
+                # Прошивка всё равно ответит 'ok', когда строка дойдёт до головы её очереди
+                self.flow_control.on_sent(command, len(data), tag, None, future)
+            elif future is not None:
+                future.set_result([])
+
+            await self.transport.write(data)
+            latency = self.lanes.record_written(lane, queued_at)
+            for listener in list(self.emergency_listeners):
+                try:
+                    listener(code, latency)
+                except Exception as e:
+                    print(f"Emergency listener error: {e}")
+
+    async def _wait_wakeup(self):
+        self._wakeup.clear()
+        await self._wakeup.wait()
+
+    async def _write_loop(self):
+        current = None
+        lane = queued_at = None
+        while True:
+            try:
+                if self.lanes.has_pending(IMMEDIATE):
+                    await self._write_immediate()
+                while self.raw_writes:
+                    await self.transport.write(self.raw_writes.popleft())
+
+                if self.resend_requests and self._rewind_for_resend():
+                    current = None
+
+                if current is None:
+                    current, lane, queued_at = self._next_line()
+                    if current is None:
+                        await self._wait_wakeup()
+                        continue
+
+                line_number, text, tag, future = current
+                data = (text + '\n').encode('utf-8')
+                # Строка уходит в порт только когда помещается в окно: по числу команд или по байтам RX-буфера
+                if not self.flow_control.has_room(len(data)):
+                    await self._wait_wakeup()
+                    continue
+                # Нумерованные строки ждут подтверждения M110, иначе её отказ неотличим от отказа строки 1
+                if self.reset_pending and line_number:
+                    if self.flow_control.has_line(0):
+                        await self._wait_wakeup()
+                        continue
+                    self.reset_pending = False
+
+                # Запись в окно до записи в порт: ответ может прийти раньше, чем write() вернёт управление
+                self.flow_control.on_sent(text, len(data), tag, line_number, future)
+                if self.line_transport and line_number is not None:
+                    self.line_transport.on_written(line_number)
+                    if line_number == 0:
+                        self.reset_pending = True
+                current = None
+                self._progress.set()
+
+                await self.transport.write(data)
+                if lane is not None:
+                    self.lanes.record_written(lane, queued_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Write error: {e}")
+                self.loop.create_task(self.close(e))
+                return
+
+    async def _supervise_loop(self):
+        while True:
+            await asyncio.sleep(self.SUPERVISION_PERIOD)
+            now = time.monotonic()
+            silence = now - self.last_receive_time
+
+            if self.raw_listener is not None:
+                # Подтверждения в сеансе без кадрирования отслеживает его владелец
+                continue
+            if self.flow_control.in_flight:
+                ack_silence = now - self.last_ack_time
+                if self._blocking_pending():
+                    # Прошивка выполняет принятую команду: повтор строк вызвал бы лавину Resend
+                    if self.blocking_timeout > 0 and ack_silence >= self.blocking_timeout:
+                        self._close_stalled(ack_silence)
+                        return
+                    continue
+                timeout = self.ack_timeout * (self.stall_recoveries + 1)
+                if self.ack_timeout > 0 and ack_silence >= timeout:
+                    if self.stall_recoveries >= self.max_stall_recoveries:
+                        self._close_stalled(ack_silence)
+                        return
+                    self.stall_recoveries += 1
+                    self.stalls += 1
+                    self._recover_stall()
+            elif self.heartbeat_interval > 0 and silence >= self.heartbeat_interval and not self.queued:
+                # Подтверждение M105 продлевает молчание; его отсутствие обработает ветка выше
+                self.last_receive_time = self.last_ack_time = now
+                self.send("M105")
+
+    def _blocking_pending(self):
+        """Первая неподтверждённая команда подтверждается только по завершении (нагрев, G4, G28...)"""
+        command = self.flow_control.oldest_command()
+        return command is not None and command_code(command) in BLOCKING_COMMANDS
+
+    def _close_stalled(self, silence):
+        error = ConnectionError(f"Printer is not responding for {silence:.1f} s")
+        print(f"Link stalled: {error}")
+        self.loop.create_task(self.close(error))
+
+    async def begin_raw_session(self, listener):
+        """Приостановка очередей и передача принятых строк listener, когда все отправленные команды подтверждены"""
+        self.raw_mode = True
+        while self.is_open and (self.flow_control.in_flight or self.resend_queue or self.resend_requests):
+            self._progress.clear()
+            await self._progress.wait()
+        if not self.is_open:
+            self.raw_mode = False
+            raise ConnectionError("Printer link is closed")
+        self.raw_listener = listener
+
+    def end_raw_session(self):
+        """Возврат к обычному обмену (из любого потока)"""
+        def finish():
+            self.raw_listener = None
+            self.raw_mode = False
+            self.last_receive_time = self.last_ack_time = time.monotonic()
+            self._wakeup.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(finish)
+
+    def write_raw(self, data):
+        """Запись байт вне очередей и окна (из любого потока)"""
+        def queue():
+            self.raw_writes.append(bytes(data))
+            self._wakeup.set()
+        if self.loop is not None and self.is_open:
+            self.loop.call_soon_threadsafe(queue)
+
+    def _recover_stall(self):
+        """Строки или их подтверждения потеряны: повтор с первой неподтверждённой строки"""
+        self.flow_control.on_firmware_signal('timeout')
+        line_number = self.flow_control.first_line_number()
+        if self.line_transport and line_number is not None:
+            print(f"No acknowledgement for {self.ack_timeout:.1f} s, resending from line {line_number}")
+            self.line_transport.force_rewind(line_number)
+            self.resend_requests.append(line_number)
+            self._wakeup.set()
+            return
+
+        # Без номеров строк повторять нельзя: 'ok' на M105 вне окна освобождает потерянную команду
+        print(f"No acknowledgement for {self.ack_timeout:.1f} s, sending M105")
+        self.raw_writes.append(b'M105\n')
+        self._wakeup.set()
+
+    def get_stats(self):
+        stats = self.flow_control.get_stats()
+        stats['queued'] = self.queued
+        stats['stalls'] = self.stalls
+        stats['lanes'] = self.lanes.get_stats()
+        return stats
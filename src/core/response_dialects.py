@@ -0,0 +1,72 @@
+class ResponseDialect:
+    """Особенности ответов конкретной прошивки: префиксы строк и имена нагревателей.
+
+    Базовый класс описывает Marlin; диалекты других прошивок переопределяют
+    только отличающиеся атрибуты и регистрируются в DIALECTS.
+    """
+
+    name = 'marlin'
+    # Подстроки FIRMWARE_NAME из ответа M115, по которым диалект выбирается автоматически
+    firmware_names = ('marlin',)
+
+    ok_prefixes = ('ok',)
+    error_prefixes = ('error', '!!')
+    resend_prefixes = ('resend', 'rs ')
+    busy_prefixes = ('echo:busy', 'busy:')
+    echo_prefixes = ('echo:',)
+    sd_status_prefixes = ('sd printing byte', 'not sd printing', 'done printing file')
+    # Слова, после которых в отчёте о позиции идут внутренние счётчики, а не координаты
+    position_terminators = (' Count ',)
+
+    heater_names = {
+        'T': 'extruder', 'T0': 'extruder', 'T1': 'extruder1', 'T2': 'extruder2', 'T3': 'extruder3',
+        'B': 'bed', 'C': 'chamber', 'P': 'probe', 'L': 'board', 'R': 'redundant'
+    }
+    power_names = {
+        '@': 'extruder', '@0': 'extruder', '@1': 'extruder1', '@2': 'extruder2', '@3': 'extruder3',
+        'B@': 'bed', 'C@': 'chamber'
+    }
+    position_axes = {'X': 0, 'Y': 1, 'Z': 2, 'E': 3}
+
+    def matches_firmware(self, firmware_name):
+        firmware_name = (firmware_name or '').lower()
+        return any(name in firmware_name for name in self.firmware_names)
+
+
+class KlipperDialect(ResponseDialect):
+    """Klipper через последовательный порт (klippy pseudo-tty): '!!' — ошибки, '//' — сообщения"""
+
+    name = 'klipper'
+    firmware_names = ('klipper',)
+
+    error_prefixes = ('!!', 'error')
+    busy_prefixes = ()
+    echo_prefixes = ('//', 'echo:')
+
+
+class RepRapFirmwareDialect(ResponseDialect):
+    """RepRapFirmware (Duet) в режиме эмуляции Marlin: предупреждения — не ошибки, позиция с блоками Count/Machine"""
+
+    name = 'reprapfirmware'
+    firmware_names = ('reprapfirmware', 'rrf')
+
+    error_prefixes = ('error:',)
+    busy_prefixes = ()
+    echo_prefixes = ('echo:', 'warning:')
+    position_terminators = (' Count ', ' Machine ')
+    position_axes = {'X': 0, 'Y': 1, 'Z': 2, 'E': 3, 'E0': 3}
+
+
+DIALECTS = {dialect.name: dialect for dialect in (ResponseDialect(), KlipperDialect(), RepRapFirmwareDialect())}
+
+
+def get_dialect(name):
+    return DIALECTS.get((name or '').lower(), DIALECTS['marlin'])
+
+
+def dialect_for_firmware(firmware_name):
+    """Диалект по FIRMWARE_NAME из ответа M115; неизвестные прошивки разбираются как Marlin"""
+    for dialect in DIALECTS.values():
+        if dialect is not DIALECTS['marlin'] and dialect.matches_firmware(firmware_name):
+            return dialect
+    return DIALECTS['marlin']
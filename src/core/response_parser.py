@@ -0,0 +1,258 @@
+import re
+import time
+
+from core.response_dialects import ResponseDialect, get_dialect
+
+
+# Первое поле строки без префикса: достаточно для классификации без полного разбора
+FIRST_FIELD_PATTERN = re.compile(r'(?:^|\s)(T\d?|B|C|X):\s*-?\d')
+RESEND_NUMBER_PATTERN = re.compile(r'(\d+)')
+
+
+class ResponseRecord:
+    """Результат разбора строки ответа; один экземпляр переиспользуется парсером для каждой строки"""
+
+    __slots__ = ('kind', 'line', 'temperatures', 'power', 'position', 'line_number')
+
+    def __init__(self):
+        self.temperatures = {}  # нагреватель -> (текущая, целевая или None)
+        self.power = {}  # нагреватель -> мощность ШИМ
+        self.position = [None, None, None, None]  # X, Y, Z, E
+        self.clear()
+
+    def clear(self):
+        self.kind = 'other'
+        self.line = ''
+        self.temperatures.clear()
+        self.power.clear()
+        self.position[:] = (None, None, None, None)
+        self.line_number = None
+
+    @property
+    def has_position(self):
+        return self.position[0] is not None and self.position[1] is not None and self.position[2] is not None
+
+
+class ResponseParser:
+    """Однопроходный разбор строк ответа прошивки с диалектами Marlin, Klipper и RepRapFirmware.
+
+    classify() определяет тип строки по префиксу и используется в потоке чтения
+    для каждой строки; parse() дополнительно извлекает все поля за один проход
+    по токенам и заполняет переиспользуемую запись вместо создания новых объектов.
+    """
+
+    def __init__(self, dialect=None):
+        self.dialect = None
+        self.set_dialect(dialect)
+        self.record = ResponseRecord()
+
+    def set_dialect(self, dialect):
+        if not isinstance(dialect, ResponseDialect):
+            dialect = get_dialect(dialect)
+        self.dialect = dialect
+        # Префиксы сгруппированы по первому символу; порядок внутри группы важен:
+        # 'echo:busy' должен распознаваться раньше 'echo:'
+        self.prefixes = {}
+        for kind, prefixes in (
+            ('ok', dialect.ok_prefixes),
+            ('error', dialect.error_prefixes),
+            ('resend', dialect.resend_prefixes),
+            ('busy', dialect.busy_prefixes),
+            ('sd_status', dialect.sd_status_prefixes),
+            ('echo', dialect.echo_prefixes),
+            ('wait', ('wait',))
+        ):
+            for prefix in prefixes:
+                self.prefixes.setdefault(prefix[0], []).append((kind, prefix))
+
+    def _classify_prefix(self, line):
+        if line == 'ok':
+            return 'ok'
+        candidates = self.prefixes.get(line[:1].lower())
+        if candidates:
+            lower = line[:24].lower()
+            for kind, prefix in candidates:
+                if lower.startswith(prefix):
+                    if kind == 'wait' and lower != 'wait':
+                        continue
+                    return kind
+        return None
+
+    def classify(self, line):
+        """Тип строки: ok, error, resend, busy, wait, temperature, position, sd_status, echo или other"""
+        line = line.lstrip()
+        kind = self._classify_prefix(line)
+        if kind is not None:
+            return kind
+        match = FIRST_FIELD_PATTERN.search(line)
+        if match:
+            return 'position' if match.group(1) == 'X' else 'temperature'
+        return 'other'
+
+    def payload_kind(self, line):
+        """Тип данных после 'ok' ("ok T:..." в ответ на M105) или None"""
+        match = FIRST_FIELD_PATTERN.search(line, 2)
+        if match:
+            return 'position' if match.group(1) == 'X' else 'temperature'
+        return None
+
+    def parse(self, line, record=None):
+        """Разбор строки в запись (по умолчанию — общую запись парсера, действительную до следующего вызова)"""
+        if record is None:
+            record = self.record
+        record.clear()
+        line = line.strip()
+        record.line = line
+
+        kind = self._classify_prefix(line)
+        if line == 'ok':
+            pass
+        elif kind == 'resend':
+            match = RESEND_NUMBER_PATTERN.search(line)
+            record.line_number = int(match.group(1)) if match else None
+        elif kind is None or kind == 'ok':
+            self._parse_fields(line, record)
+            if kind is None:
+                if record.temperatures:
+                    kind = 'temperature'
+                elif record.position[0] is not None:
+                    kind = 'position'
+                else:
+                    kind = 'other'
+        record.kind = kind
+        return record
+
+    def _parse_fields(self, line, record):
+        dialect = self.dialect
+        for terminator in dialect.position_terminators:
+            index = line.find(terminator)
+            if index >= 0:
+                line = line[:index]
+
+        heater_names = dialect.heater_names
+        power_names = dialect.power_names
+        position_axes = dialect.position_axes
+        temperatures = record.temperatures
+        position = record.position
+        if '/' in line:
+            line = line.replace(' /', '/').replace('/ ', '/')
+        # Один проход по полям "КЛЮЧ:текущее[/целевое]"
+        for token in line.split():
+            key, _, value = token.partition(':')
+            try:
+                if key in heater_names:
+                    current, _, target = value.partition('/')
+                    temperatures[heater_names[key]] = (float(current), float(target) if target else None)
+                elif key in position_axes:
+                    position[position_axes[key]] = float(value)
+                elif key in power_names:
+                    record.power[power_names[key]] = int(float(value))
+            except ValueError:
+                continue
+
+
+LEGACY_TEMPERATURE_PATTERN = re.compile(r'T:\s*([\d.]+)\s*/\s*([\d.]+)')
+LEGACY_BED_PATTERN = re.compile(r'B:\s*([\d.]+)\s*/\s*([\d.]+)')
+LEGACY_POSITION_PATTERN = re.compile(r'X:\s*([\d.-]+)\s+Y:\s*([\d.-]+)\s+Z:\s*([\d.-]+)')
+LEGACY_TEMPERATURE_CLASS_PATTERN = re.compile(r'(?:^|\s)(?:T\d?|B|C):\s*-?\d')
+LEGACY_POSITION_CLASS_PATTERN = re.compile(r'(?:^|\s)X:\s*-?\d')
+
+SAMPLE_RESPONSES = (
+    'ok',
+    'ok',
+    'ok',
+    'ok',
+    'ok T:210.00 /210.00 B:60.00 /60.00 @:64 B@:0',
+    ' T:209.87 /210.00 B:60.02 /60.00 @:71 B@:12',
+    'T:210.1 /210.0 T0:210.1 /210.0 T1:25.3 /0.0 B:60.0 /60.0 C:31.2 /0.0 @:64 B@:0 @0:64 @1:0',
+    'X:10.00 Y:20.00 Z:0.30 E:12.50 Count X:800 Y:1600 Z:120',
+    'echo:busy: processing',
+    'echo:Unknown command: "M999"',
+    'Resend: 1234',
+    'Error:Line Number is not Last Line Number+1, Last Line: 1233'
+)
+
+
+def legacy_parse(line):
+    """Прежний разбор GCodeHandler.parse_response: три независимых re.search на каждую строку"""
+    result = {}
+    match = LEGACY_TEMPERATURE_PATTERN.search(line)
+    if match:
+        result['extruder'] = (float(match.group(1)), float(match.group(2)))
+    match = LEGACY_BED_PATTERN.search(line)
+    if match:
+        result['bed'] = (float(match.group(1)), float(match.group(2)))
+    match = LEGACY_POSITION_PATTERN.search(line)
+    if match:
+        result['position'] = (float(match.group(1)), float(match.group(2)), float(match.group(3)))
+    return result
+
+
+def legacy_classify(line):
+    """Прежняя классификация строки в потоке чтения (response_router.classify_response)"""
+    lower = line.lower()
+    for kind, prefixes in (('ok', ('ok',)), ('error', ('error', '!!')), ('resend', ('resend', 'rs ')),
+                           ('busy', ('echo:busy', 'busy:'))):
+        if lower.startswith(prefixes):
+            return kind
+    if lower == 'wait':
+        return 'wait'
+    if LEGACY_TEMPERATURE_CLASS_PATTERN.search(line):
+        return 'temperature'
+    if LEGACY_POSITION_CLASS_PATTERN.search(line):
+        return 'position'
+    if lower.startswith('echo:'):
+        return 'echo'
+    return 'other'
+
+
+def benchmark(lines=SAMPLE_RESPONSES, repeat=20000, dialect=None):
+    """Стоимость обработки одной строки, мкс.
+
+    legacy и pipeline моделируют путь строки в потоке чтения: классификация для
+    каждой строки и разбор полей только для строк с данными (прежде — три
+    re.search, теперь — ResponseParser.parse); classify и parse измеряются отдельно.
+    """
+    parser = ResponseParser(dialect)
+    lines = [line for line in lines if line.strip()]
+    total = len(lines) * repeat
+    data_kinds = ('temperature', 'position', 'error')
+
+    def legacy(line):
+        kind = legacy_classify(line)
+        if kind in data_kinds or (kind == 'ok' and len(line) > 2):
+            legacy_parse(line)
+
+    def pipeline(line):
+        kind = parser.classify(line)
+        if kind in data_kinds or (kind == 'ok' and parser.payload_kind(line)):
+            parser.parse(line)
+
+    results = {}
+    for name, function in (('legacy', legacy), ('pipeline', pipeline),
+                           ('classify', parser.classify), ('parse', parser.parse)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for line in lines:
+                function(line)
+        results[name] = (time.perf_counter() - started) / total * 1e6
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    argument_parser = argparse.ArgumentParser(description="Замер стоимости разбора строк ответа")
+    argument_parser.add_argument('responses', nargs='?', help="файл со строками ответа (по умолчанию — встроенный набор)")
+    argument_parser.add_argument('--dialect', default='marlin', help="marlin, klipper или reprapfirmware")
+    argument_parser.add_argument('--repeat', type=int, default=20000)
+    args = argument_parser.parse_args()
+
+    sample = SAMPLE_RESPONSES
+    if args.responses:
+        with open(args.responses, 'r', errors='replace') as responses_file:
+            sample = responses_file.read().splitlines()
+        args.repeat = max(1, args.repeat * len(SAMPLE_RESPONSES) // max(1, len(sample)))
+
+    for name, microseconds in benchmark(sample, args.repeat, args.dialect).items():
+        print(f"{name}: {microseconds:.2f} us/line")
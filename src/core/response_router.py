@@ -0,0 +1,43 @@
+from core.response_parser import ResponseParser
+
+
+class ResponseRouter:
+    """Рассылка строк ответа типизированным подписчикам (вызывается из потока чтения)"""
+
+    KINDS = ('ok', 'error', 'resend', 'busy', 'wait', 'temperature', 'position', 'sd_status', 'echo', 'other')
+
+    def __init__(self, dialect=None):
+        self.listeners = {kind: [] for kind in self.KINDS}
+        self.parser = ResponseParser(dialect)
+
+    def set_dialect(self, dialect):
+        self.parser.set_dialect(dialect)
+
+    def classify(self, line):
+        return self.parser.classify(line)
+
+    def add_listener(self, kind, callback):
+        if callback not in self.listeners[kind]:
+            self.listeners[kind].append(callback)
+
+    def remove_listener(self, kind, callback):
+        if callback in self.listeners[kind]:
+            self.listeners[kind].remove(callback)
+
+    def dispatch(self, line, kind=None):
+        kind = kind or self.parser.classify(line)
+        self._notify(kind, line)
+
+        # Marlin отвечает на M105 одной строкой "ok T:..": температура доставляется и подписчикам на неё
+        if kind == 'ok' and len(line) > 2:
+            payload_kind = self.parser.payload_kind(line)
+            if payload_kind is not None:
+                self._notify(payload_kind, line)
+        return kind
+
+    def _notify(self, kind, line):
+        for callback in list(self.listeners[kind]):
+            try:
+                callback(line)
+            except Exception as e:
+                print(f"Response listener error: {e}")
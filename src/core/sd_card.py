@@ -0,0 +1,317 @@
+import os
+import queue
+import re
+import threading
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from core.binary_file_transfer import BinaryFileTransfer, BinaryTransferError
+from core.command_lanes import BULK
+
+
+BINARY_FILE_TRANSFER = 'BINARY_FILE_TRANSFER'
+LONG_FILENAME_LISTING = 'EXTENDED_M20'
+
+MEDIA_EVENTS = ('SD card ok', 'SD init fail', 'SD card released', 'Media Inserted', 'Media Removed',
+                'Card inserted', 'Card removed')
+
+
+class SDFile:
+    """Файл на SD-карте: короткое имя 8.3 (для M23/M30), размер и длинное имя, если прошивка его сообщает"""
+
+    __slots__ = ('name', 'size', 'long_name')
+
+    def __init__(self, name, size=0, long_name=None):
+        self.name = name
+        self.size = size
+        self.long_name = long_name
+
+    @property
+    def display_name(self):
+        return self.long_name or self.name
+
+    def __repr__(self):
+        return f"SDFile({self.name!r}, {self.size}, {self.long_name!r})"
+
+
+def parse_file_list(lines):
+    """Строки между 'Begin file list' и 'End file list' ответа M20 [L]: 'ИМЯ.GCO размер [длинное имя]'"""
+    files = []
+    inside = False
+    for line in lines:
+        line = line.strip()
+        if line == 'Begin file list':
+            inside = True
+        elif line == 'End file list':
+            inside = False
+        elif inside and line:
+            parts = line.split(' ', 2)
+            size = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+            long_name = parts[2].strip() if len(parts) > 2 and parts[2].strip() else None
+            files.append(SDFile(parts[0], size, long_name))
+    return files
+
+
+def short_file_name(path):
+    """Имя 8.3 для записи на карту: прошивка создаёт файлы только с короткими именами"""
+    base = os.path.splitext(os.path.basename(path))[0]
+    base = re.sub(r'[^A-Z0-9_]', '', base.upper())[:8] or 'UPLOAD'
+    return f"{base}.GCO"
+
+
+class RawChannel:
+    """Канал поверх сеанса PrinterLink без кадрирования: write(байты) и read_line(timeout) для протокола передачи"""
+
+    def __init__(self, link):
+        self.link = link
+        self.lines = queue.Queue()
+
+    def on_line(self, line):
+        self.lines.put(line)
+
+    def write(self, data):
+        self.link.write_raw(data)
+
+    def read_line(self, timeout):
+        try:
+            return self.lines.get(timeout=max(0.0, timeout))
+        except queue.Empty:
+            return None
+
+
+class SDCardManager(QObject):
+    """Работа с SD-картой принтера: список файлов (M20, кэшируется), удаление, выбор и печать, загрузка.
+
+    Загрузка идёт двоичным протоколом Marlin (M28 B1), если прошивка сообщает
+    Cap:BINARY_FILE_TRANSFER, иначе текстом через M28/M29 с обычным окном отправки.
+    Загрузка выполняется в отдельном потоке; ход сообщается сигналом upload_progress.
+    """
+
+    files_changed = pyqtSignal(list)  # [SDFile]
+    upload_progress = pyqtSignal(int, int, float)  # передано байт, размер файла, байт/с
+    upload_finished = pyqtSignal(bool, str)  # успех, имя на карте или текст ошибки
+
+    PROGRESS_INTERVAL = 0.2
+    LIST_TIMEOUT = 10.0
+
+    def __init__(self, serial_comm, status_reporter=None):
+        super().__init__()
+        self.serial_comm = serial_comm
+        self.status_reporter = status_reporter
+        self.files = None
+        self.upload_thread = None
+        self.upload_cancel = threading.Event()
+        self.last_upload = None
+        self.last_upload_stats = {}
+        self.upload_retries = 0
+
+        if self.serial_comm:
+            self.serial_comm.connection_changed.connect(lambda connected: self.invalidate())
+            # Сообщения о карте — в потоке ввода-вывода, без события Qt на каждую принятую строку
+            for kind in ('echo', 'other'):
+                self.serial_comm.add_response_listener(kind, self._on_line)
+
+    def get_config(self, path, default=None):
+        return self.serial_comm.get_config(path, default)
+
+    def _supports(self, capability):
+        info = self.status_reporter.firmware_info if self.status_reporter else None
+        return info is not None and info.supports(capability)
+
+    def _on_line(self, line):
+        """Строка echo/other от прошивки (вызывается из потока чтения)"""
+        if line.startswith(MEDIA_EVENTS) or line.startswith('echo:' + MEDIA_EVENTS[0]):
+            self.invalidate()
+
+    def invalidate(self):
+        """Сброс кэша списка файлов (смена карты, загрузка, удаление, переподключение)"""
+        self.files = None
+
+    # --- Список и управление файлами ------------------------------------------
+
+    def list_files(self, refresh=False):
+        """Список файлов карты; повторный вызов без refresh не обращается к принтеру"""
+        if self.files is not None and not refresh:
+            return self.files
+        command = "M20 L" if self._supports(LONG_FILENAME_LISTING) else "M20"
+        future = self.serial_comm.submit(command)
+        if future is None:
+            return []
+        try:
+            lines = future.result(self.LIST_TIMEOUT)
+        except Exception as e:
+            print(f"SD card listing failed: {e}")
+            return self.files or []
+        self.files = parse_file_list(lines)
+        self.files_changed.emit(self.files)
+        return self.files
+
+    def find_file(self, name):
+        for sd_file in self.list_files():
+            if sd_file.name.upper() == name.upper() or sd_file.long_name == name:
+                return sd_file
+        return None
+
+    def _request(self, command, success, timeout=5.0):
+        reply = self.serial_comm.send_command_with_response(command, timeout)
+        return reply is not None and success in reply
+
+    def delete_file(self, name):
+        deleted = self._request(f"M30 {name}", "File deleted")
+        self.invalidate()
+        return deleted
+
+    def select_file(self, name):
+        return self._request(f"M23 {name}", "File selected")
+
+    def print_file(self, name):
+        """Печать с карты: принтер больше не зависит от хоста, ход сообщает M27"""
+        if not self.select_file(name):
+            return False
+        self.serial_comm.send_command("M24")
+        return True
+
+    def pause_print(self):
+        self.serial_comm.send_command("M25")
+
+    def resume_print(self):
+        self.serial_comm.send_command("M24")
+
+    # --- Загрузка ---------------------------------------------------------------
+
+    @property
+    def is_uploading(self):
+        return self.upload_thread is not None and self.upload_thread.is_alive()
+
+    def upload_file(self, path, remote_name=None, binary=None, resume=True):
+        """Запуск загрузки в фоне; binary=None — выбор по возможностям прошивки.
+
+        С resume файл, уже лежащий на карте под тем же именем и с тем же размером,
+        повторно не передаётся: у протокола Marlin нет дозаписи, прерванная
+        загрузка начинается сначала (см. retry_upload).
+        """
+        if self.is_uploading or not self.serial_comm.is_connected:
+            return False
+        remote_name = remote_name or short_file_name(path)
+        if binary is None:
+            binary = self._supports(BINARY_FILE_TRANSFER) and self.get_config('serial.sd_binary_transfer', True)
+        self.last_upload = (path, remote_name, binary)
+        self.upload_cancel.clear()
+        self.upload_thread = threading.Thread(target=self._upload, args=(path, remote_name, binary, resume),
+                                              daemon=True)
+        self.upload_thread.start()
+        return True
+
+    def retry_upload(self):
+        """Повтор последней загрузки (например, после переподключения)"""
+        if self.last_upload is None:
+            return False
+        path, remote_name, binary = self.last_upload
+        return self.upload_file(path, remote_name, binary, resume=True)
+
+    def cancel_upload(self):
+        self.upload_cancel.set()
+
+    def _upload(self, path, remote_name, binary, resume):
+        size = os.path.getsize(path)
+        started = time.monotonic()
+        last_report = [0.0]
+
+        def progress(sent):
+            now = time.monotonic()
+            if now - last_report[0] >= self.PROGRESS_INTERVAL or sent >= size:
+                last_report[0] = now
+                elapsed = now - started
+                self.upload_progress.emit(sent, size, sent / elapsed if elapsed > 0 else 0.0)
+
+        if self.status_reporter:
+            self.status_reporter.set_paused(True)
+        try:
+            if resume:
+                existing = self.find_file(remote_name)
+                if existing is not None and existing.size == size:
+                    progress(size)
+                    self.upload_finished.emit(True, remote_name)
+                    return
+            if binary:
+                sent = self._upload_binary(path, remote_name, size, progress)
+            else:
+                sent = self._upload_text(path, remote_name, progress)
+            elapsed = time.monotonic() - started
+            self.last_upload_stats = {
+                'bytes': sent,
+                'duration': elapsed,
+                'bytes_per_second': sent / elapsed if elapsed > 0 else 0.0,
+                'binary': binary,
+                'retries': self.upload_retries
+            }
+            print(f"Uploaded {remote_name}: {sent} bytes in {elapsed:.1f} s ({sent / max(elapsed, 1e-6) / 1024:.1f} KiB/s)")
+            self.upload_finished.emit(True, remote_name)
+        except Exception as e:
+            print(f"SD upload failed: {e}")
+            self.upload_finished.emit(False, str(e))
+        finally:
+            self.invalidate()
+            if self.status_reporter:
+                self.status_reporter.set_paused(False)
+
+    def _upload_binary(self, path, remote_name, size, progress):
+        link = self.serial_comm.link
+        if link is None:
+            raise ConnectionError("Printer is not connected")
+        channel = RawChannel(link)
+        self.upload_retries = 0
+        timeout = self.get_config('serial.sd_ack_timeout', 1.0)
+        self.serial_comm.event_loop.run(link.begin_raw_session(channel.on_line)).result(self.serial_comm.CONNECT_TIMEOUT)
+        try:
+            channel.write(b"M28 B1\n")
+            deadline = time.monotonic() + 5.0
+            while True:
+                line = channel.read_line(deadline - time.monotonic())
+                if line is None:
+                    raise BinaryTransferError("Firmware did not switch to binary transfer mode")
+                if line.startswith('ok'):
+                    break
+
+            transfer = BinaryFileTransfer(channel, timeout)
+            transfer.connect()
+            try:
+                with open(path, 'rb') as stream:
+                    return transfer.upload(stream, remote_name, size, progress, self.upload_cancel.is_set)
+            finally:
+                self.upload_retries = transfer.retries
+                transfer.disconnect()
+        finally:
+            link.end_raw_session()
+
+    def _upload_text(self, path, remote_name, progress):
+        """M28 имя, строки файла без комментариев обычной очередью (с номерами и Resend, если они включены), M29"""
+        reply = self.serial_comm.send_command_with_response(f"M28 {remote_name}", 5.0)
+        if reply is None or 'Writing to file' not in reply:
+            raise IOError(f"Cannot open '{remote_name}' on SD card: {reply}")
+
+        sent = 0
+        with open(path, 'r', encoding='utf-8', errors='replace') as stream:
+            for raw_line in stream:
+                sent += len(raw_line)
+                line = raw_line.split(';', 1)[0].strip()
+                if not line:
+                    continue
+                while not self.serial_comm.wait_for_stream_room():
+                    if self.upload_cancel.is_set():
+                        break
+                if self.upload_cancel.is_set():
+                    self.serial_comm.send_command("M29")
+                    raise IOError("Upload cancelled")
+                if not self.serial_comm.is_connected:
+                    raise ConnectionError("Connection lost during upload")
+                self.serial_comm.send_command(line, lane=BULK)
+                progress(sent)
+
+        # 'ok' на M29 приходит после всех ранее отправленных строк
+        reply = self.serial_comm.send_command_with_response("M29", 30.0)
+        if reply is None:
+            raise IOError("No response to M29")
+        progress(sent)
+        return sent
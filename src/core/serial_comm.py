@@ -1,153 +1,370 @@
-import serial
-import serial.tools.list_ports
 import threading
 import time
-import queue
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer, QThread
+import serial
+import serial.tools.list_ports
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from core.command_lanes import INTERACTIVE
+from core.event_loop import EventLoopThread
+from core.flow_control import AdaptiveWindow, CharacterWindow, create_flow_control
+from core.line_batcher import LineBatcher
+from core.line_transport import LineNumberTransport
+from core.port_discovery import BAUDRATES, PortCache, discover_printer, list_candidates
+from core.printer_link import PrinterLink
+from core.response_router import ResponseRouter
+from core.session_capture import RecordingTransport
+from core.transport import create_transport
 
 class SerialComm(QObject):
-    data_received = pyqtSignal(str)
+    """Qt-адаптер над асинхронным PrinterLink: сигналы и синхронный API для окон и GCodeHandler"""
+
+    lines_received = pyqtSignal(list)  # строки, накопленные за кадр (ui.refresh_rate раз в секунду)
     connection_changed = pyqtSignal(bool)
-    
-    def __init__(self):
+    emergency_sent = pyqtSignal(str, float)  # команда, задержка от постановки в очередь до записи, с
+    reconnecting = pyqtSignal(int, float)  # номер попытки, пауза перед ней, с
+    reconnected = pyqtSignal()
+    reconnect_failed = pyqtSignal()
+
+    RECENT_RESPONSES = 256
+    CONNECT_TIMEOUT = 10.0
+
+    def __init__(self, config_manager=None):
         super().__init__()
-        self.serial_port = None
+        self.config_manager = config_manager
+        self.event_loop = EventLoopThread.shared()
+        self.link = None
+        self.transport = None
         self.is_connected = False
-        self.read_thread = None
-        self.stop_reading = False
-        self.response_queue = queue.Queue()
-        self.command_queue = queue.Queue()
-        self.write_thread = None
-        
+        self.recent_responses = deque(maxlen=self.RECENT_RESPONSES)
+        self.response_router = ResponseRouter(self._configured_dialect())
+        self.line_batcher = LineBatcher(self.get_config('ui.refresh_rate', 30))
+        self.line_batcher.lines_ready.connect(self.lines_received)
+
+        self.port = None
+        self.auto_port = False
+        self.port_cache = PortCache(self.config_manager.data_path('port_cache.json') if self.config_manager
+                                    else 'port_cache.json')
+        self.detected_firmware = None
         self.baudrate = 115200
         self.timeout = 1.0
         self.write_timeout = 1.0
-        
-        self.start_write_thread()
-    
+
+        self.flow_control = self._create_flow_control()
+        self.line_transport = None
+
+        self.reconnect_cancel = threading.Event()
+        self.reconnect_thread = None
+
+        if self.config_manager:
+            self.config_manager.config_changed.connect(self._on_config_changed)
+
+    def get_config(self, path, default=None):
+        if self.config_manager:
+            return self.config_manager.get(path, default)
+        return default
+
+    def _configured_dialect(self):
+        dialect = self.get_config('serial.firmware_dialect', 'auto')
+        return None if dialect == 'auto' else dialect
+
+    def set_response_dialect(self, dialect):
+        """Диалект разбора ответов: 'marlin', 'klipper', 'reprapfirmware' или объект ResponseDialect"""
+        self.response_router.set_dialect(dialect)
+
+    def _create_flow_control(self):
+        return create_flow_control(
+            self.get_config('serial.flow_control', 'commands'),
+            self.get_config('serial.max_in_flight', 4),
+            self.get_config('serial.rx_buffer_size', 128),
+            self.get_config('serial.min_in_flight', 1),
+            self.get_config('serial.adaptive_max_in_flight', 32)
+        )
+
+    def _apply_flow_control_config(self):
+        flow_control = self._create_flow_control()
+        flow_control.ack_listeners = self.flow_control.ack_listeners
+        self.flow_control = flow_control
+
+    def _apply_line_transport_config(self):
+        if self.get_config('serial.line_numbers', False):
+            self.line_transport = LineNumberTransport(self.get_config('serial.resend_history', 1024))
+        else:
+            self.line_transport = None
+
+    def _on_config_changed(self, path, value):
+        if path == 'ui.refresh_rate':
+            self.line_batcher.set_rate(value)
+            return
+        if path == 'serial.firmware_dialect':
+            if value != 'auto':
+                self.set_response_dialect(value)
+            return
+        if path in ('serial.ack_timeout', 'serial.blocking_timeout', 'serial.heartbeat_interval'):
+            if self.link:
+                setattr(self.link, path.split('.', 1)[1], value)
+            return
+        if path not in ('serial.flow_control', 'serial.max_in_flight', 'serial.rx_buffer_size',
+                        'serial.min_in_flight', 'serial.adaptive_max_in_flight'):
+            return
+
+        if not self.is_connected:
+            self._apply_flow_control_config()
+            return
+
+        if path == 'serial.rx_buffer_size' and isinstance(self.flow_control, CharacterWindow):
+            self.flow_control.set_rx_buffer_size(value)
+        elif path == 'serial.max_in_flight' and not isinstance(self.flow_control, AdaptiveWindow):
+            # Для адаптивного окна это лишь начальный размер при следующем подключении
+            self.flow_control.set_max_in_flight(value)
+        elif path in ('serial.min_in_flight', 'serial.adaptive_max_in_flight') and isinstance(self.flow_control, AdaptiveWindow):
+            self.flow_control.set_limits(self.get_config('serial.min_in_flight', 1),
+                                         self.get_config('serial.adaptive_max_in_flight', 32))
+        if self.link:
+            self.link.wake()
+
     def list_available_ports(self):
         ports = []
         for port in serial.tools.list_ports.comports():
             ports.append(port.device)
         return ports
-    
+
+    def describe_ports(self):
+        """Порты с описанием устройства и прошивкой, известной по кэшу опроса: [(порт, описание)]"""
+        ports = []
+        for candidate in list_candidates():
+            entry = self.port_cache.get(candidate.key)
+            description = candidate.description
+            if entry:
+                firmware = f"{entry['firmware'] or '?'}, {entry['baudrate']}"
+                description = f"{description} — {firmware}" if description else firmware
+            ports.append((candidate.device, description))
+        return ports
+
+    def discover_port(self, baudrate=None, use_cache=True):
+        """Поиск принтера по всем портам (ProbeResult или None); baudrate опрашивается первой"""
+        baudrates = [baudrate] if baudrate else []
+        baudrates += [rate for rate in BAUDRATES if rate not in baudrates]
+        timeout = self.get_config('serial.probe_timeout', 1.0)
+        boot_timeout = self.get_config('serial.probe_boot_timeout', 2.5)
+        cache = self.port_cache if use_cache else None
+        try:
+            return self.event_loop.run(
+                discover_printer(None, baudrates, timeout, cache, boot_timeout)
+            ).result(boot_timeout + timeout * len(baudrates) + self.CONNECT_TIMEOUT)
+        except Exception as e:
+            print(f"Port discovery error: {e}")
+            return None
+
+    def remember_firmware(self, firmware):
+        """Запись ответа M115 текущего подключения в кэш опроса: следующий AUTO обойдётся без опроса"""
+        if not firmware.name or not self.is_connected or '://' in str(self.port):
+            return
+        for candidate in list_candidates():
+            if candidate.device == self.port:
+                self.port_cache.remember(candidate, self.baudrate, firmware)
+                return
+
     def connect(self, port, baudrate=115200):
+        """Подключение по адресу: имя последовательного порта, tcp://host:port, pty:// или AUTO (поиск по портам)"""
+        self.reconnect_cancel.set()
+        self.auto_port = str(port).upper() == 'AUTO'
+        if not self.auto_port:
+            return self._open(port, baudrate)
+        return self._open_discovered(baudrate)
+
+    def _open_discovered(self, baudrate):
+        result = self.discover_port(baudrate)
+        opened = result is not None and self._open(result.port, result.baudrate)
+        if not opened and result is not None and result.cached:
+            # Порт из кэша не открылся: запись устарела, нужен опрос
+            self.port_cache.forget(result.candidate.key)
+            result = self.discover_port(baudrate, use_cache=False)
+            opened = result is not None and self._open(result.port, result.baudrate)
+        if not opened:
+            if result is None:
+                print("Printer not found on any serial port")
+                self.connection_changed.emit(False)
+            return False
+        self.detected_firmware = result.firmware
+        print(f"Found {result.firmware.name or 'printer'} on {result.port} at {result.baudrate}")
+        return True
+
+    def _open(self, port, baudrate):
         try:
             if self.is_connected:
                 self.disconnect()
-            
+
+            self.port = port
             self.baudrate = baudrate
-            self.serial_port = serial.Serial(
-                port=port,
-                baudrate=baudrate,
-                timeout=self.timeout,
-                write_timeout=self.write_timeout,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE
-            )
-            
+            self._apply_flow_control_config()
+            self._apply_line_transport_config()
+
+            transport = create_transport(port, baudrate, self.timeout, self.write_timeout)
+            capture_file = self.get_config('serial.capture_file', '')
+            if capture_file and transport.scheme != 'replay':
+                transport = RecordingTransport(transport, time.strftime(capture_file))
+            link = PrinterLink(transport, self.flow_control, self.line_transport, self.response_router)
+            link.line_listeners.append(self._on_line_received)
+            link.close_listeners.append(self._on_link_closed)
+            link.emergency_listeners.append(self.emergency_sent.emit)
+            link.ack_timeout = self.get_config('serial.ack_timeout', 10.0)
+            link.blocking_timeout = self.get_config('serial.blocking_timeout', 600.0)
+            link.heartbeat_interval = self.get_config('serial.heartbeat_interval', 10.0)
+            self.event_loop.run(link.open()).result(self.CONNECT_TIMEOUT)
+
+            self.transport = transport
+            self.link = link
             self.is_connected = True
-            self.stop_reading = False
-            self.start_read_thread()
-            
+
+            if self.line_transport:
+                self.send_command("M110 N0")
+
             self.connection_changed.emit(True)
             return True
-            
+
         except Exception as e:
             print(f"Connection error: {e}")
             self.is_connected = False
             self.connection_changed.emit(False)
             return False
-    
+
     def disconnect(self):
+        self.reconnect_cancel.set()
+        link, self.link = self.link, None
+        was_connected = self.is_connected
+        self.is_connected = False
+
+        if link is not None:
+            link.close_listeners.remove(self._on_link_closed)
+            if self.event_loop.in_loop_thread():
+                self.event_loop.loop.create_task(link.close())
+            else:
+                try:
+                    self.event_loop.run(link.close()).result(2.0)
+                except Exception as e:
+                    print(f"Disconnect error: {e}")
+
+        self.transport = None
+        self.flow_control.reset()
+        if was_connected or link is not None:
+            self.connection_changed.emit(False)
+
+    def _on_line_received(self, data):
+        self.recent_responses.append(data)
+        self.line_batcher.append(data)
+
+    def _on_link_closed(self, error):
+        # Соединение потеряно со стороны транспорта (кабель, закрытый сокет), а не по disconnect()
+        self.link = None
+        self.transport = None
         self.is_connected = False
-        self.stop_reading = True
-        
-        if self.read_thread and self.read_thread.is_alive():
-            self.read_thread.join(timeout=2.0)
-        
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
-        
-        self.serial_port = None
         self.connection_changed.emit(False)
-    
-    def start_read_thread(self):
-        self.read_thread = threading.Thread(target=self.read_loop, daemon=True)
-        self.read_thread.start()
-    
-    def start_write_thread(self):
-        self.write_thread = threading.Thread(target=self.write_loop, daemon=True)
-        self.write_thread.start()
-    
-    def read_loop(self):
-        while not self.stop_reading and self.is_connected:
-            try:
-                if self.serial_port and self.serial_port.in_waiting > 0:
-                    data = self.serial_port.readline().decode('utf-8', errors='ignore').strip()
-                    if data:
-                        self.response_queue.put(data)
-                        self.data_received.emit(data)
-                else:
-                    time.sleep(0.01)
-            except Exception as e:
-                print(f"Read error: {e}")
-                break
-    
-    def write_loop(self):
-        while True:
-            try:
-                command = self.command_queue.get(timeout=1.0)
-                if command is None:
-                    break
-                
-                if self.is_connected and self.serial_port:
-                    self.serial_port.write((command + '\n').encode('utf-8'))
-                    self.serial_port.flush()
-                    
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"Write error: {e}")
-    
-    def send_command(self, command):
-        if self.is_connected:
-            self.command_queue.put(command)
-            return True
+
+        # Конец воспроизведения записи — не обрыв связи
+        replay = str(self.port).lower().startswith('replay://')
+        if error is not None and self.port and not replay and self.get_config('serial.auto_reconnect', True):
+            self._start_reconnect()
+
+    def _start_reconnect(self):
+        if self.reconnect_thread is not None and self.reconnect_thread.is_alive():
+            return
+        self.reconnect_cancel.clear()
+        self.reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
+        self.reconnect_thread.start()
+
+    def _reconnect_loop(self):
+        """Повторное открытие порта с экспоненциально растущей паузой; прерывается connect()/disconnect()"""
+        port, baudrate = self.port, self.baudrate
+        delay = 1.0
+        max_delay = self.get_config('serial.reconnect_max_delay', 30.0)
+        for attempt in range(1, int(self.get_config('serial.reconnect_attempts', 10)) + 1):
+            self.reconnecting.emit(attempt, delay)
+            if self.reconnect_cancel.wait(delay):
+                return
+            print(f"Reconnecting to {'AUTO' if self.auto_port else port} (attempt {attempt})")
+            # После переподключения USB устройство могло получить другое имя: ищется по серийному номеру
+            if self._open_discovered(baudrate) if self.auto_port else self._open(port, baudrate):
+                self.reconnected.emit()
+                return
+            delay = min(delay * 2, max_delay)
+        self.reconnect_failed.emit()
+
+    def send_command(self, command, tag=None, lane=INTERACTIVE):
+        """Постановка команды в очередь: lane 'interactive' для ручных команд, 'bulk' для задания.
+
+        Аварийные команды (M112, M410, M108, M876) всегда идут вне очереди.
+        """
+        link = self.link
+        if self.is_connected and link:
+            return link.send(command, tag, lane=lane)
         return False
-    
-    def send_command_with_response(self, command, timeout=5.0):
-        if not self.send_command(command):
+
+    def submit(self, command, tag=None, lane=INTERACTIVE):
+        """Отправка команды с ожиданием ответа: future получает все строки ответа вплоть до 'ok'"""
+        link = self.link
+        if not self.is_connected or not link:
             return None
-        
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                response = self.response_queue.get(timeout=0.1)
-                if 'ok' in response.lower() or 'error' in response.lower():
-                    return response
-            except queue.Empty:
-                continue
-        
+        future = Future()
+        link.send(command, tag, future, lane)
+        return future
+
+    def wait_for_stream_room(self, timeout=0.1):
+        """Ожидание момента, когда очередь записи пуста и в окне прошивки есть место"""
+        link = self.link
+        if link is None:
+            return True
+        return self.flow_control.wait_until(
+            lambda: not self.is_connected or (not link.stream_queued and self.flow_control.has_room()),
+            timeout
+        )
+
+    def get_stream_stats(self):
+        if self.link:
+            return self.link.get_stats()
+        return self.flow_control.get_stats()
+
+    def get_window_history(self):
+        """История размера адаптивного окна: (время, размер, причина); пусто для фиксированного окна"""
+        if isinstance(self.flow_control, AdaptiveWindow):
+            return self.flow_control.get_history()
+        return []
+
+    def get_lane_stats(self):
+        """Задержки очередей immediate/interactive/bulk: последняя, средняя и наихудшая, в секундах"""
+        if self.link:
+            return self.link.lanes.get_stats()
         return None
-    
+
+    def send_command_with_response(self, command, timeout=5.0):
+        future = self.submit(command)
+        if future is None:
+            return None
+
+        try:
+            return '\n'.join(future.result(timeout=timeout))
+        except FutureTimeoutError:
+            return None
+        except Exception as e:
+            print(f"Command '{command}' failed: {e}")
+            return None
+
+    def add_response_listener(self, kind, callback):
+        """Подписка на строки заданного типа (ok, temperature, position, busy, wait, echo, error, ...)"""
+        self.response_router.add_listener(kind, callback)
+
+    def remove_response_listener(self, kind, callback):
+        self.response_router.remove_listener(kind, callback)
+
     def get_all_responses(self):
-        responses = []
-        while not self.response_queue.empty():
-            try:
-                responses.append(self.response_queue.get_nowait())
-            except queue.Empty:
-                break
+        responses = list(self.recent_responses)
+        self.recent_responses.clear()
         return responses
-    
+
     def clear_response_queue(self):
-        while not self.response_queue.empty():
-            try:
-                self.response_queue.get_nowait()
-            except queue.Empty:
-                break
-    
+        self.recent_responses.clear()
+
     def is_port_available(self, port):
         try:
             test_serial = serial.Serial(port, timeout=0.1)
@@ -155,19 +372,14 @@ class SerialComm(QObject):
             return True
         except:
             return False
-    
+
     def get_connection_info(self):
-        if self.is_connected and self.serial_port:
-            return {
-                'port': self.serial_port.port,
-                'baudrate': self.serial_port.baudrate,
-                'timeout': self.serial_port.timeout,
-                'is_open': self.serial_port.is_open
-            }
+        if self.is_connected and self.transport:
+            return self.transport.get_info()
         return None
-    
-    def __del__(self):
-        self.disconnect()
-        if self.write_thread:
-            self.command_queue.put(None)
 
+    def __del__(self):
+        try:
+            self.disconnect()
+        except Exception:
+            pass
@@ -0,0 +1,326 @@
+import asyncio
+import gzip
+import os
+import struct
+import time
+from urllib.parse import parse_qs
+
+from core.transport import Transport
+
+
+CAPTURE_MAGIC = b'PRNCAP1\n'
+
+RECORD_RX = 0
+RECORD_TX = 1
+RECORD_MARK = 2
+RECORD_SESSION = 3
+RECORD_NAMES = {RECORD_RX: 'rx', RECORD_TX: 'tx', RECORD_MARK: 'mark', RECORD_SESSION: 'session'}
+
+FLUSH_INTERVAL = 1.0
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(stream):
+    result = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            if shift:
+                raise EOFError("Truncated capture record")
+            return None
+        result |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            return result
+        shift += 7
+
+
+def _open_capture(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class CaptureWriter:
+    """Запись сеанса в двоичный файл только на дозапись.
+
+    Запись: varint(интервал от предыдущей, мкс) | тип | varint(длина) | байты.
+    Строка 'ok' занимает шесть байт; при имени файла *.gz поток дополнительно
+    сжимается, а каждый сеанс становится отдельным членом gzip. Данные
+    сбрасываются на диск раз в секунду и в память целиком не накапливаются.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.last_time = 0
+        self.last_flush = 0.0
+        self.records = 0
+        self.bytes_captured = 0
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = _open_capture(self.path, 'ab')
+        if is_new:
+            self.file.write(CAPTURE_MAGIC)
+        self.last_time = time.monotonic_ns()
+        self.last_flush = time.monotonic()
+        self._write_record(RECORD_SESSION, struct.pack('<d', time.time()), self.last_time)
+        return self
+
+    def record(self, kind, data):
+        if self.file is None:
+            return
+        self._write_record(kind, bytes(data), time.monotonic_ns())
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.last_flush = now
+            self.file.flush()
+
+    def mark(self, text):
+        """Текстовая отметка в потоке (подключение, пауза, комментарий пользователя)"""
+        self.record(RECORD_MARK, text.encode('utf-8'))
+
+    def _write_record(self, kind, data, now):
+        delta = max(0, (now - self.last_time) // 1000)
+        self.last_time = now
+        self.file.write(_encode_varint(delta) + bytes((kind,)) + _encode_varint(len(data)) + data)
+        self.records += 1
+        self.bytes_captured += len(data)
+
+    def close(self):
+        file, self.file = self.file, None
+        if file is not None:
+            file.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_capture(path):
+    """Потоковое чтение записи: (время от начала, с; тип; байты). Сеансы идут подряд без пауз между ними"""
+    with _open_capture(path, 'rb') as stream:
+        if stream.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"'{path}' is not a session capture")
+        elapsed = 0
+        while True:
+            delta = _read_varint(stream)
+            if delta is None:
+                return
+            kind = stream.read(1)
+            length = _read_varint(stream)
+            if not kind or length is None:
+                raise EOFError("Truncated capture record")
+            data = stream.read(length)
+            if len(data) != length:
+                raise EOFError("Truncated capture record")
+            # Интервал до первой записи сеанса — время между сеансами, оно не воспроизводится
+            if kind[0] != RECORD_SESSION:
+                elapsed += delta
+            yield elapsed / 1e6, kind[0], data
+
+
+def capture_summary(path):
+    summary = {'sessions': 0, 'duration': 0.0, 'rx_bytes': 0, 'tx_bytes': 0, 'rx_records': 0,
+               'tx_records': 0, 'marks': 0, 'file_size': os.path.getsize(path)}
+    for timestamp, kind, data in read_capture(path):
+        summary['duration'] = timestamp
+        if kind == RECORD_RX:
+            summary['rx_records'] += 1
+            summary['rx_bytes'] += len(data)
+        elif kind == RECORD_TX:
+            summary['tx_records'] += 1
+            summary['tx_bytes'] += len(data)
+        elif kind == RECORD_MARK:
+            summary['marks'] += 1
+        else:
+            summary['sessions'] += 1
+    return summary
+
+
+class RecordingTransport(Transport):
+    """Транспорт-обёртка, записывающий все принятые и отправленные байты в CaptureWriter"""
+
+    def __init__(self, transport, capture_path):
+        super().__init__()
+        self.transport = transport
+        self.capture = CaptureWriter(capture_path)
+        self.scheme = transport.scheme
+
+    @property
+    def address(self):
+        return self.transport.address
+
+    async def open(self):
+        await self.transport.open()
+        self.capture.open()
+        self.capture.mark(f"open {self.transport.address}")
+        self.is_open = True
+
+    async def read(self):
+        data = await self.transport.read()
+        self.capture.record(RECORD_RX, data)
+        return data
+
+    async def write(self, data):
+        self.capture.record(RECORD_TX, data)
+        await self.transport.write(data)
+
+    async def close(self):
+        self.is_open = False
+        try:
+            await self.transport.close()
+        finally:
+            if self.capture.file is not None:
+                self.capture.mark("close")
+            self.capture.close()
+
+    def get_info(self):
+        info = self.transport.get_info()
+        info.update({'capture': self.capture.path, 'capture_records': self.capture.records})
+        return info
+
+
+class ReplayTransport(Transport):
+    """Воспроизведение принятых байт из записи с исходными интервалами, ускорением или без пауз.
+
+    Адрес: replay://путь/к/файлу?speed=10 (speed=0 или max — без пауз). Отправляемые
+    байты отбрасываются; по окончании записи соединение закрывается как при обрыве.
+    """
+
+    scheme = 'replay'
+
+    def __init__(self, path, speed=1.0):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.records = None
+        self.started = None
+        self.bytes_replayed = 0
+        self.bytes_discarded = 0
+
+    @property
+    def address(self):
+        return f"replay://{self.path}"
+
+    async def open(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Capture '{self.path}' not found")
+        self.records = read_capture(self.path)
+        self.started = time.monotonic()
+        self.is_open = True
+
+    async def read(self):
+        while self.is_open:
+            try:
+                timestamp, kind, data = next(self.records)
+            except StopIteration:
+                raise ConnectionError(f"Capture replay finished: {self.path}")
+            if kind != RECORD_RX:
+                continue
+            if self.speed > 0:
+                delay = self.started + timestamp / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # Без пауз, но с возможностью для остальных задач цикла выполниться
+                await asyncio.sleep(0)
+            self.bytes_replayed += len(data)
+            return data
+        raise ConnectionError("Capture replay is closed")
+
+    async def write(self, data):
+        self.bytes_discarded += len(data)
+
+    async def close(self):
+        self.is_open = False
+        records, self.records = self.records, None
+        if records is not None:
+            records.close()
+
+    def get_info(self):
+        info = super().get_info()
+        info.update({'speed': self.speed, 'bytes_replayed': self.bytes_replayed})
+        return info
+
+
+def create_replay_transport(address):
+    """replay://path?speed=N из адреса подключения"""
+    path, _, query = address[len('replay://'):].partition('?')
+    speed = parse_qs(query).get('speed', ['1'])[0]
+    speed = 0.0 if speed.lower() in ('0', 'max', 'inf') else float(speed)
+    return ReplayTransport(path, speed)
+
+
+def replay_benchmark(path, speed=0.0, config_manager=None, timeout=3600.0):
+    """Прогон записи через SerialComm и GCodeHandler: строки в секунду на стороне приложения"""
+    from PyQt5.QtCore import QCoreApplication
+    from core.gcode_handler import GCodeHandler
+    from core.serial_comm import SerialComm
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    serial_comm = SerialComm(config_manager)
+    GCodeHandler(serial_comm)
+    counts = {'lines': 0, 'batches': 0}
+
+    def on_lines(lines):
+        counts['lines'] += len(lines)
+        counts['batches'] += 1
+
+    serial_comm.lines_received.connect(on_lines)
+    started = time.monotonic()
+    if not serial_comm.connect(f"replay://{path}?speed={speed or 'max'}"):
+        raise ConnectionError(f"Cannot replay '{path}'")
+    while serial_comm.is_connected and time.monotonic() - started < timeout:
+        app.processEvents()
+        time.sleep(0.005)
+    serial_comm.line_batcher.flush()
+    app.processEvents()
+    duration = time.monotonic() - started
+    return {
+        'duration': duration,
+        'lines': counts['lines'],
+        'batches': counts['batches'],
+        'lines_per_second': counts['lines'] / duration if duration > 0 else 0.0
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Просмотр и воспроизведение записей сеансов связи с принтером")
+    parser.add_argument('command', choices=('info', 'dump', 'replay'))
+    parser.add_argument('capture', help="файл записи (serial.capture_file)")
+    parser.add_argument('--speed', default='1', help="ускорение воспроизведения; 0 или max — без пауз")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        for key, value in capture_summary(args.capture).items():
+            print(f"{key}: {value}")
+    elif args.command == 'dump':
+        for timestamp, kind, data in read_capture(args.capture):
+            text = data.decode('utf-8', errors='replace')
+            if kind == RECORD_SESSION:
+                text = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(struct.unpack('<d', data)[0]))
+            print(f"{timestamp:12.6f} {RECORD_NAMES.get(kind, kind):7} {text!r}")
+    else:
+        speed = 0.0 if args.speed.lower() in ('0', 'max') else float(args.speed)
+        for key, value in replay_benchmark(args.capture, speed).items():
+            print(f"{key}: {value}")
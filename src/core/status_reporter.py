@@ -0,0 +1,147 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from core.firmware_capabilities import (
+    AUTOREPORT_POS, AUTOREPORT_SD_STATUS, AUTOREPORT_TEMP, FirmwareInfo, parse_firmware_info
+)
+
+
+class StatusReporter(QObject):
+    """Состояние принтера без опроса: автоотчёты прошивки (M155/M154/M27 S), опрос M105/M114 — только при их отсутствии.
+
+    Возможности определяются по строкам 'Cap:' ответа M115 при каждом подключении.
+    Во время печати позиция берётся из подтверждённых команд задания, поэтому M114
+    не отправляется; M105 отправляется, только если прошивка не умеет AUTOREPORT_TEMP.
+    """
+
+    firmware_detected = pyqtSignal(object)  # FirmwareInfo
+    sd_status_changed = pyqtSignal(int, int)  # байт прочитано, размер файла
+    _firmware_info_received = pyqtSignal(object, int)  # FirmwareInfo, сессия подключения
+
+    CAPABILITY_TIMEOUT = 5.0
+    AUTOREPORT_COMMANDS = (
+        (AUTOREPORT_TEMP, 'M155'),
+        (AUTOREPORT_POS, 'M154'),
+        (AUTOREPORT_SD_STATUS, 'M27')
+    )
+
+    def __init__(self, serial_comm, is_printing=None, config_manager=None):
+        super().__init__()
+        self.serial_comm = serial_comm
+        self.is_printing = is_printing or (lambda: False)
+        self.config_manager = config_manager or getattr(serial_comm, 'config_manager', None)
+
+        self.firmware_info = None
+        self.autoreport = set()
+        self.pending_polls = []
+        self.session = 0
+        self.paused = False
+
+        self.poll_timer = QTimer()
+        self.poll_timer.timeout.connect(self.poll)
+        # Ответ M115 приходит в потоке ввода-вывода, запасной таймер — в потоке GUI: оба применяются в потоке GUI
+        self._firmware_info_received.connect(self._set_firmware_info)
+
+        if self.serial_comm:
+            self.serial_comm.connection_changed.connect(self._on_connection_changed)
+            self.serial_comm.add_response_listener('sd_status', self._on_sd_status)
+        if self.config_manager:
+            self.config_manager.config_changed.connect(self._on_config_changed)
+
+    def get_config(self, path, default=None):
+        if self.config_manager:
+            return self.config_manager.get(path, default)
+        return default
+
+    @property
+    def interval(self):
+        return max(1, int(self.get_config('serial.status_interval', 2)))
+
+    def _on_connection_changed(self, connected):
+        self.session += 1
+        self.firmware_info = None
+        self.autoreport = set()
+        self.pending_polls = []
+        if not connected:
+            self.poll_timer.stop()
+            return
+
+        session = self.session
+        self.poll_timer.start(self.interval * 1000)
+        future = self.serial_comm.submit("M115")
+        if future is not None:
+            future.add_done_callback(lambda done: self._on_firmware_info(done, session))
+        # Прошивка, не ответившая на M115, опрашивается по-старому
+        QTimer.singleShot(int(self.CAPABILITY_TIMEOUT * 1000), lambda: self._set_firmware_info(FirmwareInfo(), session))
+
+    def _on_firmware_info(self, future, session):
+        """Ответ M115 (вызывается из потока ввода-вывода)"""
+        try:
+            info = parse_firmware_info(future.result(0))
+        except Exception as e:
+            print(f"Firmware capability query failed: {e}")
+            info = FirmwareInfo()
+        self._firmware_info_received.emit(info, session)
+
+    def _set_firmware_info(self, info, session):
+        if session != self.session or self.firmware_info is not None:
+            return
+        self.firmware_info = info
+        self._enable_autoreport()
+        self.firmware_detected.emit(info)
+
+    def _enable_autoreport(self):
+        info = self.firmware_info
+        enabled = set()
+        if info is not None and self.get_config('serial.autoreport', True):
+            for capability, command in self.AUTOREPORT_COMMANDS:
+                if info.supports(capability):
+                    self.serial_comm.send_command(f"{command} S{self.interval}")
+                    enabled.add(capability)
+        for capability, command in self.AUTOREPORT_COMMANDS:
+            if capability in self.autoreport and capability not in enabled:
+                self.serial_comm.send_command(f"{command} S0")
+        self.autoreport = enabled
+
+    def _on_config_changed(self, path, value):
+        if path not in ('serial.autoreport', 'serial.status_interval'):
+            return
+        if self.serial_comm.is_connected and self.firmware_info is not None:
+            self._enable_autoreport()
+            self.poll_timer.start(self.interval * 1000)
+
+    def poll(self):
+        """Опрос того, о чём прошивка не сообщает сама; ответы на прошлый опрос не должны копиться в очереди"""
+        if not self.serial_comm.is_connected or self.firmware_info is None or self.paused:
+            return
+        self.pending_polls = [future for future in self.pending_polls if not future.done()]
+        if self.pending_polls:
+            return
+
+        commands = []
+        if AUTOREPORT_TEMP not in self.autoreport:
+            commands.append("M105")
+        if AUTOREPORT_POS not in self.autoreport and not self.is_printing():
+            commands.append("M114")
+        for command in commands:
+            future = self.serial_comm.submit(command)
+            if future is not None:
+                self.pending_polls.append(future)
+
+    def set_paused(self, paused):
+        """Приостановка опроса: во время записи на SD-карту (M28) каждая строка попадает в файл"""
+        self.paused = paused
+
+    def request_now(self):
+        """Разовый запрос температуры и позиции, независимо от автоотчётов"""
+        for command in ("M105", "M114"):
+            self.serial_comm.send_command(command)
+
+    def _on_sd_status(self, line):
+        # "SD printing byte 1234/56789"
+        if 'byte' not in line:
+            return
+        try:
+            done, total = line.rsplit(' ', 1)[1].split('/')
+            self.sd_status_changed.emit(int(done), int(total))
+        except ValueError:
+            pass
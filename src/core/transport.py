@@ -0,0 +1,276 @@
+import asyncio
+import os
+import socket
+
+import serial
+
+
+READ_CHUNK_SIZE = 4096
+
+
+class Transport:
+    """Асинхронный байтовый канал до принтера: open/read/write/close внутри цикла событий asyncio"""
+
+    scheme = None
+
+    def __init__(self):
+        self.is_open = False
+
+    @property
+    def address(self):
+        return ''
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def read(self):
+        """Ожидание и чтение очередной порции байт; ConnectionError при потере соединения"""
+        raise NotImplementedError
+
+    async def write(self, data):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    def get_info(self):
+        return {'transport': self.scheme, 'address': self.address, 'is_open': self.is_open}
+
+
+async def _wait_fd(add, remove, fd):
+    # Одноразовое ожидание готовности дескриптора через add_reader/add_writer цикла событий
+    future = asyncio.get_running_loop().create_future()
+    add(fd, lambda: future.done() or future.set_result(None))
+    try:
+        await future
+    finally:
+        remove(fd)
+
+
+class SerialTransport(Transport):
+    """Локальный последовательный порт через pyserial.
+
+    На POSIX дескриптор порта обслуживается самим циклом событий (add_reader/add_writer),
+    на остальных платформах блокирующие вызовы уходят в пул потоков цикла.
+    """
+
+    scheme = 'serial'
+
+    def __init__(self, port, baudrate=115200, timeout=1.0, write_timeout=1.0):
+        super().__init__()
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.serial_port = None
+        self.use_selector = os.name == 'posix'
+
+    @property
+    def address(self):
+        return self.port
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        non_blocking = self.use_selector
+        self.serial_port = await loop.run_in_executor(None, lambda: serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
+            timeout=0 if non_blocking else self.timeout,
+            write_timeout=0 if non_blocking else self.write_timeout,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE
+        ))
+        self.is_open = True
+
+    async def read(self):
+        port = self.serial_port
+        if port is None:
+            raise ConnectionError("Serial port is closed")
+        if not self.use_selector:
+            return await asyncio.get_running_loop().run_in_executor(None, self._blocking_read)
+
+        loop = asyncio.get_running_loop()
+        while True:
+            data = port.read(port.in_waiting or 1)
+            if data:
+                return data
+            await _wait_fd(loop.add_reader, loop.remove_reader, port.fileno())
+            if not self.is_open:
+                raise ConnectionError("Serial port is closed")
+
+    def _blocking_read(self):
+        port = self.serial_port
+        while self.is_open:
+            data = port.read(1)
+            if data:
+                waiting = port.in_waiting
+                return data + port.read(waiting) if waiting else data
+        raise ConnectionError("Serial port is closed")
+
+    async def write(self, data):
+        port = self.serial_port
+        if port is None:
+            raise ConnectionError("Serial port is closed")
+        if not self.use_selector:
+            await asyncio.get_running_loop().run_in_executor(None, self._blocking_write, data)
+            return
+
+        # Неблокирующая запись (write_timeout=0) возвращает число принятых драйвером байт
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while view:
+            written = port.write(view) or 0
+            view = view[written:]
+            if view:
+                await _wait_fd(loop.add_writer, loop.remove_writer, port.fileno())
+
+    def _blocking_write(self, data):
+        self.serial_port.write(data)
+        self.serial_port.flush()
+
+    async def close(self):
+        self.is_open = False
+        port, self.serial_port = self.serial_port, None
+        if port is not None and port.is_open:
+            port.close()
+
+    def get_info(self):
+        info = super().get_info()
+        info.update({'port': self.port, 'baudrate': self.baudrate, 'timeout': self.timeout})
+        return info
+
+
+class TcpTransport(Transport):
+    """Сырой TCP-поток: ser2net, WiFi-мосты ESP3D и подобные"""
+
+    scheme = 'tcp'
+
+    def __init__(self, host, port, connect_timeout=5.0):
+        super().__init__()
+        self.host = host
+        self.port = int(port)
+        self.connect_timeout = connect_timeout
+        self.reader = None
+        self.writer = None
+
+    @property
+    def address(self):
+        return f"tcp://{self.host}:{self.port}"
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None:
+            # Короткие строки G-кода не должны задерживаться алгоритмом Нейгла
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.is_open = True
+
+    async def read(self):
+        if self.reader is None:
+            raise ConnectionError("TCP connection is closed")
+        data = await self.reader.read(READ_CHUNK_SIZE)
+        if not data:
+            raise ConnectionError(f"Connection to {self.address} closed by peer")
+        return data
+
+    async def write(self, data):
+        if self.writer is None:
+            raise ConnectionError("TCP connection is closed")
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def close(self):
+        self.is_open = False
+        writer, self.writer = self.writer, None
+        self.reader = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+class PtyTransport(Transport):
+    """Пара псевдотерминалов для тестов: приложение работает с master, эмулятор прошивки открывает slave_name"""
+
+    scheme = 'pty'
+
+    def __init__(self):
+        super().__init__()
+        self.master_fd = None
+        self.slave_fd = None
+        self.slave_name = None
+
+    @property
+    def address(self):
+        return f"pty://{self.slave_name}" if self.slave_name else 'pty://'
+
+    async def open(self):
+        if os.name != 'posix':
+            raise OSError("Pseudo-terminals are only available on POSIX systems")
+        import tty
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.slave_name = os.ttyname(self.slave_fd)
+        self.is_open = True
+
+    async def read(self):
+        loop = asyncio.get_running_loop()
+        while self.is_open:
+            try:
+                return os.read(self.master_fd, READ_CHUNK_SIZE)
+            except BlockingIOError:
+                await _wait_fd(loop.add_reader, loop.remove_reader, self.master_fd)
+            except OSError as e:
+                # EIO: на стороне slave не осталось открытых дескрипторов
+                raise ConnectionError(f"Pseudo-terminal closed: {e}")
+        raise ConnectionError("Pseudo-terminal is closed")
+
+    async def write(self, data):
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.master_fd, view):]
+            except BlockingIOError:
+                await _wait_fd(loop.add_writer, loop.remove_writer, self.master_fd)
+
+    async def close(self):
+        self.is_open = False
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+
+    def get_info(self):
+        info = super().get_info()
+        info['slave_name'] = self.slave_name
+        return info
+
+
+def create_transport(address, baudrate=115200, timeout=1.0, write_timeout=1.0):
+    """Выбор транспорта по адресу: tcp://host:port (или socket://), pty://, replay://файл, иначе имя последовательного порта"""
+    address = address.strip()
+    lowered = address.lower()
+    for prefix in ('tcp://', 'socket://'):
+        if lowered.startswith(prefix):
+            host, _, port = address[len(prefix):].rstrip('/').rpartition(':')
+            if not host or not port.isdigit():
+                raise ValueError(f"Invalid TCP address '{address}', expected tcp://host:port")
+            return TcpTransport(host.strip('[]'), int(port))
+    if lowered.startswith('pty://'):
+        return PtyTransport()
+    if lowered.startswith('replay://'):
+        from core.session_capture import create_replay_transport
+        return create_replay_transport(address)
+    if lowered.startswith('serial://'):
+        address = address[len('serial://'):]
+    return SerialTransport(address, baudrate, timeout, write_timeout)
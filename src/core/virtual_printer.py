@@ -0,0 +1,891 @@
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+
+from core.binary_file_transfer import (
+    CONTROL_CLOSE, CONTROL_SYNC, FILE_ABORT, FILE_CLOSE, FILE_OPEN, FILE_QUERY, FILE_WRITE, PROTOCOL_CONTROL,
+    PROTOCOL_FILE_TRANSFER, PACKET_TOKEN, parse_packet
+)
+from core.event_loop import EventLoopThread
+from core.gcode_tokenizer import clean_line, parse_parameters, split_command
+from core.line_transport import gcode_checksum
+
+
+FIRMWARE_NAME = "Marlin 2.1.2.1 (Virtual)"
+CAPABILITIES = (
+    ('SERIAL_XON_XOFF', 0), ('BINARY_FILE_TRANSFER', 1), ('EEPROM', 0), ('AUTOREPORT_TEMP', 1),
+    ('AUTOREPORT_POS', 1), ('PROGRESS', 0), ('PRINT_JOB', 1), ('AUTOLEVEL', 0), ('Z_PROBE', 0),
+    ('LEVELING_DATA', 0), ('SOFTWARE_POWER', 0), ('TOGGLE_LIGHTS', 0), ('EMERGENCY_PARSER', 1),
+    ('HOST_ACTION_COMMANDS', 0), ('PROMPT_SUPPORT', 0), ('SDCARD', 1), ('AUTOREPORT_SD_STATUS', 0),
+    ('THERMAL_PROTECTION', 1), ('EXTENDED_M20', 1), ('CHAMBER_TEMPERATURE', 0)
+)
+SD_CAPABILITIES = ('SDCARD', 'BINARY_FILE_TRANSFER', 'EXTENDED_M20')
+BINARY_BLOCK_SIZE = 512
+BINARY_TOKEN = PACKET_TOKEN.to_bytes(2, 'little')
+EMERGENCY_COMMANDS = ('M112', 'M108', 'M410')
+
+
+class VirtualHeater:
+    """Нагреватель первого порядка: температура экспоненциально стремится к цели (или к комнатной)"""
+
+    def __init__(self, time_constant, ambient=25.0):
+        self.time_constant = time_constant
+        self.ambient = ambient
+        self.current = ambient
+        self.target = 0.0
+
+    def update(self, dt):
+        goal = self.target if self.target > 0 else self.ambient
+        self.current = goal + (self.current - goal) * math.exp(-dt / self.time_constant)
+
+    @property
+    def power(self):
+        return 127 if self.target > self.current else 0
+
+    def is_settled(self, tolerance=1.0):
+        return abs(self.current - self.target) <= tolerance
+
+
+class VirtualPrinter:
+    """Эмулятор прошивки Marlin на псевдотерминале или локальном TCP-сокете.
+
+    Моделируются RX-буфер UART, очередь команд (BUFSIZE), буфер планировщика,
+    время движений по скорости и ускорению, ok/busy/Resend, нагрев, ответы на
+    M105, M114, M115, M155 и M154 и SD-карта в памяти (M20-M30, печать с карты,
+    двоичная передача файлов M28 B1). Эмулятор работает в собственном цикле событий, поэтому
+    его можно запускать из тестов рядом с SerialComm и измерять пропускную
+    способность (get_stats: строки в секунду, опустошения планировщика).
+    """
+
+    def __init__(self, planner_buffer_size=16, command_buffer_size=4, rx_buffer_size=128,
+                 acceleration=1000.0, max_feedrate=500.0, time_scale=1.0, corruption_rate=0.0,
+                 busy_interval=2.0, junction_deviation=0.05, seed=None, sd_card=True):
+        self.planner_buffer_size = planner_buffer_size
+        self.command_buffer_size = command_buffer_size
+        self.rx_buffer_size = rx_buffer_size
+        self.acceleration = acceleration
+        self.max_feedrate = max_feedrate
+        self.time_scale = time_scale
+        self.corruption_rate = corruption_rate
+        self.busy_interval = busy_interval
+        self.junction_deviation = junction_deviation
+        self.random = random.Random(seed)
+        self.sd_card = sd_card
+        # Содержимое карты переживает сброс прошивки: имя 8.3 -> (байты, длинное имя)
+        self.sd_files = {}
+
+        self.event_loop = EventLoopThread()
+        self.address = None
+        self.slave_name = None
+        self._master_fd = None
+        self._slave_fd = None
+        self._server = None
+        self._writer = None
+        self._out_buffer = bytearray()
+        self._tasks = []
+        self._reset_state()
+        self.reset_stats()
+
+    # --- Запуск и остановка -------------------------------------------------
+
+    def start_pty(self):
+        """Запуск на псевдотерминале; возвращает путь, который нужно передать в SerialComm.connect"""
+        return self.event_loop.run(self._start_pty()).result(5.0)
+
+    def start_tcp(self, host='127.0.0.1', port=0):
+        """Запуск TCP-сервера; возвращает адрес вида tcp://host:port"""
+        return self.event_loop.run(self._start_tcp(host, port)).result(5.0)
+
+    def stop(self):
+        try:
+            self.event_loop.run(self._stop()).result(5.0)
+        finally:
+            self.event_loop.loop.call_soon_threadsafe(self.event_loop.loop.stop)
+
+    async def _start_pty(self):
+        import tty
+
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        os.set_blocking(self._master_fd, False)
+        self.slave_name = os.ttyname(self._slave_fd)
+        self.address = self.slave_name
+        asyncio.get_running_loop().add_reader(self._master_fd, self._on_pty_readable)
+        self._start_tasks()
+        self._send('start')
+        return self.address
+
+    async def _start_tcp(self, host, port):
+        self._server = await asyncio.start_server(self._on_client, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.address = f"tcp://{host}:{port}"
+        self._start_tasks()
+        return self.address
+
+    async def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._master_fd is not None:
+            loop = asyncio.get_running_loop()
+            loop.remove_reader(self._master_fd)
+            loop.remove_writer(self._master_fd)
+            for fd in (self._master_fd, self._slave_fd):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._master_fd = self._slave_fd = None
+
+    def _start_tasks(self):
+        loop = asyncio.get_running_loop()
+        self._queue_event = asyncio.Event()
+        self._planner_event = asyncio.Event()
+        self._planner_space = asyncio.Event()
+        self._tasks = [loop.create_task(self._run_commands()), loop.create_task(self._run_planner())]
+
+    async def _on_client(self, reader, writer):
+        # Новое подключение сбрасывает состояние; 'start' не отправляется, как у сетевых мостов без DTR
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = writer
+        self._reset_state()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                self._receive(data)
+        except ConnectionError:
+            pass
+        finally:
+            if self._writer is writer:
+                self._writer = None
+
+    def _on_pty_readable(self):
+        try:
+            data = os.read(self._master_fd, 4096)
+        except OSError:
+            return
+        if data:
+            self._receive(data)
+
+    # --- Состояние и статистика ---------------------------------------------
+
+    def _reset_state(self):
+        self.rx_buffer = bytearray()
+        self.command_queue = deque()
+        self.planner = deque()
+        self.planner_generation = 0
+        self.last_line_number = 0
+        self.halted = False
+        self.position = [0.0, 0.0, 0.0, 0.0]
+        self.absolute_mode = True
+        self.absolute_extrusion = True
+        self.feedrate = 1500.0
+        self.feedrate_percentage = 100
+        self.last_direction = None
+        self.last_speed = 0.0
+        self.autoreport_interval = 0
+        self.position_report_interval = 0
+        self.heaters = {'T': VirtualHeater(8.0), 'B': VirtualHeater(40.0)}
+        self.sim_time = time.monotonic() * self.time_scale
+        self.empty_since = None
+        self.last_emergency_time = None
+        self.sd_writing = None
+        self.sd_selected = None
+        self.sd_position = 0
+        self.sd_printing = False
+        self.binary_mode = False
+        self.binary_buffer = bytearray()
+        self.binary_sync = 0
+        self.binary_file = None
+        if hasattr(self, '_queue_event'):
+            self._queue_event.set()
+            self._planner_space.set()
+
+    def reset_stats(self):
+        """Сброс счётчиков перед очередным замером"""
+        self.lines_received = 0
+        self.commands_executed = 0
+        self.moves_executed = 0
+        self.resends = 0
+        self.rx_overruns = 0
+        self.planner_underruns = 0
+        self.starved_time = 0.0
+        self.busy_messages = 0
+        self.binary_packets = 0
+        self.binary_resends = 0
+        self.first_command_time = None
+        self.last_command_time = None
+        self.empty_since = None
+
+    def get_stats(self):
+        elapsed = 0.0
+        if self.first_command_time is not None and self.last_command_time is not None:
+            elapsed = self.last_command_time - self.first_command_time
+        return {
+            'lines_received': self.lines_received,
+            'commands_executed': self.commands_executed,
+            'moves_executed': self.moves_executed,
+            'lines_per_second': self.commands_executed / elapsed if elapsed > 0 else 0.0,
+            'planner_underruns': self.planner_underruns,
+            'starved_time': self.starved_time,
+            'planner_depth': len(self.planner),
+            'resends': self.resends,
+            'rx_overruns': self.rx_overruns,
+            'busy_messages': self.busy_messages,
+            'binary_packets': self.binary_packets,
+            'binary_resends': self.binary_resends,
+            'halted': self.halted
+        }
+
+    # --- Приём байт ---------------------------------------------------------
+
+    def _receive(self, data):
+        if self.binary_mode:
+            self._receive_binary(data)
+            return
+        self._scan_emergency(data)
+        # Порция из сокета приходит целиком, а в UART байты идут по одному, и прошивка успевает
+        # разбирать строки в очередь команд: принимаем частями по свободному месту в RX-буфере
+        while data:
+            free = self.rx_buffer_size - len(self.rx_buffer)
+            if free <= 0:
+                # Переполнение RX-буфера UART: очередь команд полна, лишние байты теряются, как в реальной прошивке
+                self.rx_overruns += len(data)
+                return
+            self.rx_buffer += data[:free]
+            data = data[free:]
+            self._drain_rx()
+
+    def _scan_emergency(self, data):
+        # Аварийный парсер Marlin видит M112/M108/M410 сразу при приёме, минуя очередь команд
+        for command in EMERGENCY_COMMANDS:
+            if command.encode() in data:
+                self.last_emergency_time = time.monotonic()
+                if command == 'M112':
+                    self._kill()
+                elif command == 'M410':
+                    self._quickstop()
+
+    def _drain_rx(self):
+        while len(self.command_queue) < self.command_buffer_size:
+            end = self.rx_buffer.find(b'\n')
+            if end < 0:
+                return
+            raw = bytes(self.rx_buffer[:end])
+            del self.rx_buffer[:end + 1]
+            self._accept_line(raw.decode('ascii', errors='replace').strip())
+
+    def _accept_line(self, line):
+        if not line or self.halted:
+            return
+        self.lines_received += 1
+
+        if '*' in line and self.corruption_rate and self.random.random() < self.corruption_rate:
+            position = self.random.randrange(len(line))
+            line = line[:position] + chr(ord(line[position]) ^ 0x04) + line[position + 1:]
+
+        if line.startswith('N'):
+            body, star, checksum = line.partition('*')
+            number_text, _, command = body[1:].partition(' ')
+            if not number_text.isdigit():
+                self._request_resend("Line Number is not Last Line Number+1")
+                return
+            number = int(number_text)
+            command = command.strip()
+            is_m110 = command.upper().startswith('M110')
+            # Порядок проверок как в Marlin: сначала номер строки, затем контрольная сумма
+            if number != self.last_line_number + 1 and not is_m110:
+                self._request_resend("Line Number is not Last Line Number+1")
+                return
+            if not star:
+                self._request_resend("No Checksum with line number")
+                return
+            if not checksum.strip().isdigit() or gcode_checksum(body) != int(checksum):
+                self._request_resend("checksum mismatch")
+                return
+            self.last_line_number = number
+            line = command
+        elif '*' in line:
+            self._request_resend("No Line Number with checksum")
+            return
+
+        line = line.split(';', 1)[0].strip()
+        if line:
+            self.command_queue.append(line)
+            self._queue_event.set()
+
+    def _request_resend(self, message):
+        # Marlin очищает RX-буфер при ошибке строки: всё, что пришло следом, будет отправлено повторно
+        self.rx_buffer.clear()
+        self.resends += 1
+        self._send(f"Error:{message}, Last Line: {self.last_line_number}")
+        self._send(f"Resend: {self.last_line_number + 1}")
+        self._send('ok')
+
+    # --- Вывод ----------------------------------------------------------------
+
+    def _send(self, text):
+        data = (text + '\n').encode('ascii')
+        if self._writer is not None:
+            self._writer.write(data)
+            return
+        if self._master_fd is None:
+            return
+        self._out_buffer += data
+        self._flush_pty()
+
+    def _flush_pty(self):
+        loop = asyncio.get_running_loop()
+        try:
+            written = os.write(self._master_fd, self._out_buffer)
+            del self._out_buffer[:written]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._out_buffer.clear()
+        if self._out_buffer:
+            loop.add_writer(self._master_fd, self._on_pty_writable)
+
+    def _on_pty_writable(self):
+        asyncio.get_running_loop().remove_writer(self._master_fd)
+        if self._out_buffer:
+            self._flush_pty()
+
+    # --- Выполнение команд ----------------------------------------------------
+
+    async def _run_commands(self):
+        while True:
+            if not self.command_queue or self.halted:
+                self._queue_event.clear()
+                await self._queue_event.wait()
+                continue
+
+            command = self.command_queue[0]
+            now = time.monotonic()
+            if self.first_command_time is None:
+                self.first_command_time = now
+            reply = await self._execute(command)
+            if self.halted:
+                continue
+            if self.command_queue and self.command_queue[0] is command:
+                self.command_queue.popleft()
+            self.commands_executed += 1
+            self.last_command_time = time.monotonic()
+            self._send(f"ok {reply}" if reply else 'ok')
+            self._drain_rx()
+
+    async def _execute(self, command):
+        code, argument = split_command(clean_line(command))
+        if self.sd_writing is not None and code != 'M29':
+            # Во время M28 команды не выполняются, а записываются в файл
+            self.sd_files[self.sd_writing][0].extend(command.encode('ascii', errors='replace') + b'\n')
+            return None
+        if self.sd_card and code in ('M20', 'M21', 'M22', 'M23', 'M24', 'M25', 'M26', 'M27', 'M28', 'M29', 'M30'):
+            self._execute_sd(code, argument.strip())
+            return None
+        params = parse_parameters(argument)
+
+        if code in ('G0', 'G1'):
+            await self._plan_move(params)
+        elif code == 'G28':
+            await self._synchronize()
+            axes = [axis for axis in 'XYZ' if axis in params] or list('XYZ')
+            distance = max(abs(self.position['XYZ'.index(axis)]) for axis in axes)
+            await self._dwell(distance / 50.0 if distance else 0.5)
+            for axis in axes:
+                self.position['XYZ'.index(axis)] = 0.0
+        elif code == 'G4':
+            await self._synchronize()
+            await self._dwell((params.get('P') or 0.0) / 1000.0 + (params.get('S') or 0.0))
+        elif code == 'G90':
+            self.absolute_mode = self.absolute_extrusion = True
+        elif code == 'G91':
+            self.absolute_mode = self.absolute_extrusion = False
+        elif code == 'M82':
+            self.absolute_extrusion = True
+        elif code == 'M83':
+            self.absolute_extrusion = False
+        elif code == 'G92':
+            for index, axis in enumerate('XYZE'):
+                if params.get(axis) is not None:
+                    self.position[index] = params[axis]
+        elif code in ('M104', 'M140', 'M109', 'M190'):
+            heater = self.heaters['B' if code in ('M140', 'M190') else 'T']
+            target = params.get('S') if params.get('S') is not None else params.get('R')
+            if target is not None:
+                heater.target = target
+            if code in ('M109', 'M190'):
+                await self._wait_for_heater(heater)
+        elif code == 'M105':
+            return self._temperature_report()
+        elif code == 'M114':
+            self._send(self._position_report())
+        elif code == 'M115':
+            self._send(f"FIRMWARE_NAME:{FIRMWARE_NAME} SOURCE_CODE_URL:github.com/MarlinFirmware/Marlin "
+                       f"PROTOCOL_VERSION:1.0 MACHINE_TYPE:Virtual Printer EXTRUDER_COUNT:1")
+            for name, value in CAPABILITIES:
+                if name in SD_CAPABILITIES and not self.sd_card:
+                    value = 0
+                self._send(f"Cap:{name}:{value}")
+        elif code == 'M155':
+            self.autoreport_interval = params.get('S') or 0
+            self._restart_autoreport()
+        elif code == 'M154':
+            self.position_report_interval = params.get('S') or 0
+            self._restart_autoreport()
+        elif code == 'M400':
+            await self._synchronize()
+        elif code == 'M204':
+            value = params.get('P') or params.get('S')
+            if value:
+                self.acceleration = value
+        elif code == 'M220':
+            if params.get('S'):
+                self.feedrate_percentage = params['S']
+        elif code in ('M110', 'M108', 'M112', 'M410', 'M106', 'M107', 'M84', 'M18', 'M117', 'M118',
+                      'M203', 'M205', 'M221', 'M500', 'M501', 'M503', 'G21', 'T0'):
+            pass
+        else:
+            self._send(f'echo:Unknown command: "{command}"')
+        return None
+
+    # --- SD-карта ---------------------------------------------------------------
+
+    def _execute_sd(self, code, argument):
+        name = argument.split(' ', 1)[0].upper() if argument else ''
+        if code == 'M20':
+            self._send("Begin file list")
+            for short_name, (data, long_name) in sorted(self.sd_files.items()):
+                suffix = f" {long_name}" if long_name and argument.upper().startswith('L') else ''
+                self._send(f"{short_name} {len(data)}{suffix}")
+            self._send("End file list")
+        elif code == 'M21':
+            self._send("echo:SD card ok")
+        elif code == 'M22':
+            self._send("echo:SD card released")
+        elif code == 'M23':
+            if name in self.sd_files:
+                self.sd_selected, self.sd_position, self.sd_printing = name, 0, False
+                self._send(f"echo:Now fresh file: {name}")
+                self._send(f"File opened: {name} Size: {len(self.sd_files[name][0])}")
+                self._send("File selected")
+            else:
+                self._send(f"echo:open failed, File: {name}.")
+        elif code == 'M24':
+            if self.sd_selected and not self.sd_printing:
+                self.sd_printing = True
+                self._tasks.append(asyncio.get_running_loop().create_task(self._run_sd_print()))
+        elif code == 'M25':
+            self.sd_printing = False
+        elif code == 'M26':
+            self.sd_position = int(argument[1:]) if argument[:1].upper() == 'S' and argument[1:].isdigit() else 0
+        elif code == 'M27':
+            if self.sd_printing:
+                self._send(f"SD printing byte {self.sd_position}/{len(self.sd_files[self.sd_selected][0])}")
+            else:
+                self._send("Not SD printing")
+        elif code == 'M28':
+            if argument.upper().startswith('B1'):
+                # Ответ 'ok' на M28 B1 уходит ещё в текстовом режиме, дальше — пакеты
+                self.binary_mode = True
+                self.binary_buffer.clear()
+                self._send("echo:Switching to Binary Protocol")
+            elif name:
+                self.sd_files[name] = (bytearray(), None)
+                self.sd_writing = name
+                self._send(f"Writing to file: {name}")
+        elif code == 'M29':
+            if self.sd_writing is not None:
+                self.sd_writing = None
+                self._send("Done saving file.")
+        elif code == 'M30':
+            if self.sd_files.pop(name, None) is not None:
+                self._send(f"File deleted:{name}")
+            else:
+                self._send(f"Deletion failed, File: {name}.")
+
+    async def _run_sd_print(self):
+        data = self.sd_files[self.sd_selected][0]
+        while self.sd_printing and self.sd_position < len(data) and not self.halted:
+            end = data.find(b'\n', self.sd_position)
+            end = len(data) if end < 0 else end
+            line = data[self.sd_position:end].decode('ascii', errors='replace').split(';', 1)[0].strip()
+            self.sd_position = end + 1
+            if line:
+                await self._execute(line)
+                self.commands_executed += 1
+        if self.sd_position >= len(data):
+            self.sd_printing = False
+            self._send("Done printing file")
+
+    def _receive_binary(self, data):
+        self.binary_buffer += data
+        while self.binary_mode and self.binary_buffer:
+            start = self.binary_buffer.find(BINARY_TOKEN)
+            if start < 0:
+                del self.binary_buffer[:-1]
+                return
+            del self.binary_buffer[:start]
+            try:
+                packet = parse_packet(self.binary_buffer)
+            except ValueError:
+                self._binary_resend()
+                continue
+            if packet is None:
+                return
+            sync, protocol, packet_type, payload, length = packet
+            del self.binary_buffer[:length]
+            if self.corruption_rate and self.random.random() < self.corruption_rate:
+                self._binary_resend()
+                continue
+            self._handle_binary_packet(sync, protocol, packet_type, payload)
+
+    def _binary_resend(self):
+        # Как в Marlin: поток сбрасывается, хост повторяет пакет с ожидаемым номером
+        self.binary_buffer.clear()
+        self.binary_resends += 1
+        self._send(f"rs{self.binary_sync}")
+
+    def _handle_binary_packet(self, sync, protocol, packet_type, payload):
+        if protocol == PROTOCOL_CONTROL and packet_type == CONTROL_SYNC:
+            self._send(f"ss{self.binary_sync},{BINARY_BLOCK_SIZE},0.1.0")
+            return
+        if protocol == PROTOCOL_CONTROL and packet_type == CONTROL_CLOSE:
+            self.binary_mode = False
+            rest, self.binary_buffer = bytes(self.binary_buffer), bytearray()
+            if rest:
+                self._receive(rest)
+            return
+        if sync != self.binary_sync:
+            if sync == (self.binary_sync - 1) & 0xFF:
+                # Подтверждение потерялось, пакет уже обработан
+                self._send(f"ok{sync}")
+            else:
+                self._binary_resend()
+            return
+
+        self.binary_packets += 1
+        self.binary_sync = (self.binary_sync + 1) & 0xFF
+        self._send(f"ok{sync}")
+        if protocol != PROTOCOL_FILE_TRANSFER:
+            return
+        if packet_type == FILE_QUERY:
+            self._send("PFT:version:0.1.0:compression:none")
+        elif packet_type == FILE_OPEN:
+            name = payload[2:].split(b'\0', 1)[0].decode('ascii', errors='replace').upper()
+            if name and self.sd_card:
+                self.binary_file = name
+                self.sd_files[name] = (bytearray(), None)
+                self._send("PFT:success")
+            else:
+                self._send("PFT:fail")
+        elif packet_type == FILE_WRITE:
+            if self.binary_file is not None:
+                self.sd_files[self.binary_file][0].extend(payload)
+            else:
+                self._send("PFT:ioerror")
+        elif packet_type == FILE_CLOSE:
+            self._send("PFT:success" if self.binary_file is not None else "PFT:ioerror")
+            self.binary_file = None
+        elif packet_type == FILE_ABORT:
+            if self.binary_file is not None:
+                self.sd_files.pop(self.binary_file, None)
+            self.binary_file = None
+            self._send("PFT:success")
+
+    # --- Планировщик ----------------------------------------------------------
+
+    async def _plan_move(self, params):
+        if params.get('F'):
+            self.feedrate = params['F']
+
+        target = list(self.position)
+        for index, axis in enumerate('XYZE'):
+            value = params.get(axis)
+            if value is None:
+                continue
+            absolute = self.absolute_extrusion if axis == 'E' else self.absolute_mode
+            target[index] = value if absolute else self.position[index] + value
+
+        delta = [target[i] - self.position[i] for i in range(4)]
+        self.position = target
+        distance = math.sqrt(delta[0] ** 2 + delta[1] ** 2 + delta[2] ** 2) or abs(delta[3])
+        if distance <= 0:
+            return
+
+        await self._wait_until(lambda: len(self.planner) < self.planner_buffer_size, self._planner_space)
+        if self.halted:
+            return
+        self._add_block(self._block_duration(delta, distance))
+
+    def _block_duration(self, delta, distance):
+        """Время блока: разгон от скорости стыка до крейсерской (упрощённый планировщик без предпросмотра)"""
+        speed = min(self.feedrate / 60.0 * self.feedrate_percentage / 100.0, self.max_feedrate)
+        direction = tuple(component / distance for component in delta[:3])
+
+        entry_speed = 0.0
+        if self.last_direction is not None:
+            cos_theta = sum(a * b for a, b in zip(direction, self.last_direction))
+            if cos_theta > 0.999:
+                entry_speed = min(speed, self.last_speed)
+            elif cos_theta > -0.999:
+                # Скорость стыка по отклонению (junction deviation), как в планировщике Marlin
+                sin_half = math.sqrt(max(0.0, 0.5 * (1.0 - cos_theta)))
+                radius = self.junction_deviation * sin_half / max(1e-6, 1.0 - sin_half)
+                entry_speed = min(speed, self.last_speed, math.sqrt(self.acceleration * radius))
+        self.last_direction = direction
+
+        acceleration = self.acceleration
+        accelerate_distance = (speed ** 2 - entry_speed ** 2) / (2.0 * acceleration)
+        if accelerate_distance <= distance:
+            self.last_speed = speed
+            return (speed - entry_speed) / acceleration + (distance - accelerate_distance) / speed
+        peak_speed = math.sqrt(entry_speed ** 2 + 2.0 * acceleration * distance)
+        self.last_speed = peak_speed
+        return (peak_speed - entry_speed) / acceleration
+
+    def _add_block(self, duration):
+        if self.empty_since is not None:
+            # Планировщик простаивал, пока поток команд ещё шёл: опустошение буфера
+            self.planner_underruns += 1
+            self.starved_time += max(0.0, time.monotonic() - self.empty_since)
+            self.empty_since = None
+        self.planner.append(duration)
+        self._planner_event.set()
+
+    async def _run_planner(self):
+        block_end = None
+        while True:
+            if not self.planner:
+                block_end = None
+                self._planner_event.clear()
+                await self._planner_event.wait()
+                continue
+
+            now = time.monotonic()
+            if block_end is None:
+                block_end = now + self.planner[0] / self.time_scale
+            if block_end > now:
+                generation = self.planner_generation
+                self._planner_event.clear()
+                try:
+                    await asyncio.wait_for(self._planner_event.wait(), block_end - now)
+                except asyncio.TimeoutError:
+                    pass
+                if generation != self.planner_generation:
+                    block_end = None
+                continue
+
+            # Блоки исполняются вплотную друг к другу: конец блока считается от конца предыдущего
+            self.planner.popleft()
+            self.moves_executed += 1
+            self._planner_space.set()
+            if self.planner:
+                block_end += self.planner[0] / self.time_scale
+            else:
+                self.empty_since = block_end
+                self.last_direction = None
+                self.last_speed = 0.0
+                block_end = None
+
+    async def _synchronize(self):
+        await self._wait_until(lambda: not self.planner, self._planner_space)
+        # Намеренное ожидание (M400, G4, G28, M109) не считается опустошением буфера
+        self.empty_since = None
+
+    async def _dwell(self, seconds):
+        deadline = time.monotonic() + seconds / self.time_scale
+        await self._wait_until(lambda: time.monotonic() >= deadline, None)
+        self.empty_since = None
+
+    async def _wait_for_heater(self, heater):
+        if heater.target <= 0:
+            return
+
+        def settled():
+            self._update_heaters()
+            return heater.is_settled()
+
+        await self._wait_until(settled, None, report=self._temperature_report, report_interval=1.0)
+        self.empty_since = None
+
+    async def _wait_until(self, predicate, event, report=None, report_interval=None):
+        """Ожидание условия с сообщениями busy (host keepalive) или отчётами о температуре"""
+        interval = report_interval or self.busy_interval
+        last_report = time.monotonic()
+        while not predicate() and not self.halted:
+            if event is not None:
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), min(interval, 0.25))
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(0.01)
+            now = time.monotonic()
+            if now - last_report >= interval:
+                last_report = now
+                if report is not None:
+                    self._send(report())
+                else:
+                    self.busy_messages += 1
+                    self._send('echo:busy: processing')
+
+    def _quickstop(self):
+        self.planner.clear()
+        self.planner_generation += 1
+        self.last_direction = None
+        self.last_speed = 0.0
+        self.empty_since = None
+        self._planner_event.set()
+        self._planner_space.set()
+
+    def _kill(self):
+        self._quickstop()
+        self.halted = True
+        self.command_queue.clear()
+        self.rx_buffer.clear()
+        for heater in self.heaters.values():
+            heater.target = 0.0
+        self._send('Error:Printer halted. kill() called!')
+
+    # --- Отчёты ---------------------------------------------------------------
+
+    def _update_heaters(self):
+        sim_time = time.monotonic() * self.time_scale
+        dt = sim_time - self.sim_time
+        self.sim_time = sim_time
+        for heater in self.heaters.values():
+            heater.update(dt)
+
+    def _temperature_report(self):
+        self._update_heaters()
+        hotend, bed = self.heaters['T'], self.heaters['B']
+        return (f"T:{hotend.current:.2f} /{hotend.target:.2f} B:{bed.current:.2f} /{bed.target:.2f} "
+                f"@:{hotend.power} B@:{bed.power}")
+
+    def _position_report(self):
+        x, y, z, e = self.position
+        return (f"X:{x:.2f} Y:{y:.2f} Z:{z:.2f} E:{e:.2f} "
+                f"Count X:{round(x * 80)} Y:{round(y * 80)} Z:{round(z * 400)}")
+
+    def _restart_autoreport(self):
+        for task in self._tasks[2:]:
+            task.cancel()
+        del self._tasks[2:]
+        loop = asyncio.get_running_loop()
+        if self.autoreport_interval > 0:
+            self._tasks.append(loop.create_task(
+                self._autoreport(self.autoreport_interval, lambda: ' ' + self._temperature_report())))
+        if self.position_report_interval > 0:
+            self._tasks.append(loop.create_task(
+                self._autoreport(self.position_report_interval, self._position_report)))
+
+    async def _autoreport(self, interval, report):
+        while True:
+            await asyncio.sleep(interval)
+            if not self.halted:
+                self._send(report())
+
+
+def benchmark_stream(gcode_lines, printer=None, config_manager=None, timeout=600.0):
+    """Потоковая печать через SerialComm и GCodeHandler.print_loop на виртуальном принтере.
+
+    Возвращает длительность, строки в секунду и статистику эмулятора (опустошения
+    планировщика, Resend, переполнения RX-буфера) и окна отправки.
+    """
+    from PyQt5.QtCore import QCoreApplication
+    from core.gcode_handler import GCodeHandler
+    from core.gcode_job import GCodeJob
+    from core.serial_comm import SerialComm
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    own_printer = printer is None
+    if own_printer:
+        printer = VirtualPrinter()
+        printer.start_pty()
+
+    serial_comm = SerialComm(config_manager)
+    handler = GCodeHandler(serial_comm)
+    try:
+        if not serial_comm.connect(printer.address):
+            raise ConnectionError(f"Cannot connect to virtual printer at {printer.address}")
+
+        commands = GCodeJob.from_lines(gcode_lines)
+
+        printer.reset_stats()
+        started = time.monotonic()
+        handler.start_print(commands)
+        while handler.print_thread.is_alive() and time.monotonic() - started < timeout:
+            app.processEvents()
+            time.sleep(0.01)
+        duration = time.monotonic() - started
+        completed = handler.acknowledged_line >= len(commands)
+        handler.stop_print()
+
+        return {
+            'lines': len(commands),
+            'completed': completed,
+            'duration': duration,
+            'lines_per_second': handler.acknowledged_line / duration if duration > 0 else 0.0,
+            'printer': printer.get_stats(),
+            'host': serial_comm.get_stream_stats(),
+            'window_history': serial_comm.get_window_history()
+        }
+    finally:
+        serial_comm.disconnect()
+        if own_printer:
+            printer.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Виртуальный принтер Marlin")
+    parser.add_argument('--tcp', type=int, metavar='PORT', help="слушать TCP-порт вместо псевдотерминала")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="ускорение модельного времени")
+    parser.add_argument('--planner', type=int, default=16, help="глубина буфера планировщика")
+    parser.add_argument('--bufsize', type=int, default=4, help="длина очереди команд (BUFSIZE)")
+    parser.add_argument('--corruption', type=float, default=0.0, help="доля искажаемых строк с контрольной суммой")
+    parser.add_argument('--benchmark', metavar='GCODE', help="прогнать файл через SerialComm и вывести статистику")
+    parser.add_argument('--flow-control', choices=('commands', 'characters', 'adaptive'),
+                        help="режим окна отправки для --benchmark (по умолчанию из настроек)")
+    args = parser.parse_args()
+
+    virtual_printer = VirtualPrinter(planner_buffer_size=args.planner, command_buffer_size=args.bufsize,
+                                     time_scale=args.time_scale, corruption_rate=args.corruption)
+    if args.tcp is not None:
+        virtual_printer.start_tcp(port=args.tcp)
+    else:
+        virtual_printer.start_pty()
+
+    if args.benchmark:
+        with open(args.benchmark, 'r') as gcode_file:
+            benchmark_config = None
+            if args.flow_control:
+                from core.config_manager import ConfigManager
+                benchmark_config = ConfigManager()
+                benchmark_config.set('serial.flow_control', args.flow_control)
+            result = benchmark_stream(gcode_file.readlines(), virtual_printer, benchmark_config)
+        for key, value in result.items():
+            print(f"{key}: {value}")
+        virtual_printer.stop()
+    else:
+        print(f"Virtual printer listening on {virtual_printer.address}")
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            virtual_printer.stop()
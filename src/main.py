@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 import os
 from PyQt5.QtWidgets import QApplication
@@ -34,5 +35,7 @@ def main():
     return app.exec_()
 
 if __name__ == '__main__':
+    # Процессы пула анализа G-code в сборке PyInstaller запускают этот же exe: без этого они открыли бы окно
+    multiprocessing.freeze_support()
     sys.exit(main())
 
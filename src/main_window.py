@@ -1,4 +1,5 @@
 import os
+import threading
 from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QDockWidget, QMessageBox, QFileDialog, QApplication, QSplitter, QAction
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QKeySequence
@@ -32,9 +33,10 @@ class MainWindow(QMainWindow):
         self._restore_settings()
         self._connect_signals()
         self._start_status_timer()
+        self._auto_connect()
 
     def _init_core_components(self):
-        self.serial_comm = SerialComm()
+        self.serial_comm = SerialComm(self.config_manager)
         self.gcode_handler = GCodeHandler(self.serial_comm)
 
     def _init_ui(self):
@@ -159,8 +161,23 @@ class MainWindow(QMainWindow):
             self.status_manager.update_connection_status
         )
 
+        self.serial_comm.emergency_sent.connect(self._on_emergency_sent)
+        self.serial_comm.reconnecting.connect(self._on_reconnecting)
+        self.serial_comm.reconnect_failed.connect(
+            lambda: self.status_manager.show_message(self.localization_manager.tr("status_reconnect_failed"))
+        )
+        self.gcode_handler.resume_available.connect(self._on_resume_available)
+
         self.config_manager.config_changed.connect(self._on_config_changed)
 
+    def _auto_connect(self):
+        """Подключение при запуске; с портом AUTO — поиск принтера, поэтому вне потока GUI"""
+        if not self.config_manager.get('serial.auto_connect', False):
+            return
+        port = self.config_manager.get('serial.port', 'AUTO')
+        baudrate = self.config_manager.get('serial.baudrate', 115200)
+        threading.Thread(target=self.serial_comm.connect, args=(port, baudrate), daemon=True).start()
+
     def _start_status_timer(self):
         self.status_timer = QTimer()
         self.status_timer.timeout.connect(self.status_manager.update_status)
@@ -206,6 +223,27 @@ class MainWindow(QMainWindow):
         self.status_manager.show_message(self.localization_manager.tr("status_emergency_stop"))
         QMessageBox.critical(self, self.localization_manager.tr("status_emergency_stop"), self.localization_manager.tr("message_emergency_stop_critical"))
 
+    def _on_emergency_sent(self, command, latency):
+        self.status_manager.show_message(
+            self.localization_manager.tr("status_emergency_sent").format(command=command, latency=latency * 1000.0)
+        )
+
+    def _on_reconnecting(self, attempt, delay):
+        self.status_manager.show_message(
+            self.localization_manager.tr("status_reconnecting").format(attempt=attempt, delay=delay)
+        )
+
+    def _on_resume_available(self, line):
+        reply = QMessageBox.question(
+            self,
+            self.localization_manager.tr("message_resume_print_title"),
+            self.localization_manager.tr("message_resume_print").format(line=line + 1),
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes
+        )
+        if reply == QMessageBox.Yes:
+            self.gcode_handler.resume_from_line(line)
+
     def open_calibration(self):
         dialog = CalibrationDialog(self.gcode_handler, self.config_manager, self)
         dialog.exec_()
@@ -47,7 +47,8 @@ class StatusManager:
             'printing': 'Печать...',
             'paused': 'Пауза',
             'finished': 'Печать завершена',
-            'stopped': 'Печать остановлена'
+            'stopped': 'Печать остановлена',
+            'interrupted': 'Прервано: потеряна связь'
         }
         message = status_messages.get(status, status)
         self.status_bar.showMessage(message)
@@ -1,17 +1,22 @@
+import threading
+
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QLabel, QComboBox, QGroupBox, QGridLayout)
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal
 
 
 class ConnectionWidget(QWidget):
     connection_changed = pyqtSignal(bool)
+    _connect_finished = pyqtSignal(bool)
 
     def __init__(self, gcode_handler, localization_manager):
         super().__init__()
         self.gcode_handler = gcode_handler
         self.localization_manager = localization_manager
+        self.connect_thread = None
         self.init_ui()
         self.connect_signals()
+        self.refresh_ports()
 
     def init_ui(self):
         layout = QVBoxLayout()
@@ -78,20 +83,47 @@ class ConnectionWidget(QWidget):
         self.emergency_stop_btn.clicked.connect(self.emergency_stop)
         self.reset_btn.clicked.connect(self.reset_printer)
         self.pause_btn.clicked.connect(self.pause_print)
+        self._connect_finished.connect(self._on_connect_finished)
+        if hasattr(self.gcode_handler, 'serial_comm') and self.gcode_handler.serial_comm:
+            self.gcode_handler.serial_comm.connection_changed.connect(self._update_connection_state)
 
     def refresh_ports(self):
         self.port_combo.clear()
+        self.port_combo.addItem("AUTO")
+        self.port_combo.setItemData(0, "Поиск принтера на всех портах по ответу M115", Qt.ToolTipRole)
         if hasattr(self.gcode_handler, 'serial_comm') and self.gcode_handler.serial_comm:
-            ports = self.gcode_handler.serial_comm.list_available_ports()
-            self.port_combo.addItems(ports)
+            for port, description in self.gcode_handler.serial_comm.describe_ports():
+                self.port_combo.addItem(port)
+                self.port_combo.setItemData(self.port_combo.count() - 1, description, Qt.ToolTipRole)
 
     def connect_printer(self):
         port = self.port_combo.currentText()
         baudrate = int(self.baudrate_combo.currentText())
-        if port and hasattr(self.gcode_handler, 'serial_comm'):
-            if self.gcode_handler.serial_comm.connect(port, baudrate):
-                self._update_connection_state(True)
-                self.connection_changed.emit(True)
+        if not port or not hasattr(self.gcode_handler, 'serial_comm'):
+            return
+        if port.upper() != 'AUTO':
+            self._on_connect_finished(self.gcode_handler.serial_comm.connect(port, baudrate))
+            return
+        if self.connect_thread is not None and self.connect_thread.is_alive():
+            return
+
+        # Опрос портов занимает секунды: вне потока GUI, результат приходит сигналом
+        self.connect_btn.setEnabled(False)
+        self.connection_status.setText("Поиск принтера...")
+        self.connection_status.setStyleSheet("QLabel { color: orange; font-weight: bold; }")
+        serial_comm = self.gcode_handler.serial_comm
+        self.connect_thread = threading.Thread(
+            target=lambda: self._connect_finished.emit(serial_comm.connect(port, baudrate)), daemon=True)
+        self.connect_thread.start()
+
+    def _on_connect_finished(self, connected):
+        if connected:
+            self._update_connection_state(True)
+            self.connection_changed.emit(True)
+            return
+        self._update_connection_state(False)
+        self.connection_status.setText("Принтер не найден" if self.port_combo.currentText().upper() == 'AUTO'
+                                       else "Ошибка подключения")
 
     def disconnect_printer(self):
         if hasattr(self.gcode_handler, 'serial_comm'):
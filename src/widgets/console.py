@@ -26,7 +26,7 @@ class AdvancedConsole(QWidget):
         self.setup_timer()
         
         if self.serial_comm:
-            self.serial_comm.data_received.connect(self.add_response)
+            self.serial_comm.lines_received.connect(self.add_responses)
     
     def init_ui(self):
         layout = QVBoxLayout()
@@ -267,30 +267,41 @@ class AdvancedConsole(QWidget):
             self.console_text.ensureCursorVisible()
     
     def add_response(self, response):
-        if self.should_filter_response(response):
-            return
-        
+        self.add_responses([response])
+    
+    def add_responses(self, responses):
         timestamp = datetime.now().strftime("%H:%M:%S") if self.timestamp_checkbox.isChecked() else ""
         
         cursor = self.console_text.textCursor()
         cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        
+        logged = []
+        for response in responses:
+            if self.should_filter_response(response):
+                continue
+            
+            format = QTextCharFormat()
+            if "error" in response.lower():
+                format.setForeground(QColor("#ff4444"))
+            elif "ok" in response.lower():
+                format.setForeground(QColor("#44ff44"))
+            elif re.search(r'T:\d+', response):
+                format.setForeground(QColor("#ffaa00"))
+            else:
+                format.setForeground(QColor("#ffffff"))
+            
+            cursor.setCharFormat(format)
+            
+            text = f"[{timestamp}] < {response}\n" if timestamp else f"< {response}\n"
+            cursor.insertText(text)
+            logged.append(text)
+        
+        cursor.endEditBlock()
+        if not logged:
+            return
         
-        format = QTextCharFormat()
-        if "error" in response.lower():
-            format.setForeground(QColor("#ff4444"))
-        elif "ok" in response.lower():
-            format.setForeground(QColor("#44ff44"))
-        elif re.search(r'T:\d+', response):
-            format.setForeground(QColor("#ffaa00"))
-        else:
-            format.setForeground(QColor("#ffffff"))
-        
-        cursor.setCharFormat(format)
-        
-        text = f"[{timestamp}] < {response}\n" if timestamp else f"< {response}\n"
-        cursor.insertText(text)
-        
-        self.log_to_file_if_enabled(text)
+        self.log_to_file_if_enabled(''.join(logged))
         self.limit_console_lines()
         
         if self.auto_scroll:
@@ -10,6 +10,14 @@ from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThread, QMutex, QRect, QSize,
 from PyQt5.QtGui import QFont, QTextCursor, QColor, QTextCharFormat, QSyntaxHighlighter, QPainter, \
     QTextFormat
 
+from core.gcode_job import GCodeJob
+from core.move_array import MoveArray
+from core.print_time import format_duration
+
+
+# Больше строк QPlainTextEdit с подсветкой показывает секундами; задание печатается целиком
+PREVIEW_LINES = 20000
+
 
 class LineNumberArea(QWidget):
     def init(self, editor):
@@ -78,10 +86,11 @@ class GCodeViewer(QWidget):
     def __init__(self, gcode_handler):
         super().__init__()
         self.gcode_handler = gcode_handler
-        self.gcode_commands = []
+        self.gcode_commands = GCodeJob()
         self.current_file = ""
         self.analysis_data = {}
-        self.layers_data = []
+        self.moves = MoveArray()
+        self.layer_paths = []
         self.highlighter = None
 
         self.init_ui()
@@ -104,12 +113,22 @@ class GCodeViewer(QWidget):
         self.reload_file_btn = QPushButton("Перезагрузить")
         self.reload_file_btn.setEnabled(False)
 
+        self.cancel_load_btn = QPushButton("Отменить загрузку")
+        self.cancel_load_btn.setVisible(False)
+
         self.file_label = QLabel("Файл не загружен")
         self.file_label.setStyleSheet("QLabel { color: #888888; font-style: italic; }")
 
+        self.load_progress = QProgressBar()
+        self.load_progress.setRange(0, 100)
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.setVisible(False)
+
         file_layout.addWidget(self.load_file_btn)
         file_layout.addWidget(self.reload_file_btn)
+        file_layout.addWidget(self.cancel_load_btn)
         file_layout.addWidget(self.file_label)
+        file_layout.addWidget(self.load_progress)
         file_layout.addStretch()
 
         layout.addWidget(file_group, 0)
@@ -479,7 +498,12 @@ class GCodeViewer(QWidget):
 
         progress_layout.addWidget(self.progress_label)
         progress_layout.addWidget(self.print_progress)
+        self.stream_stats_label = QLabel("Поток: --")
+        self.stream_stats_label.setAlignment(Qt.AlignCenter)
+        self.stream_stats_label.setStyleSheet("QLabel { color: #888888; }")
+
         progress_layout.addWidget(self.time_remaining_label)
+        progress_layout.addWidget(self.stream_stats_label)
 
         layout.addWidget(progress_group)
 
@@ -550,6 +574,7 @@ class GCodeViewer(QWidget):
     def connect_signals(self):
         self.load_file_btn.clicked.connect(self.load_file)
         self.reload_file_btn.clicked.connect(self.reload_file)
+        self.cancel_load_btn.clicked.connect(self.gcode_handler.cancel_loading)
 
         self.line_numbers_checkbox.toggled.connect(self.update_line_numbers_visibility)
         self.highlight_moves_checkbox.toggled.connect(self.update_preview)
@@ -568,8 +593,13 @@ class GCodeViewer(QWidget):
 
         if self.gcode_handler:
             self.gcode_handler.print_progress.connect(self.update_print_progress)
+            self.gcode_handler.print_time_changed.connect(self.update_print_time)
             self.gcode_handler.print_status_changed.connect(self.update_print_status)
+            self.gcode_handler.stream_stats_changed.connect(self.update_stream_stats)
             self.gcode_handler.gcode_loaded.connect(self.on_gcode_loaded)
+            self.gcode_handler.load_started.connect(self.on_job_loaded)
+            self.gcode_handler.load_progress.connect(self.on_load_progress)
+            self.gcode_handler.load_finished.connect(self.on_load_finished)
 
 
     def update_line_numbers_visibility(self, visible):
@@ -603,67 +633,83 @@ class GCodeViewer(QWidget):
 
 
     def load_gcode_file(self, filename):
-        try:
-            self.gcode_commands = self.gcode_handler.load_gcode_file(filename)
+        """Загрузка в фоне: печатать можно после индексации, слои появляются по мере анализа"""
+        self.current_file = filename
+        self.file_label.setText(f"Загрузка: {os.path.basename(filename)}")
+        self.print_time_label.setText("Неизвестно")
+        self.file_label.setStyleSheet("QLabel { color: #888888; font-style: italic; }")
+        self.load_progress.setValue(0)
+        self.load_progress.setVisible(True)
+        self.cancel_load_btn.setVisible(True)
+        self.gcode_handler.load_gcode_file_async(filename)
 
-            self.current_file = filename
-            self.file_label.setText(f"Загружен: {os.path.basename(filename)}")
-            self.file_label.setStyleSheet("QLabel { color: #4CAF50; font-weight: bold; }")
 
-            self.reload_file_btn.setEnabled(True)
-            self.update_controls()
-            self.file_loaded.emit(filename)
+    def on_job_loaded(self, job):
+        self.gcode_commands = job
+        self.reload_file_btn.setEnabled(True)
+        self.update_controls()
+        self.update_preview()
+
+
+    def on_load_progress(self, position, size, lines, total_lines):
+        self.load_progress.setValue(int(position * 100 / size) if size else 100)
+        self.file_label.setText(f"Анализ: {os.path.basename(self.current_file)} ({lines} / {total_lines} строк)")
+
 
-        except Exception as e:
-            self.file_label.setText(f"Ошибка загрузки: {str(e)}")
+    def on_load_finished(self, success, message):
+        self.load_progress.setVisible(False)
+        self.cancel_load_btn.setVisible(False)
+        name = os.path.basename(self.current_file)
+        if success:
+            self.file_label.setText(f"Загружен: {name}")
+            self.file_label.setStyleSheet("QLabel { color: #4CAF50; font-weight: bold; }")
+            estimate = self.gcode_handler.gcode_analyzer.print_time_estimate
+            self.print_time_label.setText(format_duration(estimate) if estimate else "Неизвестно")
+            self.file_loaded.emit(self.current_file)
+        elif message == "cancelled":
+            self.file_label.setText(f"Анализ прерван: {name}")
+            self.file_label.setStyleSheet("QLabel { color: #FF9800; font-weight: bold; }")
+        else:
+            self.file_label.setText(f"Ошибка загрузки: {message}")
             self.file_label.setStyleSheet("QLabel { color: #f44336; font-weight: bold; }")
 
 
-    def on_gcode_loaded(self, path_data, layers_data):
-        self.layers_data = layers_data
-        self.update_analysis_display(path_data, layers_data)
-        self.update_layers_list()
-        self.update_preview()
+    def on_gcode_loaded(self, moves):
+        # Промежуточные результаты одной загрузки дополняют друг друга: добавляются только новые слои
+        extend = moves.generation and moves.generation == self.moves.generation
+        first_layer = self.layers_list.count() if extend else 0
+        self.moves = moves
+        self.layer_paths = moves.path_counts().tolist()
+        self.update_analysis_display(moves)
+        self.update_layers_list(first_layer)
 
 
-    def update_analysis_display(self, path_data, layers_data):
-        if not layers_data:
+    def update_analysis_display(self, moves):
+        if not moves.layer_count:
             return
 
         total_lines = len(self.gcode_commands)
-        layer_count = len(layers_data)
-
-        print_moves = 0
-        travel_moves = 0
-        retractions = 0
-
-        for layer in layers_data:
-            for path in layer.get('paths', []):
-                if path['type'] == 'print':
-                    print_moves += len(path['points'])
-                elif path['type'] == 'travel':
-                    travel_moves += len(path['points'])
-                elif path['type'] == 'retraction':
-                    retractions += len(path['points'])
+        layer_count = moves.layer_count
+        counts = moves.feature_counts()
 
         self.total_lines_label.setText(str(total_lines))
         self.layer_count_label.setText(str(layer_count))
-        self.print_moves_label.setText(str(print_moves))
-        self.travel_moves_label.setText(str(travel_moves))
-        self.retractions_label.setText(str(retractions))
+        self.print_moves_label.setText(str(counts['print']))
+        self.travel_moves_label.setText(str(counts['travel']))
+        self.retractions_label.setText(str(counts['retraction']))
 
         if layer_count > 0:
             self.layer_slider.setRange(0, layer_count - 1)
-            self.current_layer_label.setText(f"Слой: 0 / {layer_count - 1}")
-
+            self.current_layer_label.setText(f"Слой: {self.layer_slider.value()} / {layer_count - 1}")
 
-    def update_layers_list(self):
-        self.layers_list.clear()
 
-        for i, layer_data in enumerate(self.layers_data):
-            z_height = layer_data.get('z', 0)
-            paths_count = len(layer_data.get('paths', []))
+    def update_layers_list(self, first_layer=0):
+        if not first_layer:
+            self.layers_list.clear()
 
+        layer_z = self.moves.layer_z.tolist()
+        for i in range(first_layer, self.moves.layer_count):
+            z_height, paths_count = layer_z[i], self.layer_paths[i]
             item_text = f"Слой {i}: Z={z_height:.2f} мм ({paths_count} путей)"
             item = QListWidgetItem(item_text)
             item.setData(Qt.ItemDataRole.UserRole, i)
@@ -675,10 +721,12 @@ class GCodeViewer(QWidget):
             return
 
         content = []
-        for cmd in self.gcode_commands:
-            line = cmd['original']
+        for line in self.gcode_commands.iter_text(0, min(PREVIEW_LINES, len(self.gcode_commands))):
             if not self.filter_comments_checkbox.isChecked() or not line.startswith(';'):
                 content.append(line)
+        hidden = len(self.gcode_commands) - PREVIEW_LINES
+        if hidden > 0:
+            content.append(f"; ... ещё {hidden} строк (в просмотре не показаны)")
 
         self.gcode_text.setPlainText('\n'.join(content))
         self.goto_line_input.setRange(1, len(content))
@@ -707,9 +755,8 @@ class GCodeViewer(QWidget):
         if layer_index is not None:
             self.set_layer(layer_index)
 
-            layer_data = self.layers_data[layer_index]
-            z_height = layer_data.get('z', 0)
-            paths_count = len(layer_data.get('paths', []))
+            z_height = float(self.moves.layer_z[layer_index])
+            paths_count = self.layer_paths[layer_index]
 
             self.layer_info_label.setText(
                 f"Слой {layer_index}: Z={z_height:.2f} мм, Путей: {paths_count}"
@@ -721,9 +768,9 @@ class GCodeViewer(QWidget):
 
 
     def set_layer(self, layer_index):
-        if 0 <= layer_index < len(self.layers_data):
+        if 0 <= layer_index < self.moves.layer_count:
             self.layer_slider.setValue(layer_index)
-            self.current_layer_label.setText(f"Слой: {layer_index} / {len(self.layers_data) - 1}")
+            self.current_layer_label.setText(f"Слой: {layer_index} / {self.moves.layer_count - 1}")
             self.layer_selected.emit(layer_index)
 
 
@@ -765,12 +812,24 @@ class GCodeViewer(QWidget):
         self.print_progress.setValue(progress)
 
 
+    def update_print_time(self, elapsed, remaining):
+        self.time_remaining_label.setText(f"Прошло: {format_duration(elapsed)}, осталось: {format_duration(remaining)}")
+
+
+    def update_stream_stats(self, commands_per_second, in_flight):
+        if commands_per_second <= 0 and in_flight == 0:
+            self.stream_stats_label.setText("Поток: --")
+        else:
+            self.stream_stats_label.setText(f"Поток: {commands_per_second:.0f} ком/с, в буфере: {in_flight}")
+
+
     def update_print_status(self, status):
         status_text = {
             'printing': 'Печать...',
             'paused': 'Пауза',
             'stopped': 'Остановлено',
-            'finished': 'Завершено'
+            'finished': 'Завершено',
+            'interrupted': 'Прервано: потеряна связь'
         }.get(status, status)
 
         self.progress_label.setText(status_text)
@@ -5,6 +5,7 @@ from widgets.connection_widget import ConnectionWidget
 from widgets.axis_control_widget import AxisControlWidget
 from widgets.speed_widget import SpeedWidget
 from widgets.extruder_widget import ExtruderWidget
+from widgets.sd_card_widget import SDCardWidget
 
 
 class PrinterControl(QWidget):
@@ -35,6 +36,9 @@ class PrinterControl(QWidget):
         self.extruder_widget = ExtruderWidget(self.gcode_handler, self.localization_manager)
         self.tab_widget.addTab(self.extruder_widget, self.localization_manager.tr("control_extruder"))
 
+        self.sd_card_widget = SDCardWidget(self.gcode_handler, self.localization_manager)
+        self.tab_widget.addTab(self.sd_card_widget, self.localization_manager.tr("control_sd_card"))
+
         layout.addWidget(self.tab_widget)
         self.setLayout(layout)
 
@@ -0,0 +1,153 @@
+import os
+import threading
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                             QListWidget, QListWidgetItem, QProgressBar, QGroupBox,
+                             QFileDialog, QMessageBox)
+from PyQt5.QtCore import Qt
+
+
+class SDCardWidget(QWidget):
+    """Вкладка SD-карты: список файлов, загрузка с ходом и скоростью, печать и удаление"""
+
+    def __init__(self, gcode_handler, localization_manager):
+        super().__init__()
+        self.gcode_handler = gcode_handler
+        self.sd_card = gcode_handler.sd_card
+        self.localization_manager = localization_manager
+        self.init_ui()
+        self.connect_signals()
+        self._update_buttons()
+
+    def tr(self, key):
+        return self.localization_manager.tr(key)
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        layout.addWidget(self._create_files_group())
+        layout.addWidget(self._create_upload_group())
+        layout.addStretch()
+        self.setLayout(layout)
+
+    def _create_files_group(self):
+        group = QGroupBox(self.tr("sd_files_group"))
+        layout = QVBoxLayout()
+
+        self.file_list = QListWidget()
+
+        buttons = QHBoxLayout()
+        self.refresh_btn = QPushButton(self.tr("sd_refresh"))
+        self.print_btn = QPushButton(self.tr("sd_print"))
+        self.delete_btn = QPushButton(self.tr("sd_delete"))
+        buttons.addWidget(self.refresh_btn)
+        buttons.addWidget(self.print_btn)
+        buttons.addWidget(self.delete_btn)
+
+        layout.addWidget(self.file_list)
+        layout.addLayout(buttons)
+        group.setLayout(layout)
+        return group
+
+    def _create_upload_group(self):
+        group = QGroupBox(self.tr("sd_upload_group"))
+        layout = QVBoxLayout()
+
+        buttons = QHBoxLayout()
+        self.upload_btn = QPushButton(self.tr("sd_upload"))
+        self.cancel_btn = QPushButton(self.tr("sd_cancel_upload"))
+        buttons.addWidget(self.upload_btn)
+        buttons.addWidget(self.cancel_btn)
+
+        self.upload_progress = QProgressBar()
+        self.upload_progress.setRange(0, 100)
+        self.upload_progress.setValue(0)
+        self.throughput_label = QLabel("")
+
+        layout.addLayout(buttons)
+        layout.addWidget(self.upload_progress)
+        layout.addWidget(self.throughput_label)
+        group.setLayout(layout)
+        return group
+
+    def connect_signals(self):
+        self.refresh_btn.clicked.connect(self.refresh_files)
+        self.print_btn.clicked.connect(self.print_selected)
+        self.delete_btn.clicked.connect(self.delete_selected)
+        self.upload_btn.clicked.connect(self.upload)
+        self.cancel_btn.clicked.connect(self.sd_card.cancel_upload)
+        self.file_list.currentItemChanged.connect(lambda current, previous: self._update_buttons())
+
+        self.sd_card.files_changed.connect(self._on_files_changed)
+        self.sd_card.upload_progress.connect(self._on_upload_progress)
+        self.sd_card.upload_finished.connect(self._on_upload_finished)
+        self.gcode_handler.serial_comm.connection_changed.connect(self._on_connection_changed)
+
+    def _run(self, target, *args):
+        # Команды карты ждут ответа прошивки — не в потоке интерфейса
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    def _selected_name(self):
+        item = self.file_list.currentItem()
+        return item.data(Qt.UserRole) if item is not None else None
+
+    def _update_buttons(self):
+        connected = self.gcode_handler.serial_comm.is_connected
+        uploading = self.sd_card.is_uploading
+        selected = self._selected_name() is not None
+        self.refresh_btn.setEnabled(connected and not uploading)
+        self.upload_btn.setEnabled(connected and not uploading)
+        self.cancel_btn.setEnabled(uploading)
+        self.print_btn.setEnabled(connected and selected and not uploading)
+        self.delete_btn.setEnabled(connected and selected and not uploading)
+
+    def _on_connection_changed(self, connected):
+        if not connected:
+            self.file_list.clear()
+        self._update_buttons()
+
+    def refresh_files(self):
+        self._run(self.sd_card.list_files, True)
+
+    def _on_files_changed(self, files):
+        self.file_list.clear()
+        for sd_file in files:
+            item = QListWidgetItem(f"{sd_file.display_name}  ({sd_file.size / 1024:.1f} KiB)")
+            item.setData(Qt.UserRole, sd_file.name)
+            self.file_list.addItem(item)
+        self._update_buttons()
+
+    def print_selected(self):
+        name = self._selected_name()
+        if name:
+            self._run(self.sd_card.print_file, name)
+
+    def delete_selected(self):
+        name = self._selected_name()
+        if not name:
+            return
+        answer = QMessageBox.question(self, self.tr("sd_delete"), self.tr("sd_delete_confirm").format(name=name))
+        if answer == QMessageBox.Yes:
+            self._run(lambda: self.sd_card.delete_file(name) and self.sd_card.list_files(True))
+
+    def upload(self):
+        filename, _ = QFileDialog.getOpenFileName(self, self.tr("sd_upload"), "",
+                                                  "G-code files (*.gcode *.gco *.g);;All files (*)")
+        if not filename:
+            return
+        if self.sd_card.upload_file(filename):
+            self.upload_progress.setValue(0)
+            self.throughput_label.setText(os.path.basename(filename))
+        self._update_buttons()
+
+    def _on_upload_progress(self, sent, size, rate):
+        self.upload_progress.setValue(int(sent * 100 / size) if size else 100)
+        self.throughput_label.setText(self.tr("sd_upload_progress").format(
+            sent=sent / 1024, size=size / 1024, rate=rate / 1024))
+
+    def _on_upload_finished(self, success, message):
+        if success:
+            self.upload_progress.setValue(100)
+            self.refresh_files()
+        else:
+            self.throughput_label.setText(self.tr("sd_upload_failed").format(error=message))
+        self._update_buttons()
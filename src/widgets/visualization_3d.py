@@ -10,6 +10,8 @@ from PyQt5.QtWidgets import QOpenGLWidget
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from core.move_array import MoveArray, FEATURE_PRINT, FEATURE_TRAVEL, FEATURE_RETRACTION
+
 
 class Advanced3DVisualization(QOpenGLWidget):
     position_clicked = pyqtSignal(float, float, float)
@@ -40,8 +42,8 @@ class Advanced3DVisualization(QOpenGLWidget):
         self.axes_enabled = self.config_manager.get("ui.show_axes", True)
         self.build_plate_enabled = self.config_manager.get("ui.show_build_plate", True)
 
-        self.gcode_path = []
-        self.gcode_layers = []
+        self.moves = MoveArray()
+        self.layer_segments = []
         self.current_layer = 0
         self.max_layer = 0
         self.show_layers = self.config_manager.get("ui.show_layers", True)
@@ -137,7 +139,7 @@ class Advanced3DVisualization(QOpenGLWidget):
             self.draw_grid()
 
         # G-code визуализация
-        if self.gcode_path and self.show_layers:
+        if len(self.moves) and self.show_layers:
             self.draw_gcode_path()
 
         # Печатная головка и след
@@ -287,51 +289,42 @@ class Advanced3DVisualization(QOpenGLWidget):
             glEnable(GL_LIGHTING)
 
     def draw_gcode_path(self):
-        """Улучшенная отрисовка G-code пути с различными типами движений"""
-        if not self.gcode_path:
+        """Отрисовка G-code пути: отрезки слоя одного типа движения одним вызовом glDrawArrays"""
+        if not len(self.moves):
             return
 
         glDisable(GL_LIGHTING)
+        glEnableClientState(GL_VERTEX_ARRAY)
 
         # Отрисовка путей по слоям
-        for layer_idx, layer_data in enumerate(self.gcode_layers):
+        for layer_idx, segments in enumerate(self.layer_segments):
             if layer_idx > self.current_layer and self.current_layer >= 0:
-                continue
+                break
 
             # Настройка прозрачности для разных слоев
             if layer_idx == self.current_layer:
                 alpha = 1.0
-            elif layer_idx < self.current_layer:
-                alpha = 0.3
             else:
-                alpha = 0.1
-
-            for path_segment in layer_data.get('paths', []):
-                path_type = path_segment.get('type', 'print')
-                points = path_segment.get('points', [])
-
-                if not points:
-                    continue
+                alpha = 0.3
 
+            for feature, vertices in segments:
                 # Выбор цвета и толщины линии в зависимости от типа движения
-                if path_type == 'print' and self.show_print_moves:
+                if feature == FEATURE_PRINT and self.show_print_moves:
                     glColor4f(0.0, 1.0, 0.2, alpha)  # Зеленый для печати
                     glLineWidth(3.0)
-                elif path_type == 'travel' and self.show_travel_moves:
+                elif feature == FEATURE_TRAVEL and self.show_travel_moves:
                     glColor4f(0.0, 0.5, 1.0, alpha * 0.5)  # Синий для перемещений
                     glLineWidth(1.0)
-                elif path_type == 'retraction' and self.show_retractions:
+                elif feature == FEATURE_RETRACTION and self.show_retractions:
                     glColor4f(1.0, 0.5, 0.0, alpha)  # Оранжевый для ретрактов
                     glLineWidth(2.0)
                 else:
                     continue
 
-                # Отрисовка сегмента пути
-                glBegin(GL_LINE_STRIP)
-                for point in points:
-                    glVertex3f(point[0], point[1], point[2])
-                glEnd()
+                glVertexPointer(3, GL_FLOAT, 0, vertices)
+                glDrawArrays(GL_LINES, 0, len(vertices))
 
+        glDisableClientState(GL_VERTEX_ARRAY)
         glLineWidth(1.0)
         if self.lighting_enabled:
             glEnable(GL_LIGHTING)
@@ -479,16 +472,24 @@ class Advanced3DVisualization(QOpenGLWidget):
         self.camera_target = [x / 2, y / 2, z / 2]
         self.update()
 
-    def load_gcode_path(self, path_data, layers_data=None):
-        """Загрузка G-code пути с поддержкой слоев"""
-        self.gcode_path = path_data
-        if layers_data:
-            self.gcode_layers = layers_data
-            self.max_layer = len(layers_data) - 1
-        else:
-            self.gcode_layers = []
-            self.max_layer = 0
-        self.current_layer = 0
+    def load_gcode_path(self, moves):
+        """Загрузка G-code пути с поддержкой слоев: вершины отрезков готовятся один раз на слой и тип движения"""
+        # Промежуточный массив той же загрузки продолжает предыдущий: готовятся только новые слои
+        extend = moves.generation and moves.generation == self.moves.generation
+        if not extend:
+            self.layer_segments = []
+            self.current_layer = 0
+        self.moves = moves
+        features = moves.moves['feature']
+        for layer in range(len(self.layer_segments), moves.layer_count):
+            start, stop = moves.layer_range(layer)
+            segments = moves.segments(start, stop)
+            layer_features = features[start:stop]
+            self.layer_segments.append([
+                (feature, np.ascontiguousarray(segments[layer_features == feature].reshape(-1, 3), np.float32))
+                for feature in np.unique(layer_features)
+            ])
+        self.max_layer = max(moves.layer_count - 1, 0)
         self.update()
 
     def set_current_layer(self, layer):
@@ -886,13 +887,13 @@ class Advanced3DVisualizationWidget(QWidget):
         """Обновление позиции печатной головки"""
         self.visualization.update_position(x, y, z)
 
-    def load_gcode_path(self, path_data, layers_data=None):
+    def load_gcode_path(self, moves):
         """Загрузка G-code пути"""
-        self.visualization.load_gcode_path(path_data, layers_data)
+        self.visualization.load_gcode_path(moves)
 
         # Обновление информации
-        if layers_data:
-            layer_count = len(layers_data)
+        if moves.layer_count:
+            layer_count = moves.layer_count
             self.layer_slider.setRange(0, layer_count - 1)
             self.info_label.setText(
                 self.localization_manager.tr("view_3d_load_gcode_info_label")+f"{layer_count}")
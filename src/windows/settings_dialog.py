@@ -133,6 +133,25 @@ class SettingsDialog(QDialog):
         self.serial_timeout.setSuffix(" сек")
         layout.addRow("Таймаут:", self.serial_timeout)
 
+        self.serial_max_in_flight = QSpinBox()
+        self.serial_max_in_flight.setRange(1, 64)
+        self.serial_max_in_flight.setToolTip("Количество неподтверждённых команд в буфере прошивки (BUFSIZE)")
+        layout.addRow("Команд в полёте:", self.serial_max_in_flight)
+
+        self.serial_flow_control = QComboBox()
+        self.serial_flow_control.addItem("По командам (ok)", "commands")
+        self.serial_flow_control.addItem("По символам (RX-буфер)", "characters")
+        self.serial_flow_control.addItem("Адаптивное окно (по задержке ok)", "adaptive")
+        layout.addRow("Управление потоком:", self.serial_flow_control)
+
+        self.serial_rx_buffer_size = QSpinBox()
+        self.serial_rx_buffer_size.setRange(16, 4096)
+        self.serial_rx_buffer_size.setSuffix(" байт")
+        layout.addRow("RX-буфер контроллера:", self.serial_rx_buffer_size)
+
+        self.serial_line_numbers = QCheckBox("Нумерация строк и контрольные суммы (Resend)")
+        layout.addRow(self.serial_line_numbers)
+
         self.auto_connect = QCheckBox("Автоподключение при запуске")
         layout.addRow(self.auto_connect)
 
@@ -281,6 +300,11 @@ class SettingsDialog(QDialog):
         self.serial_port.setCurrentText(config.get('serial.port'))
         self.serial_baudrate.setCurrentText(str(config.get('serial.baudrate')))
         self.serial_timeout.setValue(config.get('serial.timeout'))
+        self.serial_max_in_flight.setValue(config.get('serial.max_in_flight'))
+        self.serial_flow_control.setCurrentIndex(
+            max(0, self.serial_flow_control.findData(config.get('serial.flow_control'))))
+        self.serial_rx_buffer_size.setValue(config.get('serial.rx_buffer_size'))
+        self.serial_line_numbers.setChecked(config.get('serial.line_numbers'))
         self.auto_connect.setChecked(config.get('serial.auto_connect'))
 
         self.theme_combo.setCurrentText(config.get('ui.theme'))
@@ -324,6 +348,10 @@ class SettingsDialog(QDialog):
         config.set('serial.port', self.serial_port.currentText())
         config.set('serial.baudrate', int(self.serial_baudrate.currentText()))
         config.set('serial.timeout', self.serial_timeout.value())
+        config.set('serial.max_in_flight', self.serial_max_in_flight.value())
+        config.set('serial.flow_control', self.serial_flow_control.currentData())
+        config.set('serial.rx_buffer_size', self.serial_rx_buffer_size.value())
+        config.set('serial.line_numbers', self.serial_line_numbers.isChecked())
         config.set('serial.auto_connect', self.auto_connect.isChecked())
 
         config.set('ui.theme', self.theme_combo.currentText())